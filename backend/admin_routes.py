@@ -1,63 +1,139 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+import os
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, select, or_, and_
 from datetime import date, datetime
 from typing import List, Optional
 from pydantic import BaseModel
 
-from database import get_db
+import pool_metrics
+from database import get_db, engine, async_engine
 from models import User, Transaction, Conversion, PlanLimits, DownloadHistory
 from dependencies import get_current_user
+from user_cache import UserSnapshot
 from schemas import UserPlanUpdate
+from utils import set_user_plan, encode_cursor, decode_cursor
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
+USER_DETAILS_SORTS = {"id", "email", "credits_used"}
+# Rows fetched per round trip while streaming an unpaginated listing
+USER_DETAILS_FETCH_SIZE = 500
+
+
+def user_details_query(search: Optional[str] = None, plan: Optional[str] = None, sort: str = "id", order: str = "asc", cursor: Optional[str] = None):
+    """
+    One statement returning every listed user with their current plan and credit limit.
+    Rows not backfilled yet take the plan of their latest transaction (a correlated
+    subquery the database only evaluates when current_plan is NULL); limits come from
+    a join on plan_limits with the Basic row as fallback.
+    """
+    latest_plan = (
+        select(Transaction.plan_type)
+        .where(Transaction.user_id == User.id)
+        .order_by(Transaction.timestamp.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    users = select(
+        User.id.label("user_id"),
+        func.coalesce(User.email, "").label("email"),
+        func.coalesce(User.credits_used, 0).label("credits_used"),
+        func.coalesce(User.current_plan, latest_plan, "basic").label("current_plan"),
+    )
+    if search:
+        users = users.where(User.email.contains(search))
+    users = users.subquery("u")
+
+    exact = aliased(PlanLimits)
+    fallback = aliased(PlanLimits)
+    stmt = (
+        select(users, func.coalesce(exact.credit_limit, fallback.credit_limit, 0).label("credit_limit"))
+        .outerjoin(exact, func.lower(exact.plan_name) == func.lower(users.c.current_plan))
+        .outerjoin(fallback, fallback.plan_name == "Basic")
+    )
+    if plan:
+        stmt = stmt.where(func.lower(users.c.current_plan) == plan.lower())
+
+    # Keyset pagination on (sort column, user id)
+    sort_col = users.c[sort if sort != "id" else "user_id"]
+    descending = order == "desc"
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        if sort == "id":
+            stmt = stmt.where(users.c.user_id < last_id if descending else users.c.user_id > last_id)
+        elif descending:
+            stmt = stmt.where(or_(sort_col < last_value, and_(sort_col == last_value, users.c.user_id < last_id)))
+        else:
+            stmt = stmt.where(or_(sort_col > last_value, and_(sort_col == last_value, users.c.user_id > last_id)))
+
+    keys = [sort_col] if sort == "id" else [sort_col, users.c.user_id]
+    stmt = stmt.order_by(*[k.desc() if descending else k.asc() for k in keys])
+    return stmt
+
+
+def _user_detail(row) -> dict:
+    return {
+        "user_id": row.user_id,
+        "email": row.email,
+        "current_plan": row.current_plan,
+        # We consider them on the "default enrollment" if the plan is basic
+        "is_default_plan": row.current_plan.lower() == "basic",
+        "usage": {
+            "credits_used": row.credits_used,
+            "credit_limit": row.credit_limit
+        }
+    }
+
+
+def _json_array(rows):
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + json.dumps(_user_detail(row))
+    yield "]"
+
+
 @router.get("/user-details")
-def get_user_details(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_user_details(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
+    plan: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)
+):
+    """
+    Users with their plan and usage, as a JSON array streamed row by row.
+    With `limit`, returns one page and the cursor of the next one in X-Next-Cursor.
+    """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
-    
-    users = db.query(User).all()
-    details = []
-    
-    today = date.today()
-    
-    for user in users:
-        # 1. Get Current Plan from latest transaction
-        latest_tx = db.query(Transaction).filter(Transaction.user_id == user.id).order_by(Transaction.timestamp.desc()).first()
-        plan_type = latest_tx.plan_type if latest_tx else "basic"
-        
-        # 2. Check Plan Status (Initial Basic Plan?)
-        # We consider them on the "default enrollment" if the plan is basic.
-        # You could also check if they have exactly 1 transaction which is the signup one.
-        is_default_plan = (plan_type.lower() == 'basic')
-
-        # 3. Get Limits for the current plan
-        plan_limits = db.query(PlanLimits).filter(PlanLimits.plan_name == plan_type).first()
-        if not plan_limits:
-            # Fallback
-            plan_limits = db.query(PlanLimits).filter(PlanLimits.plan_name == "Basic").first()
-            
-        credit_limit = plan_limits.credit_limit if plan_limits else 0
-        
-        # 4. Usage Stats
-        # We now track usage via user.credits_used
-        
-        details.append({
-            "user_id": user.id,
-            "email": user.email,
-            "current_plan": plan_type,
-            "is_default_plan": is_default_plan,
-            "usage": {
-                "credits_used": user.credits_used,
-                "credit_limit": credit_limit
-            }
-        })
-        
-    return details
+    if sort not in USER_DETAILS_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(sorted(USER_DETAILS_SORTS))}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+
+    stmt = user_details_query(search, plan, sort, order, cursor)
+
+    headers = {}
+    if limit is None:
+        # Whole listing: rows are fetched in batches while the response is written
+        rows = db.execute(stmt.execution_options(yield_per=USER_DETAILS_FETCH_SIZE))
+    else:
+        rows = db.execute(stmt.limit(limit + 1)).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            sort_value = last.user_id if sort == "id" else getattr(last, sort)
+            headers["X-Next-Cursor"] = encode_cursor(sort_value, last.user_id)
+
+    return StreamingResponse(_json_array(rows), media_type="application/json", headers=headers)
 
 @router.put("/update-user-plan")
-def update_user_plan(plan_update: UserPlanUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_user_plan(plan_update: UserPlanUpdate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
     
@@ -78,13 +154,29 @@ def update_user_plan(plan_update: UserPlanUpdate, db: Session = Depends(get_db),
     # 3. Create New Transaction
     # We create a new transaction to represent the plan change. 
     # Amount is 0 for manual admin updates unless specified otherwise.
-    new_transaction = Transaction(
-        user_id=user.id,
-        plan_type=plan_update.plan_type,
-        amount=0, # Admin update
-        timestamp=datetime.utcnow()
-    )
-    db.add(new_transaction)
+    set_user_plan(db, user, plan_update.plan_type, amount=0) # Admin update
     db.commit()
     
     return {"message": f"User plan updated to {plan_update.plan_type}"}
+
+
+@router.get("/metrics/db-pool")
+async def get_db_pool_metrics(reset: bool = False, current_user: UserSnapshot = Depends(get_current_user)):
+    """
+    Connection pool health of this worker process: checkout latency percentiles, how
+    often requests waited for (or timed out on) a connection, overflow connections
+    opened, idle pings, and the live in-use/idle counts. `reset` starts a new window.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+
+    metrics = {
+        "pid": os.getpid(),
+        "config": pool_metrics.pool_config(),
+        "sync": pool_metrics.sync_pool.snapshot(engine.pool),
+        "async": pool_metrics.async_pool.snapshot(async_engine.sync_engine.pool),
+    }
+    if reset:
+        pool_metrics.sync_pool.reset()
+        pool_metrics.async_pool.reset()
+    return metrics
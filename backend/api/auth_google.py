@@ -1,13 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from database import get_db
-from models import User, Transaction
+from models import User
 from schemas import Token
 from auth import create_access_token, generate_user_id
-from datetime import datetime
+from utils import get_user_plan, set_user_plan
+from user_cache import UserSnapshot
 from pydantic import BaseModel
-from google.oauth2 import id_token
-from google.auth.transport import requests
 import logging
 import os
 import secrets
@@ -74,13 +73,7 @@ def google_auth(request: GoogleAuthRequest, db: Session = Depends(get_db)):
             # or assign a plan like "Plus" that has a 50,000 limit. 
             # We assign "Plus" directly as it explicitly provides a 50,000 limit according to seed_plans.py
             plan_type = "Plus"
-            new_transaction = Transaction(
-                user_id=new_id,
-                plan_type=plan_type,
-                amount=0,
-                timestamp=datetime.utcnow()
-            )
-            db.add(new_transaction)
+            set_user_plan(db, db_user, plan_type)
             
             # Ensure credits_used is 0 if we rely on the Plus plan limit of 50k
             db_user.credits_used = 0
@@ -91,13 +84,11 @@ def google_auth(request: GoogleAuthRequest, db: Session = Depends(get_db)):
             logger.info(f"Created new Google Auth user: {email} with starting plan: {plan_type}")
         else:
             # Existing user, determine their plan
-            latest_tx = db.query(Transaction).filter(Transaction.user_id == user.id).order_by(Transaction.timestamp.desc()).first()
-            if latest_tx:
-                plan_type = latest_tx.plan_type
+            plan_type = get_user_plan(db, user, default=plan_type)
             logger.info(f"Existing Google Auth user logged in: {email}")
             
         # Return JWT Token
-        access_token = create_access_token(data={"sub": str(user.id)})
+        access_token = create_access_token(data=UserSnapshot.from_user(user, plan_type).claims())
         return {
             "access_token": access_token, 
             "token_type": "bearer", 
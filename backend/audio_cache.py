@@ -0,0 +1,256 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import AudioCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Kept outside static/ so cached artifacts are never served without an ownership check
+CACHE_DIR = Path(os.getenv("AUDIO_CACHE_DIR", str(Path(__file__).parent / "audio_cache")))
+CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Per-chunk layer used to re-synthesize only the edited parts of long documents
+CHUNK_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CHUNK_CACHE_MAX_BYTES", str(1024 ** 3)))
+CHUNK_PRUNE_INTERVAL = 300
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def make_cache_key(engine: str, output_format: str, payloads, voice: Optional[str] = None) -> str:
+    """
+    Content address of a conversion: the exact provider inputs (final SSML for Azure,
+    text chunks plus voice for Polly) and the output format they are rendered to.
+    """
+    digest = hashlib.sha256()
+    for part in (engine, output_format, voice or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    for payload in payloads:
+        digest.update(payload.encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    """sha256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _artifact_path(file_name: str) -> Path:
+    return CACHE_DIR / file_name[:2] / file_name
+
+
+def _link_or_copy(source: Path, dest: Path):
+    """Hard links share one copy on disk; fall back to copying across filesystems."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists():
+        dest.unlink()
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+def lookup(db: Session, cache_key: str) -> Optional[AudioCacheEntry]:
+    entry = db.query(AudioCacheEntry).filter(AudioCacheEntry.cache_key == cache_key).first()
+    if entry is None:
+        return None
+    if not _artifact_path(entry.file_name).is_file():
+        # Artifact vanished from disk (manual cleanup, other host): forget the entry
+        logger.warning(f"Audio cache artifact missing for {cache_key}, dropping entry.")
+        db.delete(entry)
+        db.commit()
+        return None
+    return entry
+
+
+def materialize(entry: AudioCacheEntry, dest: Path):
+    """Places the cached audio at a conversion's own path without re-synthesizing it."""
+    _link_or_copy(_artifact_path(entry.file_name), dest)
+
+
+def add_reference(db: Session, entry: AudioCacheEntry):
+    """Records one more Conversion row pointing at this artifact. Caller commits."""
+    entry.ref_count = (entry.ref_count or 0) + 1
+    entry.last_used_at = datetime.utcnow()
+
+
+def release(db: Session, cache_key: str):
+    """
+    Drops a deleted Conversion's reference; an artifact nobody references any more is
+    evicted before referenced ones. Caller commits.
+    """
+    entry = db.query(AudioCacheEntry).filter(AudioCacheEntry.cache_key == cache_key).first()
+    if entry and entry.ref_count:
+        entry.ref_count -= 1
+
+
+def store(db: Session, cache_key: str, source: Path) -> Optional[AudioCacheEntry]:
+    """
+    Adds freshly synthesized audio to the cache. The entry starts with one reference
+    for the conversion that produced it. Returns None if the cache could not be written.
+    """
+    file_name = f"{cache_key}.mp3"
+    artifact = _artifact_path(file_name)
+    try:
+        if not artifact.exists():
+            _link_or_copy(source, artifact)
+        entry = AudioCacheEntry(
+            cache_key=cache_key,
+            file_name=file_name,
+            size_bytes=artifact.stat().st_size,
+            ref_count=1,
+        )
+        db.add(entry)
+        db.commit()
+    except IntegrityError:
+        # A concurrent conversion of the same input stored it first
+        db.rollback()
+        entry = lookup(db, cache_key)
+        if entry is not None:
+            add_reference(db, entry)
+            db.commit()
+        return entry
+    except OSError as e:
+        logger.warning(f"Could not store audio cache artifact {cache_key}: {e}")
+        return None
+
+    evict(db)
+    return entry
+
+
+def evict(db: Session, max_bytes: int = None):
+    """
+    Shrinks the cache to max_bytes. Unreferenced artifacts go first, then least recently used.
+    Conversions keep their own hard-linked copy, so eviction only loses future dedupe hits.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total = db.query(func.coalesce(func.sum(AudioCacheEntry.size_bytes), 0)).scalar() or 0
+    if total <= max_bytes:
+        return
+
+    candidates = db.query(AudioCacheEntry).order_by(
+        (AudioCacheEntry.ref_count > 0).asc(),
+        AudioCacheEntry.last_used_at.asc(),
+    ).limit(500).all()
+    evicted = 0
+    for entry in candidates:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(_artifact_path(entry.file_name))
+        except OSError:
+            pass
+        total -= entry.size_bytes or 0
+        db.delete(entry)
+        evicted += 1
+    db.commit()
+    logger.info(f"Evicted {evicted} audio cache entries (cache now {total} bytes).")
+
+
+# --- CHUNK LAYER ---
+# Plain files keyed by the hash of one chunk's provider input; recency is tracked via mtime
+# so a hit costs no database round trip.
+
+def _chunk_path(chunk_key: str) -> Path:
+    return CACHE_DIR / "chunks" / chunk_key[:2] / f"{chunk_key}.mp3"
+
+
+def has_chunk(chunk_key: str) -> bool:
+    return _chunk_path(chunk_key).is_file()
+
+
+def open_chunk(chunk_key: str):
+    """
+    Opens a cached chunk for reading (and marks it recently used), or returns None.
+    An open handle stays readable even if the file is pruned meanwhile.
+    """
+    path = _chunk_path(chunk_key)
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return f
+
+
+@contextmanager
+def chunk_writer(chunk_key: str):
+    """
+    Yields a binary file to stream one chunk's audio into. The entry only becomes
+    visible (atomically) once the block exits without an error. Callers run
+    maybe_prune_chunks() afterwards.
+    """
+    path = _chunk_path(chunk_key)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.{uuid.uuid4().hex[:8]}.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def maybe_prune_chunks():
+    global _last_prune
+    now = time.time()
+    with _prune_lock:
+        if now - _last_prune < CHUNK_PRUNE_INTERVAL:
+            return
+        _last_prune = now
+    prune_chunks()
+
+
+def prune_chunks(max_bytes: int = None):
+    """Deletes least recently used chunk files until the layer fits in max_bytes."""
+    max_bytes = CHUNK_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    root = CACHE_DIR / "chunks"
+    files = []
+    total = 0
+    for path in root.glob("*/*.mp3"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    if total <= max_bytes:
+        return
+
+    files.sort()
+    removed = 0
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    logger.info(f"Pruned {removed} chunk cache files (chunk cache now {total} bytes).")
@@ -2,15 +2,27 @@ import bcrypt
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
-import os
-from dotenv import load_dotenv
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
 
-load_dotenv()
+from config import settings
 
-SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key")
+SECRET_KEY = settings.jwt_secret
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# bcrypt cost and hashing pool size (see config.Settings)
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+PASSWORD_HASH_QUEUE = settings.password_hash_queue
+
+logger = logging.getLogger(__name__)
+
 import random
 import string
 
@@ -25,7 +37,6 @@ def _truncate_password(password: str) -> str:
         return password
     
     password_bytes = password.encode('utf-8')
-    original_len = len(password_bytes)
     
     if len(password_bytes) > 72:
         # Truncate to exactly 72 bytes
@@ -37,7 +48,6 @@ def _truncate_password(password: str) -> str:
                 password = password_bytes.decode('utf-8')
                 # Verify the decoded password is <= 72 bytes
                 if len(password.encode('utf-8')) <= 72:
-                    print(f"[AUTH] Password truncated from {original_len} to {len(password.encode('utf-8'))} bytes")
                     return password
             except UnicodeDecodeError:
                 pass
@@ -45,14 +55,11 @@ def _truncate_password(password: str) -> str:
             password_bytes = password_bytes[:-1]
         
         # Fallback: use replace to handle any remaining issues
-        password = password_bytes.decode('utf-8', errors='replace')
-        final_len = len(password.encode('utf-8'))
-        print(f"[AUTH] Password truncated from {original_len} to {final_len} bytes (with fallback)")
-        return password
+        return password_bytes.decode('utf-8', errors='replace')
     
     return password
 
-def hash_password(password: str) -> str:
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
     # Bcrypt has a strict 72-byte limit - truncate BEFORE hashing
     if not password:
         raise ValueError("Password cannot be empty")
@@ -65,9 +72,8 @@ def hash_password(password: str) -> str:
     if len(password_bytes) > 72:
         raise ValueError(f"Password cannot be truncated properly. Length: {len(password_bytes)} bytes")
     
-    print(f"[AUTH] Hashing password of {len(password_bytes)} bytes")
     # Use bcrypt directly instead of passlib
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -77,16 +83,89 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     plain_password_bytes = plain_password.encode('utf-8')
     hashed_password_bytes = hashed_password.encode('utf-8')
     # Use bcrypt directly instead of passlib
-    return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
+    try:
+        return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
+    except ValueError:
+        # Not a bcrypt hash (e.g. the placeholder of Google sign-in accounts)
+        return False
+
+def needs_rehash(hashed_password: str, rounds: Optional[int] = None) -> bool:
+    """True for bcrypt hashes made with a different cost than BCRYPT_ROUNDS."""
+    parts = (hashed_password or "").split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return False
+    return int(parts[2]) != (rounds or BCRYPT_ROUNDS)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a small process pool. At most `workers + max_pending` hashes are in
+    flight; further callers get a 503 instead of an ever-growing queue, so login latency
+    stays bounded under a burst and the request threads stay free.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_QUEUE):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor = None
+        self._in_flight = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs an event loop and threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_pending:
+                logger.warning("Password hashing pool saturated; rejecting request.")
+                raise HTTPException(status_code=503, detail="Too many sign-in attempts. Please retry.", headers={"Retry-After": "1"})
+            self._in_flight += 1
+        try:
+            executor = self._get_executor()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool for the next caller
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                executor.shutdown(wait=False)
+                raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, BCRYPT_ROUNDS)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # iat tells get_current_user whether the token's claims predate a user change
+    to_encode.update({"exp": expire, "iat": now})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -1,20 +1,217 @@
+import os
+import time
 import logging
+from datetime import datetime
+from sqlalchemy import inspect, text, select, update, insert, func, and_, bindparam
+from sqlalchemy.orm import Session
 from database import engine, Base
 # Import all models to ensure they are registered with Base.metadata
-import models 
+import models
+import shared_state
+import stats_rollup
+from history_search import create_search_index
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+def add_columns(table_name: str, *column_names):
+    """
+    Migration step adding columns declared on the model to an existing table; columns
+    already there are skipped. create_all() only creates whole tables, so new columns on
+    old tables each get a revision built from this.
+    """
+    def step(bind):
+        inspector = inspect(bind)
+        if table_name not in inspector.get_table_names():
+            return
+        existing_columns = {c["name"] for c in inspector.get_columns(table_name)}
+        table = Base.metadata.tables[table_name]
+        with bind.begin() as connection:
+            for name in column_names:
+                if name in existing_columns:
+                    continue
+                column = table.columns[name]
+                column_type = column.type.compile(dialect=bind.dialect)
+                logger.info(f"Adding column '{table_name}.{name}' ({column_type})")
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}"))
+                if column.index:
+                    connection.execute(text(f"CREATE INDEX ix_{table_name}_{name} ON {table_name} ({name})"))
+    return step
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "500"))
+
+
+def backfill_current_plans(bind=engine, batch_size: int = None) -> int:
+    """
+    Fills User.current_plan / plan_changed_at from each user's latest Transaction for rows
+    written before the columns existed. Runs in keyset-ordered batches, one commit each, and
+    only touches rows that are still NULL, so it is safe to re-run or interrupt.
+    """
+    User, Transaction = models.User, models.Transaction
+    batch_size = batch_size or BACKFILL_BATCH_SIZE
+    filled = 0
+    last_id = ""
+    while True:
+        with bind.begin() as connection:
+            users = connection.execute(
+                select(User.id, User.created_at)
+                .where(User.current_plan.is_(None), User.id > last_id)
+                .order_by(User.id)
+                .limit(batch_size)
+            ).all()
+            if not users:
+                break
+            last_id = users[-1].id
+            ids = [u.id for u in users]
+
+            # Latest transaction per user in this batch (ties go to the highest id)
+            latest = (
+                select(Transaction.user_id, func.max(Transaction.timestamp).label("ts"))
+                .where(Transaction.user_id.in_(ids))
+                .group_by(Transaction.user_id)
+                .subquery()
+            )
+            plans = {}
+            for row in connection.execute(
+                select(Transaction.user_id, Transaction.plan_type, Transaction.timestamp)
+                .join(latest, and_(Transaction.user_id == latest.c.user_id, Transaction.timestamp == latest.c.ts))
+                .order_by(Transaction.id)
+            ):
+                plans[row.user_id] = (row.plan_type, row.timestamp)
+
+            connection.execute(
+                update(User)
+                .where(User.id == bindparam("uid"), User.current_plan.is_(None))
+                .values(current_plan=bindparam("plan"), plan_changed_at=bindparam("changed_at")),
+                [
+                    {
+                        "uid": u.id,
+                        "plan": plans.get(u.id, ("Basic", None))[0] or "Basic",
+                        "changed_at": plans.get(u.id, (None, u.created_at))[1],
+                    }
+                    for u in users
+                ],
+            )
+            filled += len(users)
+    if filled:
+        logger.info(f"Backfilled current_plan for {filled} users.")
+    return filled
+
+
+def add_current_plan(bind=engine):
+    """Adds users.current_plan / plan_changed_at, then fills them from the transaction log."""
+    add_columns("users", "current_plan", "plan_changed_at")(bind)
+    backfill_current_plans(bind)
+
+
+def seed_stats_rollup(bind=engine):
+    """Builds the admin stats rollup from history the first time the table exists."""
+    with Session(bind=bind) as db:
+        stats_rollup.rebuild_if_empty(db)
+
+
+def create_hot_path_indexes(bind=engine):
+    """Indexes declared in models' __table_args__ that create_all() skips on existing tables."""
+    wanted = {
+        "conversions": ["ix_conversions_audio_url", "ix_conversions_user_id_created_at"],
+        "transactions": ["ix_transactions_user_id_timestamp"],
+        "download_history": ["ix_download_history_user_id"],
+    }
+    inspector = inspect(bind)
+    for table_name, index_names in wanted.items():
+        table = Base.metadata.tables[table_name]
+        existing = {ix["name"] for ix in inspector.get_indexes(table_name)}
+        for index in table.indexes:
+            if index.name in index_names and index.name not in existing:
+                logger.info(f"Creating index {index.name} on {table_name}")
+                index.create(bind=bind)
+
+
+# --- VERSIONED MIGRATIONS ---
+# Append only: (revision, description, step). Each step takes the engine, manages its own
+# transactions and is idempotent, so a run interrupted halfway is simply repeated.
+MIGRATIONS = [
+    ("0001_hot_path_indexes", "Indexes for audio lookups, history, latest transaction and downloads", create_hot_path_indexes),
+    ("0002_backfill_current_plan", "Add users.current_plan and fill it from the transaction log", add_current_plan),
+    ("0003_seed_stats_rollup", "Build the admin stats rollup from history", seed_stats_rollup),
+    ("0004_history_search_index", "Full-text index on conversions.text (MySQL FULLTEXT / SQLite FTS5)", create_search_index),
+    ("0005_conversions_cache_key", "conversions.cache_key, the synthesis cache address", add_columns("conversions", "cache_key")),
+    ("0006_conversions_content_hash", "conversions.content_hash, the audio ETag", add_columns("conversions", "content_hash")),
+    ("0007_conversion_jobs_heartbeat", "conversion_jobs.heartbeat_at, proof that a running job's worker is alive", add_columns("conversion_jobs", "heartbeat_at")),
+    ("0008_conversion_jobs_reserved", "conversion_jobs.reserved, credits held by a job across retries", add_columns("conversion_jobs", "reserved")),
+]
+
+MIGRATION_LEASE = "schema_migrations.lock"
+MIGRATION_LEASE_TTL = 1800
+# How long a process waits for another one's migrations before giving up with an error
+MIGRATION_WAIT = float(os.getenv("MIGRATION_WAIT", str(MIGRATION_LEASE_TTL)))
+
+
+def applied_revisions(bind=engine) -> set:
+    with bind.connect() as connection:
+        return set(connection.execute(select(models.SchemaMigration.revision)).scalars())
+
+
+def run_migrations(bind=engine, migrations=None, wait: float = None) -> list:
+    """
+    Applies pending revisions in order and records each one in schema_migrations.
+    Processes starting together take a shared lease so only one of them migrates; the
+    others wait (up to `wait` seconds) until it is done, and raise if it never is, so no
+    caller goes on with an unmigrated schema. Returns the revisions applied here.
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    wait = MIGRATION_WAIT if wait is None else wait
+    models.SchemaMigration.__table__.create(bind=bind, checkfirst=True)
+
+    def pending():
+        done = applied_revisions(bind)
+        return [m[0] for m in migrations if m[0] not in done]
+
+    if not pending():
+        return []
+    deadline = time.monotonic() + wait
+    waiting = False
+    while not shared_state.try_lease(MIGRATION_LEASE, MIGRATION_LEASE_TTL):
+        if not pending():
+            # The lease holder applied everything
+            return []
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Timed out after {wait:.0f}s waiting for another process to apply migrations: {', '.join(pending())}")
+        if not waiting:
+            logger.warning("Another process is applying migrations; waiting for it to finish.")
+            waiting = True
+        time.sleep(min(2.0, max(0.05, deadline - time.monotonic())))
+
+    applied = []
+    try:
+        # Re-read under the lease: another worker may have just finished
+        done = applied_revisions(bind)
+        for revision, description, step in migrations:
+            if revision in done:
+                continue
+            logger.info(f"Applying migration {revision}: {description}")
+            step(bind)
+            with bind.begin() as connection:
+                connection.execute(insert(models.SchemaMigration).values(
+                    revision=revision, description=description, applied_at=datetime.utcnow()
+                ))
+            applied.append(revision)
+    finally:
+        shared_state.release_lease(MIGRATION_LEASE)
+    return applied
+
+
 def run_auto_migrations():
     """
-    Automatically creates database tables based on SQLAlchemy models.
+    Automatically creates database tables based on SQLAlchemy models,
+    then applies pending versioned migrations.
     """
     logger.info("Starting auto-migration process...")
     try:
         # The create_all method creates tables if they don't exist
         Base.metadata.create_all(bind=engine)
-        logger.info("Auto-migration completed successfully: Database tables verified/created.")
+        applied = run_migrations()
+        logger.info(f"Auto-migration completed successfully: Database tables verified/created, {len(applied)} migrations applied.")
     except Exception as e:
         logger.critical(f"Auto-migration failed: {e}")
         raise e
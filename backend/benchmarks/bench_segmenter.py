@@ -0,0 +1,98 @@
+"""
+Segmenter scaling benchmark.
+
+    cd backend && python benchmarks/bench_segmenter.py
+
+Times segment_text against the previous slice-and-rfind smart_split on inputs of growing
+size. Time per MB stays flat for segment_text (linear); the legacy splitter copies the
+remaining text for every chunk, so its time per MB grows with the input.
+
+A second table runs Hindi and CJK text without any punctuation (one endless run, every
+chunk a word or forced cut) under the real Azure budget: escaped SSML bytes, envelope
+included.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# synthesis reads the app settings on import; nothing here connects to the database
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from segmenter import SegmentBudget, segment_text, utf8_len
+from synthesis import azure_segment_budget
+
+UNPUNCTUATED = {
+    "Hindi": ("hi-IN-SwaraNeural", "नमस्ते दुनिया यह एक लंबा परीक्षण है जिसमें कोई विराम नहीं "),
+    "CJK": ("zh-CN-XiaoxiaoNeural", "这是一个没有标点符号的很长的中文句子用来测试分段"),
+}
+
+
+def legacy_smart_split(text, limit=3000):
+    chunks = []
+    while len(text) > limit:
+        split_indices = [text.rfind(p, 0, limit) for p in [".", "!", "?"]]
+        last_punc = max(split_indices)
+        if last_punc != -1:
+            split_point = last_punc + 1
+        else:
+            last_space = text.rfind(" ", 0, limit)
+            split_point = last_space if last_space != -1 else limit
+        chunks.append(text[:split_point].strip())
+        text = text[split_point:].strip()
+    if text:
+        chunks.append(text.strip())
+    return chunks
+
+
+def make_text(size_bytes, seed=7):
+    rng = random.Random(seed)
+    words = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+    parts = []
+    total = 0
+    while total < size_bytes:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 25))).capitalize() + ". "
+        if rng.random() < 0.05:
+            sentence = f"[voice:en-US-GuyNeural]{sentence}[break:300ms][/voice] "
+        parts.append(sentence)
+        total += len(sentence)
+    return "".join(parts)
+
+
+def make_unpunctuated(unit, size_bytes):
+    repeat = size_bytes // utf8_len(unit) + 1
+    return unit * repeat
+
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    budget = SegmentBudget(8192, measure=utf8_len)
+    print(f"{'size':>8} {'segment_text':>14} {'per MB':>9} {'legacy':>10} {'per MB':>9}")
+    for mb in (0.5, 1, 2, 4, 8):
+        text = make_text(int(mb * 1024 * 1024))
+        new = best_of(lambda: segment_text(text, budget))
+        legacy = best_of(lambda: legacy_smart_split(text, 3000), repeat=1)
+        print(f"{mb:>6} MB {new:>13.3f}s {new / mb:>8.3f}s {legacy:>9.3f}s {legacy / mb:>8.3f}s")
+
+    for script, (voice, unit) in UNPUNCTUATED.items():
+        budget = azure_segment_budget(voice, None, None)
+        print(f"\n{script}, no punctuation, Azure SSML budget")
+        print(f"{'size':>8} {'segment_text':>14} {'per MB':>9} {'chunks':>8}")
+        for mb in (1, 2, 4, 8):
+            text = make_unpunctuated(unit, int(mb * 1024 * 1024))
+            chunks = []
+            new = best_of(lambda: chunks.append(segment_text(text, budget)))
+            print(f"{mb:>6} MB {new:>13.3f}s {new / mb:>8.3f}s {len(chunks[-1]):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+SSML builder throughput benchmark.
+
+    cd backend && python benchmarks/bench_ssml.py
+
+Builds SSML for 100KB scripts with a voice switch, style or break every sentence or two,
+using the previous split-and-match builder, the single-pass builder with the memo off
+(cold) and the memoized builder (repeat of the same script).
+"""
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ssml import build_advanced_ssml, clear_cache
+
+PROSODY = {"rate": "medium", "pitch": "medium"}
+
+
+def legacy_build_advanced_ssml(text, voice_name, style_degree, prosody):
+    rate = prosody.get("rate", "medium") if prosody else "medium"
+    pitch = prosody.get("pitch", "medium") if prosody else "medium"
+    text = re.sub(r"\[break:(.*?)\]", r'<break time="\1" />', text)
+    active_voice = voice_name
+    active_style = None
+    parts = re.split(r'(\[voice:.*?\]|\[/voice\]|\[style:.*?\]|\[/style\])', text, flags=re.DOTALL)
+    ssml_body = []
+
+    def open_segment(v, s):
+        seg = f'<voice name="{v}"><prosody rate="{rate}" pitch="{pitch}">'
+        if s:
+            degree_attr = f' styledegree="{style_degree}"' if style_degree and style_degree != 1.0 else ""
+            seg += f'<mstts:express-as style="{s}"{degree_attr}>'
+        return seg
+
+    def close_segment(s):
+        return ('</mstts:express-as>' if s else '') + '</prosody></voice>'
+
+    ssml_body.append(open_segment(active_voice, active_style))
+    for part in parts:
+        if not part:
+            continue
+        v_start = re.match(r'\[voice:(.*?)\]', part)
+        s_start = re.match(r'\[style:(.*?)\]', part)
+        if v_start:
+            ssml_body.append(close_segment(active_style))
+            active_voice = v_start.group(1)
+            ssml_body.append(open_segment(active_voice, active_style))
+        elif part == '[/voice]':
+            ssml_body.append(close_segment(active_style))
+            active_voice = voice_name
+            ssml_body.append(open_segment(active_voice, active_style))
+        elif s_start:
+            active_style = s_start.group(1)
+            degree_attr = f' styledegree="{style_degree}"' if style_degree and style_degree != 1.0 else ""
+            ssml_body.append(f'<mstts:express-as style="{active_style}"{degree_attr}>')
+        elif part == '[/style]':
+            ssml_body.append('</mstts:express-as>')
+            active_style = None
+        else:
+            ssml_body.append(part)
+    ssml_body.append(close_segment(active_style))
+    full_body = "".join(ssml_body)
+    return f"""<speak version='1.0' xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="https://www.w3.org/2001/mstts" xml:lang='en-US'>{full_body}</speak>"""
+
+
+def make_script(size_bytes, seed=11):
+    rng = random.Random(seed)
+    words = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+    voices = ["en-US-GuyNeural", "en-US-AriaNeural", "en-GB-RyanNeural"]
+    styles = ["cheerful", "sad", "whispering"]
+    parts = []
+    total = 0
+    while total < size_bytes:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(4, 12))).capitalize() + ". "
+        roll = rng.random()
+        if roll < 0.4:
+            sentence = f"[voice:{rng.choice(voices)}]{sentence}[/voice]"
+        elif roll < 0.6:
+            sentence = f"[style:{rng.choice(styles)}]{sentence}[/style]"
+        elif roll < 0.8:
+            sentence += "[break:250ms]"
+        parts.append(sentence)
+        total += len(sentence)
+    return "".join(parts)
+
+
+def best_of(fn, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    script = make_script(100 * 1024)
+    tags = len(re.findall(r"\[[^\]]*\]", script))
+    mb = len(script) / (1024 * 1024)
+    print(f"script: {len(script)} chars, {tags} tags")
+
+    legacy = best_of(lambda: legacy_build_advanced_ssml(script, "en-US-JennyNeural", 1.0, PROSODY))
+    cold = best_of(lambda: build_advanced_ssml(script, "en-US-JennyNeural", 1.0, PROSODY, cache=False))
+    clear_cache()
+    build_advanced_ssml(script, "en-US-JennyNeural", 1.0, PROSODY)
+    warm = best_of(lambda: build_advanced_ssml(script, "en-US-JennyNeural", 1.0, PROSODY))
+
+    for name, seconds in (("legacy", legacy), ("single-pass", cold), ("memoized", warm)):
+        print(f"{name:>12} {seconds * 1000:>9.2f} ms {mb / seconds:>9.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
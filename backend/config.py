@@ -0,0 +1,120 @@
+import os
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).parent
+
+DEFAULT_SENTRY_DSN = "https://802e0792557423aef70c6a49dfe32404@o4510838171107328.ingest.us.sentry.io/4510838173925376"
+
+
+def find_env_file() -> Optional[Path]:
+    """The first .env found next to this file, in the working directory or in its backend/ folder."""
+    cwd = Path(os.getcwd())
+    for path in (BACKEND_DIR / ".env", cwd / ".env", cwd / "backend" / ".env"):
+        if path.is_file():
+            return path
+    return None
+
+
+def normalize_database_url(url: str) -> str:
+    """Forces the mysqlconnector driver and utf8mb4 on MySQL URLs."""
+    if "mysql+pymysql" in url:
+        url = url.replace("mysql+pymysql", "mysql+mysqlconnector")
+    elif "mysql://" in url:
+        url = url.replace("mysql://", "mysql+mysqlconnector://")
+    if "mysql" in url and "charset=utf8mb4" not in url:
+        url += ("&" if "?" in url else "?") + "charset=utf8mb4"
+    return url
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Process-wide settings, read from the environment once at startup."""
+    env_file: Optional[str]
+    database_url: str
+    jwt_secret: str
+    # Empty disables Sentry
+    sentry_dsn: str
+    sentry_traces_sample_rate: float
+    # bcrypt cost factor for new hashes; older hashes are upgraded on the next login
+    bcrypt_rounds: int
+    # Processes doing bcrypt, so logins never take threads from conversions
+    password_hash_workers: int
+    # Hashes allowed to wait for a free process; beyond that requests get a 503 right away
+    password_hash_queue: int
+    # Connection pool sizing (per engine, per worker process)
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: float
+    db_pool_recycle: int
+    # "always": ping on every checkout; "idle": only connections unused for db_pool_ping_idle_seconds; "off"
+    db_pool_pre_ping: str
+    db_pool_ping_idle_seconds: float
+    # Run migrations and seeding when the app is imported (otherwise: python update_schema.py)
+    auto_migrate: bool
+    # serve.py: listening address, worker processes, app imported once in the master, drain time
+    serve_host: str
+    serve_port: int
+    web_concurrency: int
+    serve_preload: bool
+    graceful_timeout: float
+    frontend_path: Optional[str]
+    audio_sendfile_mode: str
+    audio_accel_prefix: str
+
+    @classmethod
+    def from_env(cls, env=None, env_file: Optional[Path] = None) -> "Settings":
+        env = os.environ if env is None else env
+        database_url = env.get("DATABASE_URL")
+        if not database_url:
+            raise ValueError("DATABASE_URL not found!")
+        return cls(
+            env_file=str(env_file) if env_file else None,
+            database_url=normalize_database_url(database_url),
+            jwt_secret=env.get("JWT_SECRET", "your-secret-key"),
+            sentry_dsn=env.get("SENTRY_DSN", DEFAULT_SENTRY_DSN),
+            sentry_traces_sample_rate=float(env.get("SENTRY_TRACES_SAMPLE_RATE", "1.0")),
+            bcrypt_rounds=int(env.get("BCRYPT_ROUNDS", "12")),
+            password_hash_workers=int(env.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            password_hash_queue=int(env.get("PASSWORD_HASH_QUEUE", "32")),
+            db_pool_size=int(env.get("DB_POOL_SIZE", "5")),
+            db_max_overflow=int(env.get("DB_MAX_OVERFLOW", "10")),
+            db_pool_timeout=float(env.get("DB_POOL_TIMEOUT", "30")),
+            db_pool_recycle=int(env.get("DB_POOL_RECYCLE", "3600")),
+            db_pool_pre_ping=env.get("DB_POOL_PRE_PING", "idle").lower(),
+            db_pool_ping_idle_seconds=float(env.get("DB_POOL_PING_IDLE_SECONDS", "30")),
+            auto_migrate=_flag(env.get("AUTO_MIGRATE", "")),
+            serve_host=env.get("SERVE_HOST", "127.0.0.1"),
+            serve_port=int(env.get("SERVE_PORT", "8000")),
+            web_concurrency=int(env.get("WEB_CONCURRENCY", str(min(4, os.cpu_count() or 1)))),
+            serve_preload=_flag(env.get("SERVE_PRELOAD", "1")),
+            graceful_timeout=float(env.get("GRACEFUL_TIMEOUT", "30")),
+            frontend_path=env.get("FRONTEND_PATH") or None,
+            audio_sendfile_mode=env.get("AUDIO_SENDFILE_MODE", "").lower(),
+            audio_accel_prefix=env.get("AUDIO_ACCEL_PREFIX", "/protected-audio/"),
+        )
+
+
+def load_settings() -> Settings:
+    """Loads the .env file (if any) into the environment, then reads the settings from it."""
+    env_file = find_env_file()
+    if env_file:
+        load_dotenv(dotenv_path=env_file, override=True)
+    else:
+        logger.warning("No .env file found; using the process environment only.")
+    return Settings.from_env(env_file=env_file)
+
+
+# Module-level knobs elsewhere (caches, jobs, providers) read os.environ at import, so
+# importing this module first also makes the .env values visible to them
+settings = load_settings()
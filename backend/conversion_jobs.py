@@ -0,0 +1,285 @@
+import os
+import uuid
+import asyncio
+import logging
+import traceback
+import weakref
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update, func
+from sqlalchemy.orm import Session
+
+import database
+from models import ConversionJob
+from utils import reserve_credits, refund_credits
+
+logger = logging.getLogger(__name__)
+
+# Max jobs synthesized at the same time by one worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Idle workers re-check the table this often (jobs queued by other processes)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# A running job's worker refreshes its heartbeat this often, however long the job takes
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+# A 'running' job without a heartbeat for this long belongs to a dead process and is queued again
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How often each worker looks for jobs abandoned by a process that died
+JOB_REQUEUE_INTERVAL = float(os.getenv("JOB_REQUEUE_INTERVAL", "60"))
+
+# Worker tasks and wake-up events live on one event loop each
+_workers = weakref.WeakKeyDictionary()
+_wakeups = weakref.WeakKeyDictionary()
+
+
+def session_factory() -> Session:
+    return database.SessionLocal()
+
+
+def enqueue(db: Session, user_id: str, request_json: str) -> ConversionJob:
+    job = ConversionJob(id=uuid.uuid4().hex, user_id=user_id, status="queued", request=request_json)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _claimed(job_id: str, attempt: int):
+    """Rows still held by this attempt: once requeued, a slow attempt can no longer write."""
+    return (ConversionJob.id == job_id) & (ConversionJob.attempts == attempt) & (ConversionJob.status == "running")
+
+
+def requeue_stale(db: Session):
+    """Gives jobs abandoned by a crashed or restarted process (no heartbeat) another try."""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+    last_seen = func.coalesce(ConversionJob.heartbeat_at, ConversionJob.started_at)
+    stale = (ConversionJob.status == "running") & (last_seen < cutoff)
+
+    # 1. Out of attempts: fail the job and give back the credits it still holds
+    exhausted = db.query(ConversionJob).filter(stale, ConversionJob.attempts >= JOB_MAX_ATTEMPTS).all()
+    for job in exhausted:
+        user_id, amount = job.user_id, job.reserved
+        failed = db.execute(
+            update(ConversionJob)
+            .where(stale, _claimed(job.id, job.attempts))
+            .values(status="failed", error="Job did not finish", finished_at=datetime.utcnow(), reserved=0)
+        ).rowcount
+        if failed:
+            refund_credits(user_id, db, amount, commit=False)
+
+    # 2. The rest run again and keep their reservation for the retry
+    db.execute(update(ConversionJob).where(stale).values(status="queued"))
+    db.commit()
+
+
+def claim_next(db: Session) -> Optional[ConversionJob]:
+    """
+    Atomically moves the oldest queued job to 'running'. The status guard in the UPDATE
+    means only one worker (in any process) wins a given job.
+    """
+    for _ in range(5):
+        candidate = (
+            db.query(ConversionJob.id)
+            .filter(ConversionJob.status == "queued")
+            .order_by(ConversionJob.created_at.asc())
+            .first()
+        )
+        if candidate is None:
+            return None
+        now = datetime.utcnow()
+        claimed = db.execute(
+            update(ConversionJob)
+            .where(ConversionJob.id == candidate.id, ConversionJob.status == "queued")
+            .values(status="running", started_at=now, heartbeat_at=now, attempts=ConversionJob.attempts + 1)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.query(ConversionJob).filter(ConversionJob.id == candidate.id).first()
+    return None
+
+
+def reserve(db: Session, job: ConversionJob, amount: int) -> dict:
+    """
+    Charges the job's credits and records them on the row in the same transaction, so a
+    retry after a crash can reuse them instead of charging again. Same dict as reserve_credits.
+    """
+    check = reserve_credits(job.user_id, db, amount, commit=False)
+    if check['allowed']:
+        recorded = db.execute(
+            update(ConversionJob).where(_claimed(job.id, job.attempts)).values(reserved=amount)
+        ).rowcount
+        if not recorded:
+            db.rollback()
+            return {'allowed': False, 'reason': "Job was taken over by another worker"}
+        job.reserved = amount
+    db.commit()
+    return check
+
+
+def release_reservation(db: Session, job: ConversionJob):
+    """Refunds the credits the job holds, once, as long as this attempt still owns it."""
+    db.rollback()
+    amount = db.query(ConversionJob.reserved).filter(_claimed(job.id, job.attempts)).scalar()
+    if not amount:
+        return
+    released = db.execute(
+        update(ConversionJob)
+        .where(_claimed(job.id, job.attempts), ConversionJob.reserved == amount)
+        .values(reserved=0)
+    ).rowcount
+    if released:
+        refund_credits(job.user_id, db, amount, commit=False)
+    db.commit()
+
+
+def heartbeat(db: Session, job_id: str, attempt: int) -> bool:
+    """Marks the attempt as alive. False once the job was requeued or finished by someone else."""
+    beats = db.execute(
+        update(ConversionJob).where(_claimed(job_id, attempt)).values(heartbeat_at=datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return bool(beats)
+
+
+def finish(db: Session, job_id: str, attempt: int, conversion_id: int = None, error: str = None) -> bool:
+    """Records the attempt's outcome; False (nothing written) if the attempt lost its claim."""
+    db.rollback()
+    finished = db.execute(
+        update(ConversionJob)
+        .where(_claimed(job_id, attempt))
+        .values(
+            status="failed" if error else "done",
+            error=error[:500] if error else None,
+            conversion_id=conversion_id,
+            finished_at=datetime.utcnow(),
+        )
+    ).rowcount
+    db.commit()
+    if not finished:
+        logger.warning(f"Job {job_id} attempt {attempt} lost its claim; its result was not recorded.")
+    return bool(finished)
+
+
+def _beat_now(job_id: str, attempt: int) -> bool:
+    db = session_factory()
+    try:
+        return heartbeat(db, job_id, attempt)
+    finally:
+        db.close()
+
+
+async def _keep_alive(job_id: str, attempt: int):
+    """Refreshes the heartbeat while the attempt runs, so long documents are not requeued."""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            if not await run_in_threadpool(_beat_now, job_id, attempt):
+                return
+        except Exception as e:
+            logger.error(f"Heartbeat of job {job_id} failed: {e}")
+
+
+async def run_one(handler) -> bool:
+    """Claims and runs a single job. Returns False when the queue is empty."""
+    db = session_factory()
+    try:
+        job = await run_in_threadpool(claim_next, db)
+        if job is None:
+            return False
+
+        job_id, attempt = job.id, job.attempts
+        logger.info(f"Job {job_id} started (attempt {attempt}).")
+        keeper = asyncio.ensure_future(_keep_alive(job_id, attempt))
+        try:
+            conversion_id = await handler(job, db)
+        except HTTPException as e:
+            logger.warning(f"Job {job_id} failed: {e.detail}")
+            await run_in_threadpool(finish, db, job_id, attempt, None, str(e.detail))
+        except Exception as e:
+            logger.error(f"Job {job_id} crashed: {e}\nTraceback:\n{traceback.format_exc()}")
+            await run_in_threadpool(finish, db, job_id, attempt, None, f"Conversion failed: {e}")
+        else:
+            if await run_in_threadpool(finish, db, job_id, attempt, conversion_id):
+                logger.info(f"Job {job_id} done (conversion {conversion_id}).")
+        finally:
+            keeper.cancel()
+        return True
+    finally:
+        db.close()
+
+
+def _wakeup() -> asyncio.Event:
+    loop = asyncio.get_running_loop()
+    event = _wakeups.get(loop)
+    if event is None:
+        event = asyncio.Event()
+        _wakeups[loop] = event
+    return event
+
+
+def _requeue_stale_now():
+    db = session_factory()
+    try:
+        requeue_stale(db)
+    finally:
+        db.close()
+
+
+async def _worker(handler):
+    wakeup = _wakeup()
+    loop = asyncio.get_running_loop()
+    next_requeue = 0.0
+
+    while True:
+        # Not only at start: a job claimed by a process that dies later must come back too
+        if loop.time() >= next_requeue:
+            next_requeue = loop.time() + JOB_REQUEUE_INTERVAL
+            try:
+                await run_in_threadpool(_requeue_stale_now)
+            except Exception as e:
+                logger.error(f"Could not requeue stale jobs: {e}")
+
+        try:
+            if await run_one(handler):
+                continue
+        except Exception as e:
+            # Database hiccup: back off and keep the worker alive
+            logger.error(f"Job worker error: {e}")
+
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+
+def ensure_workers(handler):
+    """
+    Starts the worker pool on the running event loop if needed and wakes idle workers.
+    Called at startup and from the job routes (enqueue and poll), because the WSGI bridge
+    never runs startup events.
+    """
+    loop = asyncio.get_running_loop()
+    workers = _workers.get(loop)
+    if workers is None:
+        workers = set()
+        _workers[loop] = workers
+
+    for task in [t for t in workers if t.done()]:
+        workers.discard(task)
+    while len(workers) < max(1, JOB_WORKERS):
+        workers.add(asyncio.ensure_future(_worker(handler)))
+    _wakeup().set()
+
+
+def shutdown():
+    """Cancels the running loop's workers; interrupted jobs are retried once stale."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    for task in _workers.pop(loop, set()):
+        task.cancel()
@@ -1,9 +1,11 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
-from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from fastapi.concurrency import run_in_threadpool
+import pool_metrics
 import os
-from pathlib import Path
 import logging
+from config import settings
 
 # --- 1. SETUP LOGGER ---
 logger = logging.getLogger("database")
@@ -16,62 +18,71 @@ logging.basicConfig(
     ]
 )
 
-env_path = Path(__file__).parent / ".env"
-load_dotenv(dotenv_path=env_path)
+# --- 2. ENGINE ---
+# Normalized (driver, charset) by config.normalize_database_url
+DATABASE_URL = settings.database_url
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+connect_args = {}
+if "mysql" in DATABASE_URL:
+    connect_args = {
+        "charset": "utf8mb4",
+        "collation": "utf8mb4_unicode_ci",
+        "init_command": "SET NAMES utf8mb4 COLLATE utf8mb4_unicode_ci"
+    }
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL not found!")
-
-# ==========================================
-# 🚀 FINAL FIX: FORCE DRIVER & HANDSHAKE 🚀
-# ==========================================
-# 1. Ensure we use the correct driver
-if "mysql+pymysql" in DATABASE_URL:
-    DATABASE_URL = DATABASE_URL.replace("mysql+pymysql", "mysql+mysqlconnector")
-elif "mysql://" in DATABASE_URL:
-    DATABASE_URL = DATABASE_URL.replace("mysql://", "mysql+mysqlconnector://")
-
-# 2. Add charset to URL (Layer 1 Security)
-if "charset=utf8mb4" not in DATABASE_URL:
-    if "?" in DATABASE_URL:
-        DATABASE_URL += "&charset=utf8mb4"
-    else:
-        DATABASE_URL += "?charset=utf8mb4"
+# THE MAGIC FIX: init_command
+# We pass 'init_command' inside connect_args for MySQL.
+# This runs AUTOMATICALLY at the driver level, guaranteed.
+# Pool sizing and pre-ping strategy come from DB_POOL_* (see pool_metrics.py);
+# SQLite keeps its own single-file pools.
+# No connection is opened here: the pool connects on first use, so a cold worker does not
+# pay a round trip before its first request (`python update_schema.py` at deploy time checks the database).
+pool_args = {} if DATABASE_URL.startswith("sqlite") else pool_metrics.pool_options(pool_metrics.sync_pool)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args=connect_args,
+    **pool_args
+)
+if pool_args and pool_metrics.DB_POOL_PRE_PING == "idle":
+    pool_metrics.install_idle_ping(engine, pool_metrics.sync_pool)
 
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
 
-logger.info("Database URL loaded successfully (Password hidden).")
 
-try:
-    connect_args = {}
-    if "mysql" in DATABASE_URL:
-        connect_args = {
-            "charset": "utf8mb4", 
-            "collation": "utf8mb4_unicode_ci",
-            "init_command": "SET NAMES utf8mb4 COLLATE utf8mb4_unicode_ci"
-        }
+# --- 3. ASYNC ENGINE ---
+# Hot request handlers use this one, so a request waiting on the database holds no thread.
+# Same database, its own pool; everything else (admin, jobs, migrations) stays on `engine`.
+def async_database_url(url: str) -> str:
+    override = os.getenv("ASYNC_DATABASE_URL")
+    if override:
+        return override
+    if url.startswith("mysql+mysqlconnector://"):
+        return url.replace("mysql+mysqlconnector://", "mysql+asyncmy://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    raise ValueError("Set ASYNC_DATABASE_URL: no async driver is known for this DATABASE_URL.")
 
-    # 3. THE MAGIC FIX: init_command
-    # We pass 'init_command' inside connect_args for MySQL. 
-    # This runs AUTOMATICALLY at the driver level, guaranteed.
-    engine = create_engine(
-        DATABASE_URL,
-        pool_pre_ping=True,
-        pool_recycle=3600,
-        connect_args=connect_args
-    )
 
-    # Test connection immediately
-    with engine.connect() as connection:
-        logger.info("Database connection established successfully.")
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
 
-except Exception as e:
-    logger.critical(f"FAILED TO CONNECT: {str(e)}")
-    raise e
+async_connect_args = {}
+if "mysql" in ASYNC_DATABASE_URL:
+    async_connect_args = {
+        "charset": "utf8mb4",
+        "init_command": "SET NAMES utf8mb4 COLLATE utf8mb4_unicode_ci"
+    }
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+async_pool_args = {} if ASYNC_DATABASE_URL.startswith("sqlite") else pool_metrics.pool_options(pool_metrics.async_pool, async_driver=True)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=async_connect_args,
+    **async_pool_args
+)
+if async_pool_args and pool_metrics.DB_POOL_PRE_PING == "idle":
+    pool_metrics.install_idle_ping(async_engine, pool_metrics.async_pool)
+# Objects stay usable after commit: an expired attribute would need I/O outside an await
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 def get_db():
     db = SessionLocal()
@@ -81,4 +92,22 @@ def get_db():
         logger.error(f"Database Session Error: {str(e)}")
         raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"Database Session Error: {str(e)}")
+            raise
+
+async def run_db(db, fn, *args):
+    """
+    Runs a sync helper `fn(session, *args)` with either kind of session: on an
+    AsyncSession through run_sync (database waits are awaited, no thread is used),
+    on a Session in the threadpool as before.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
\ No newline at end of file
@@ -1,13 +1,19 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import User
 from auth import verify_token
+from user_cache import UserSnapshot, user_snapshots
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> UserSnapshot:
+    """
+    The caller as a UserSnapshot (id, is_admin, current_plan). Served from the snapshot
+    cache or the token's own claims when those are still current, so most requests
+    never query the users table; load the User row when you need anything else.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -20,9 +26,22 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user_id_str: str = payload.get("sub")
     if user_id_str is None:
         raise credentials_exception
-        
-    user = db.query(User).filter(User.id == user_id_str).first()
-    if user is None:
-        raise credentials_exception
-        
-    return user
+
+    # 1. Cached snapshot
+    snapshot = user_snapshots.get(user_id_str)
+    if snapshot is not None:
+        return snapshot
+
+    # 2. The token's claims, unless this user changed since it was issued
+    if user_snapshots.trusts(user_id_str, payload.get("iat")):
+        snapshot = UserSnapshot.from_claims(payload)
+
+    # 3. The users table
+    if snapshot is None:
+        user = await db.get(User, user_id_str)
+        if user is None:
+            raise credentials_exception
+        snapshot = UserSnapshot.from_user(user)
+
+    user_snapshots.put(snapshot)
+    return snapshot
@@ -0,0 +1,99 @@
+import re
+import logging
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import DDL, Column, Integer, MetaData, Table, UnicodeText, event, inspect, literal_column, text
+from sqlalchemy.dialects.mysql import match
+
+from models import Conversion
+
+logger = logging.getLogger(__name__)
+
+MYSQL_FULLTEXT_INDEX = "ft_conversions_text"
+# InnoDB ignores shorter words (innodb_ft_min_token_size); such searches fall back to LIKE
+MYSQL_MIN_TOKEN = 3
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+# SQLite: external-content FTS5 table over conversions.text, kept in sync by triggers
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS conversions_fts USING fts5(text, content='conversions', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS conversions_fts_ai AFTER INSERT ON conversions BEGIN
+        INSERT INTO conversions_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversions_fts_ad AFTER DELETE ON conversions BEGIN
+        INSERT INTO conversions_fts(conversions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversions_fts_au AFTER UPDATE OF text ON conversions BEGIN
+        INSERT INTO conversions_fts(conversions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO conversions_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+# Not part of Base.metadata: created by the DDL above, never by create_all()
+conversions_fts = Table("conversions_fts", MetaData(), Column("rowid", Integer), Column("text", UnicodeText))
+
+for _statement in _SQLITE_DDL:
+    event.listen(Conversion.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(Conversion.__table__, "before_drop", DDL("DROP TABLE IF EXISTS conversions_fts").execute_if(dialect="sqlite"))
+event.listen(
+    Conversion.__table__, "after_create",
+    DDL(f"ALTER TABLE conversions ADD FULLTEXT INDEX {MYSQL_FULLTEXT_INDEX} (text)").execute_if(dialect="mysql"),
+)
+
+
+def create_search_index(bind):
+    """Adds the search index to an existing conversions table and indexes the rows already there."""
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        with bind.begin() as connection:
+            for statement in _SQLITE_DDL:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO conversions_fts(conversions_fts) VALUES ('rebuild')"))
+    elif dialect == "mysql":
+        existing = {ix["name"] for ix in inspect(bind).get_indexes("conversions")}
+        if MYSQL_FULLTEXT_INDEX not in existing:
+            with bind.begin() as connection:
+                connection.execute(text(f"ALTER TABLE conversions ADD FULLTEXT INDEX {MYSQL_FULLTEXT_INDEX} (text)"))
+    else:
+        logger.warning(f"No full-text index for dialect '{dialect}'; history search uses LIKE.")
+
+
+def apply_search(query, db, search: str, rank: bool = True):
+    """
+    Filters a Conversion query to rows matching every word of `search` (as word prefixes)
+    and, with `rank`, orders them by relevance. Returns the query and whether it is ordered.
+    """
+    terms = _TERM.findall(search)
+    dialect = db.get_bind().dialect.name
+
+    if terms and dialect == "sqlite":
+        fts_query = " AND ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+        fts = literal_column("conversions_fts")
+        query = (
+            query.join(conversions_fts, conversions_fts.c.rowid == Conversion.id)
+            .filter(fts.op("MATCH")(fts_query))
+        )
+        if not rank:
+            return query, False
+        # bm25: lower is more relevant
+        return query.order_by(literal_column("bm25(conversions_fts)").asc(), Conversion.created_at.desc()), True
+
+    if terms and dialect == "mysql" and all(len(term) >= MYSQL_MIN_TOKEN for term in terms):
+        relevance = match(Conversion.text, against=" ".join(f"+{term}*" for term in terms)).in_boolean_mode()
+        query = query.filter(relevance)
+        if not rank:
+            return query, False
+        return query.order_by(relevance.desc(), Conversion.created_at.desc()), True
+
+    return query.filter(Conversion.text.contains(search)), False
+
+
+def day_range(day: str):
+    """[start, end) of a YYYY-MM-DD day, so the filter can use the created_at index."""
+    try:
+        start = datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+    return start, start + timedelta(days=1)
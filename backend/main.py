@@ -1,7 +1,11 @@
 import os
 import sys
-import boto3
 import re
+import asyncio
+from pathlib import Path
+
+# Imported first so the startup profile covers everything below
+from startup_profile import startup
 
 if os.name != 'nt':
     # 1. FORCE SYSTEM PATHS AT THE OS LEVEL (Linux/Server only)
@@ -12,85 +16,72 @@ if os.name != 'nt':
     # Linux-only: set ffmpeg paths if needed by other tools
     pass
 
-# 2. DEBUG PRINT TO VERIFY
-print(f"DEBUG: Current OS PATH: {os.environ['PATH']}")
-
-# 3. NOW LOAD THE REST OF THE APP
-from pathlib import Path
-from dotenv import load_dotenv
-
-env_path = Path(__file__).parent / ".env"
-
-# Robust .env loading
-try:
-    cwd = Path(os.getcwd())
-    paths = [
-        env_path,
-        cwd / ".env",
-        cwd / "backend" / ".env"
-    ]
-    
-    loaded = False
-    for p in paths:
-        if p.exists():
-            print(f"Loading .env from: {p}")
-            load_dotenv(dotenv_path=p, override=True)
-            loaded = True
-            break
-            
-    if not loaded:
-        print("CRITICAL: .env file not found in any expected location!")
-        
-except Exception as e:
-    print(f"Error loading .env: {e}")
-
-# Verify immediately
-if not os.getenv("AZURE_SPEECH_KEY"):
-    print("WARNING: AZURE_SPEECH_KEY not found after loading .env")
-else:
-    print("SUCCESS: AZURE_SPEECH_KEY loaded.")
+# 2. SETTINGS: the .env file is found and loaded once, into config.settings
+from config import settings
+startup.mark("settings")
 
-import sentry_sdk
 import logging
 from fastapi import FastAPI, Depends, HTTPException, status, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
+from fastapi.responses import JSONResponse, HTMLResponse, FileResponse, StreamingResponse, Response
 from sqlalchemy.orm import Session
-from database import engine, Base, get_db
-from models import User, Conversion, PasswordReset, Transaction, PlanLimits, DownloadHistory
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, Base, get_db, get_async_db, run_db
+from models import User, Conversion, PasswordReset, Transaction, PlanLimits, DownloadHistory, ConversionJob
 from schemas import UserCreate, UserOut, Token, ForgotPasswordRequest, ResetPasswordRequest, PlanLimitUpdate, UserProfile
-from auth import hash_password, verify_password, create_access_token, generate_user_id
+from auth import password_hasher, needs_rehash, create_access_token, generate_user_id
 # import azure.cognitiveservices.speech as speechsdk  <-- REMOVED TO FIX GLIBC ERROR
 # Azure Speech SDK NOT used directly to support older Linux versions
 import uuid
 from fastapi.staticfiles import StaticFiles
-from schemas import ConversionCreate, ConversionOut
+from fastapi.concurrency import run_in_threadpool
+from schemas import ConversionCreate, ConversionOut, ConversionJobOut, ConversionPage
 from datetime import datetime, timedelta
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
-from sqlalchemy import func
+from typing import Optional, Union
+from sqlalchemy import func, select, update, or_, and_
 from fastapi.security import OAuth2PasswordBearer
 from auth import verify_token
 import io
+import json
 import traceback
-import pdfplumber
-
-# --- AUTO MIGRATION ---
-# --- AUTO MIGRATION ---
-from auto_migrate import run_auto_migrations
-from utils import check_user_limits, smart_split, send_email
+startup.mark("import: framework")
+
+from utils import check_user_limits, reserve_credits, refund_credits, send_email, get_user_plan, set_user_plan, encode_cursor, decode_cursor
+from synthesis import plan_conversion, prepare_provider, iter_conversion_audio, write_conversion_audio, record_conversion
+import tts_providers
+from token_broker import azure_tokens
+import audio_cache
+import conversion_jobs
+import stats_rollup
+from history_search import apply_search, day_range
+from ssml import build_advanced_ssml
+from plan_cache import plan_limits as plan_limits_cache
 from dependencies import get_current_user
+from user_cache import UserSnapshot, UNCHANGED_OPTION as USER_SNAPSHOTS_UNCHANGED
 import admin_routes
+startup.mark("import: app modules")
 
 # --- 1. SENTRY CONFIGURATION ---
-sentry_sdk.init(
-    dsn="https://802e0792557423aef70c6a49dfe32404@o4510838171107328.ingest.us.sentry.io/4510838173925376",
-    traces_sample_rate=1.0,
-    send_default_pii=True
-)
+# Integrations are listed explicitly: auto-enabling probes (and imports) every library Sentry
+# supports, botocore included, in each new worker. With SENTRY_DSN empty it is not imported at all
+if settings.sentry_dsn:
+    import sentry_sdk
+    from sentry_sdk.integrations.starlette import StarletteIntegration
+    from sentry_sdk.integrations.fastapi import FastApiIntegration
+    from sentry_sdk.integrations.httpx import HttpxIntegration
+    from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+    sentry_sdk.init(
+        dsn=settings.sentry_dsn,
+        traces_sample_rate=settings.sentry_traces_sample_rate,
+        send_default_pii=True,
+        auto_enabling_integrations=False,
+        integrations=[StarletteIntegration(), FastApiIntegration(), HttpxIntegration(), SqlalchemyIntegration()],
+    )
+startup.mark("sentry")
 
 # --- 2. LOGGING CONFIGURATION ---
 logging.basicConfig(
@@ -102,7 +93,10 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
-
+if not settings.env_file:
+    logger.warning("CRITICAL: .env file not found in any expected location!")
+if not os.getenv("AZURE_SPEECH_KEY"):
+    logger.warning("AZURE_SPEECH_KEY not found after loading .env")
 
 
 app = FastAPI()
@@ -111,16 +105,33 @@ app.include_router(admin_routes.router)
 from api.auth_google import router as google_auth_router
 app.include_router(google_auth_router, prefix="/api")
 
-# Handle DB Migrations (Existing Schema Changes)
-# Handle DB Migrations (Existing Schema Changes)
-run_auto_migrations()
+startup.mark("app + routers")
+
+# Migrations (which also create new tables) and plan seeding run once per deploy with
+# `python update_schema.py`, not in every worker; AUTO_MIGRATE=1 runs them here instead
+if settings.auto_migrate:
+    from auto_migrate import run_auto_migrations
+    from seed_plans import seed_plans
+    run_auto_migrations()
+    seed_plans()
+    startup.mark("migrations")
 
-# Create NEW Tables (if they don't exist)
-Base.metadata.create_all(bind=engine)
 
-# Seed Plan Limits
-from seed_plans import seed_plans
-seed_plans()
+@app.on_event("startup")
+async def report_startup_profile():
+    # Under uvicorn; passenger_wsgi reports after the first request instead
+    startup.mark("lifespan startup")
+    startup.report()
+
+
+@app.on_event("shutdown")
+async def close_provider_clients():
+    # Release pooled keep-alive connections to Azure held by this event loop
+    azure_tokens.shutdown()
+    # Running jobs are picked up again by the next process once they go stale
+    conversion_jobs.shutdown()
+    password_hasher.shutdown()
+    await tts_providers.aclose()
 
 
 # --- 3. GLOBAL ERROR CATCHER ---
@@ -144,6 +155,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read by the frontend from cross-origin responses
+    expose_headers=["X-Audio-Url", "X-Next-Cursor"],
 )
 
 @app.exception_handler(RequestValidationError)
@@ -164,14 +177,24 @@ def health_check():
 # --- AUTH ROUTES ---
 
 @app.post("/api/signup", response_model=UserOut)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: Session = Depends(get_db)):
+    existing_user = await run_in_threadpool(db.query(User.id).filter(User.email == user.email).first)
+    if existing_user:
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    # bcrypt runs in the password pool, not on the request threads
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except ValueError as e:
+        logger.error(f"Signup Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return await run_in_threadpool(create_account, user, hashed_password, db)
+
+
+def create_account(user: UserCreate, hashed_password: str, db: Session):
+    """The blocking part of signup: creates the user with its Basic plan and sends the welcome email."""
     try:
-        existing_user = db.query(User).filter(User.email == user.email).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Email already registered")
-        
-        hashed_password = hash_password(user.password)
-        
         for _ in range(5):
              new_id = generate_user_id()
              if not db.query(User).filter(User.id == new_id).first():
@@ -188,15 +211,9 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
              logger.error(f"Error creating user in DB: {str(e)}")
              raise HTTPException(status_code=500, detail=f"Database Error (User Creation): {str(e)}")
 
-        # 2. Create Transaction
+        # 2. Create Transaction (and set the user's current plan with it)
         try:
-            new_transaction = Transaction(
-                user_id=new_id,
-                plan_type='basic',
-                amount=0,
-                timestamp=datetime.utcnow()
-            )
-            db.add(new_transaction)
+            set_user_plan(db, db_user, 'basic')
             db.flush() # Verify transaction creation
         except Exception as e:
              logger.error(f"Error creating transaction: {str(e)}")
@@ -242,46 +259,66 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
         logger.error(f"Signup Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def store_rehashed_password(db: Session, user_id: str, old_hash: str, new_hash: str):
+    # Only if the password was not changed meanwhile; a cost upgrade is not a user change
+    # the snapshot cache has to hear about
+    db.execute(
+        update(User)
+        .where(User.id == user_id, User.hashed_password == old_hash)
+        .values(hashed_password=new_hash)
+        .execution_options(synchronize_session=False, **{USER_SNAPSHOTS_UNCHANGED: True})
+    )
+    db.commit()
+
+
 @app.post("/api/login", response_model=Token)
-def login(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def login(user: UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(db.query(User).filter(User.email == user.email).first)
     if not db_user:
         raise HTTPException(status_code=400, detail="Email is not registered")
-    if not verify_password(user.password, db_user.hashed_password):
+    if not await password_hasher.verify(user.password, db_user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid password")
-    
-    access_token = create_access_token(data={"sub": str(db_user.id)})
+
+    # Upgrade hashes made with another BCRYPT_ROUNDS while we have the plain password
+    if needs_rehash(db_user.hashed_password):
+        new_hash = await password_hasher.hash(user.password)
+        await run_in_threadpool(store_rehashed_password, db, db_user.id, db_user.hashed_password, new_hash)
+        logger.info(f"Upgraded password hash of user {db_user.id}.")
     
     # Get user plan
-    latest_tx = db.query(Transaction).filter(Transaction.user_id == db_user.id).order_by(Transaction.timestamp.desc()).first()
-    plan_type = latest_tx.plan_type if latest_tx else "Basic"
+    plan_type = await run_in_threadpool(get_user_plan, db, db_user)
+
+    # The token carries the claims hot endpoints need (see dependencies.get_current_user)
+    access_token = create_access_token(data=UserSnapshot.from_user(db_user, plan_type).claims())
     
     return {"access_token": access_token, "token_type": "bearer", "plan_type": plan_type}
 
 @app.get("/api/me", response_model=UserProfile)
-def get_current_user_profile(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Get user plan from latest transaction
-    latest_tx = db.query(Transaction).filter(Transaction.user_id == current_user.id).order_by(Transaction.timestamp.desc()).first()
-    plan_type = latest_tx.plan_type if latest_tx else "Basic"
+async def get_current_user_profile(db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)):
+    # Credits change with every conversion, so the profile reads the row itself
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Get user plan
+    plan_type = await db.run_sync(get_user_plan, user)
     
     # Ensure proper capitalization ("Basic", "Free", "Plus", "Pro") matches the DB seeding
     plan_type = plan_type.capitalize()
     
-    # Get plan limits
-    plan_limits = db.query(PlanLimits).filter(PlanLimits.plan_name == plan_type).first()
-    if not plan_limits:
-        plan_limits = db.query(PlanLimits).filter(PlanLimits.plan_name == "Basic").first()
+    # Get plan limits (cached; falls back to Basic)
+    plan_limits = await db.run_sync(plan_limits_cache.get, plan_type)
     
     credit_limit = plan_limits.credit_limit if plan_limits else 0
 
     return UserProfile(
-        id=current_user.id,
-        email=current_user.email,
-        is_admin=current_user.is_admin,
+        id=user.id,
+        email=user.email,
+        is_admin=user.is_admin,
         plan_type=plan_type,
-        credits_used=current_user.credits_used or 0,
+        credits_used=user.credits_used or 0,
         credit_limit=credit_limit,
-        member_since=current_user.created_at.isoformat() if current_user.created_at else None
+        member_since=user.created_at.isoformat() if user.created_at else None
     )
 
 @app.post("/api/forgot-password")
@@ -309,68 +346,71 @@ def forgot_password(request: ForgotPasswordRequest, req: Request, db: Session =
         logger.error(f"Email error: {str(e)}")
         return {"message": "Error sending email"}
 
-@app.post("/api/reset-password")
-def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db)):
-    reset_entry = db.query(PasswordReset).filter(PasswordReset.token == request.token).first()
-    if not reset_entry or reset_entry.expires_at < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Invalid or expired token")
-        
+def apply_password_reset(db: Session, reset_entry: PasswordReset, hashed_password: str):
     user = db.query(User).filter(User.email == reset_entry.email).first()
     if user:
-        user.hashed_password = hash_password(request.new_password)
+        user.hashed_password = hashed_password
         db.delete(reset_entry)
         db.commit()
+
+
+@app.post("/api/reset-password")
+async def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db)):
+    reset_entry = await run_in_threadpool(db.query(PasswordReset).filter(PasswordReset.token == request.token).first)
+    if not reset_entry or reset_entry.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Invalid or expired token")
+
+    hashed_password = await password_hasher.hash(request.new_password)
+    await run_in_threadpool(apply_password_reset, db, reset_entry, hashed_password)
     return {"message": "Password updated successfully"}
 
 # --- ADMIN ROUTES ---
 
 @app.get("/api/admin/stats")
-def get_admin_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_admin_stats(db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
     # 1. Check if user is admin
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
 
-    # 2. Total Users Count
-    total_users = db.query(User).count()
-
-    # 3. Total Earnings (Sum of all transactions)
-    total_earnings_result = db.query(func.sum(Transaction.amount)).scalar()
-    total_earnings = total_earnings_result if total_earnings_result else 0.0
+    # 2. Totals and plan breakdown from the rollup table (kept current on every insert)
+    stats = stats_rollup.read(db)
 
-    # 4. User Plan Breakdown
-    plan_counts = db.query(Transaction.plan_type, func.count(Transaction.plan_type))\
-        .group_by(Transaction.plan_type).all()
-    user_plan_breakdown = {plan: count for plan, count in plan_counts}
+    # 3. Recent Activity (newest conversions with their user's email, one query)
+    recent_activity = db.execute(
+        select(Conversion.id, func.substr(Conversion.text, 1, 20).label("snippet"), Conversion.created_at, User.email)
+        .outerjoin(User, User.id == Conversion.user_id)
+        .order_by(Conversion.id.desc())  # ids follow creation order and use the primary key
+        .limit(5)
+    ).all()
 
-    # 5. Recent Activity
-    recent_activity = db.query(Conversion).order_by(Conversion.created_at.desc()).limit(5).all()
-    
     activity_data = []
     for item in recent_activity:
-        user = db.query(User).filter(User.id == item.user_id).first()
         activity_data.append({
             "id": item.id,
-            "user": user.email if user else "Unknown",
+            "user": item.email or "Unknown",
             "action": "Conversion",
-            "details": f"Generated audio: {item.text[:20]}...",
-            "date": item.created_at.isoformat()
+            "details": f"Generated audio: {item.snippet or ''}...",
+            "date": item.created_at.isoformat() if item.created_at else None
         })
 
     return {
-        "totalUsers": total_users,
-        "totalEarnings": total_earnings,
-        "userPlanBreakdown": user_plan_breakdown,
+        "totalUsers": stats[stats_rollup.USERS],
+        "totalEarnings": stats[stats_rollup.EARNINGS],
+        "userPlanBreakdown": stats[stats_rollup.PLAN_TRANSACTIONS],
+        "totalConversions": stats[stats_rollup.CONVERSIONS],
+        "dailyRevenue": stats[stats_rollup.REVENUE_DAY],
+        "dailyConversions": stats[stats_rollup.CONVERSIONS_DAY],
         "recentActivity": activity_data
     }
 
 @app.get("/api/admin/plans")
-def get_plans(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_plans(db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
     return db.query(PlanLimits).all()
 
 @app.put("/api/admin/plans/{plan_name}")
-def update_plan(plan_name: str, plan_update: PlanLimitUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_plan(plan_name: str, plan_update: PlanLimitUpdate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
     if not current_user.is_admin:
          raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
     
@@ -382,6 +422,7 @@ def update_plan(plan_name: str, plan_update: PlanLimitUpdate, db: Session = Depe
     plan.history_days = plan_update.history_days
     
     db.commit()
+    plan_limits_cache.invalidate()
     db.refresh(plan)
     return plan
 
@@ -407,6 +448,8 @@ async def extract_pdf(file: UploadFile = File(...)):
 
     # 2. Extract text from all pages
     try:
+        # Imported on first use: pdfplumber (and pdfminer) would add to every cold start
+        import pdfplumber
         with pdfplumber.open(file.file) as pdf:
             raw_pages = []
             for page in pdf.pages:
@@ -445,268 +488,102 @@ static_path = Path(__file__).parent / "static"
 static_path.mkdir(exist_ok=True)
 
 
-def build_advanced_ssml(text, voice_name, style_degree, prosody):
-    """
-    Converts text with custom tags [voice], [style], [break] into valid Azure SSML.
-    Uses a state-aware approach to handle nesting and ensure valid XML hierarchy.
-    """
-    # 1. Default Prosody Values
-    rate = prosody.get("rate", "medium") if prosody else "medium"
-    pitch = prosody.get("pitch", "medium") if prosody else "medium"
-    # Ensure percentages/semitones are handled if passed as integers/floats
-    if isinstance(rate, (int, float)): rate = f"{rate}%"
-    if isinstance(pitch, (int, float)): pitch = f"{pitch}st"
-
-    # 2. Atomic Replacements (Breaks)
-    text = re.sub(r"\[break:(.*?)\]", r'<break time="\1" />', text)
-
-    # 3. State Tracking for Segmentation
-    active_voice = voice_name
-    active_style = None
-    
-    # Split text by voice or style tags to process chronologically
-    pattern = r'(\[voice:.*?\]|\[/voice\]|\[style:.*?\]|\[/style\])'
-    parts = re.split(pattern, text, flags=re.DOTALL)
-    
-    ssml_body = []
-
-    def open_segment(v, s):
-        """Helper to open voice and prosody wrappers, and optional style."""
-        seg = f'<voice name="{v}"><prosody rate="{rate}" pitch="{pitch}">'
-        if s:
-            # Add styledegree if provided and valid
-            degree_attr = f' styledegree="{style_degree}"' if style_degree and style_degree != 1.0 else ""
-            seg += f'<mstts:express-as style="{s}"{degree_attr}>'
-        return seg
-
-    def close_segment(s):
-        """Helper to close current style and voice/prosody wrappers."""
-        seg = ""
-        if s:
-            seg += '</mstts:express-as>'
-        seg += '</prosody></voice>'
-        return seg
-
-    # Start the first segment with the default speaker
-    ssml_body.append(open_segment(active_voice, active_style))
-
-    for part in parts:
-        if not part:
-            continue
-
-        # Detect Control Tags
-        v_start = re.match(r'\[voice:(.*?)\]', part)
-        v_end = (part == '[/voice]')
-        s_start = re.match(r'\[style:(.*?)\]', part)
-        s_end = (part == '[/style]')
-
-        if v_start:
-            # Switch Speaker: Close current, update voice, re-open
-            ssml_body.append(close_segment(active_style))
-            active_voice = v_start.group(1)
-            ssml_body.append(open_segment(active_voice, active_style))
-        elif v_end:
-            # Revert to Default Speaker
-            ssml_body.append(close_segment(active_style))
-            active_voice = voice_name
-            ssml_body.append(open_segment(active_voice, active_style))
-        elif s_start:
-            # Apply Style: Inject tag (already inside voice/prosody)
-            active_style = s_start.group(1)
-            degree_attr = f' styledegree="{style_degree}"' if style_degree and style_degree != 1.0 else ""
-            ssml_body.append(f'<mstts:express-as style="{active_style}"{degree_attr}>')
-        elif s_end:
-            # End Style
-            ssml_body.append('</mstts:express-as>')
-            active_style = None
-        else:
-            # Raw Text or Break Tag
-            ssml_body.append(part)
+def new_audio_location(user_id):
+    """Picks the per-user, per-month path (and its public URL) for a new conversion."""
+    now = datetime.now()
+    month_year = now.strftime("%B-%Y")
+    user_folder = str(user_id)
+    audio_base_path = static_path / "audio" / month_year / user_folder
+    audio_base_path.mkdir(parents=True, exist_ok=True)
+    filename = now.strftime("%b-%d_%H-%M-%S") + ".mp3"
+    return audio_base_path / filename, f"/static/audio/{month_year}/{user_folder}/{filename}", now
 
-    # Final close
-    ssml_body.append(close_segment(active_style))
 
-    # 4. Construct Final SSML
-    full_body = "".join(ssml_body)
-    ssml = f"""<speak version='1.0' xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="https://www.w3.org/2001/mstts" xml:lang='en-US'>{full_body}</speak>"""
-    
-    return ssml.strip()
+async def refund(db, user_id: str, amount: int):
+    await run_db(db, lambda session: refund_credits(user_id, session, amount))
 
 
-@app.post("/api/convert", response_model=ConversionOut)
-def convert_text(conversion: ConversionCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def plan_request(conversion: ConversionCreate):
+    return plan_conversion(
+        conversion.text, conversion.engine, conversion.voice_id,
+        conversion.style_degree, conversion.prosody
+    )
+
+
+async def start_conversion(conversion: ConversionCreate, db, current_user: User, reserve: bool = True):
+    """
+    Shared validation for the conversion endpoints. Returns the resolved plan.
+    With `reserve`, the credits are charged now; the caller refunds them if the
+    conversion fails.
+    """
     if not conversion.text.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty")
-    
-    # Check Plan Limits
-    chars = len(conversion.text)
-    limit_check = check_user_limits(current_user.id, db, chars)
+
+    # Check Plan Limits (atomically reserving the credits)
+    limiter = reserve_credits if reserve else check_user_limits
+    limit_check = await run_db(db, lambda session: limiter(current_user.id, session, len(conversion.text)))
     if not limit_check['allowed']:
         raise HTTPException(status_code=403, detail=limit_check['reason'])
 
-    # Determine Engine
-    engine_type = conversion.engine.lower() if conversion.engine else "neural"
-    
-    # Define TTS Converter Function Placeholder
-    convert_single_chunk = None
-
-    # --- AZURE IMPLEMENTATION ---
-    if engine_type == "neural":
-        import requests
-        speech_key = os.getenv("AZURE_SPEECH_KEY")
-        service_region = os.getenv("AZURE_SPEECH_REGION")
-
-        if not speech_key or not service_region:
-             logger.error(f"AZURE CONFIGURATION MISSING. Key: {bool(speech_key)}, Region: {service_region}")
-             raise HTTPException(status_code=500, detail="Azure Configuration Error")
-
-        # Get Access Token
-        token_url = f"https://{service_region}.api.cognitive.microsoft.com/sts/v1.0/issueToken"
-        headers = { "Ocp-Apim-Subscription-Key": speech_key }
-        try:
-            token_response = requests.post(token_url, headers=headers)
-            token_response.raise_for_status()
-            access_token = token_response.text
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to get Azure Token: {e}")
-            raise HTTPException(status_code=500, detail="Text-to-Speech Service Unavailable (Azure)")
-
-        def azure_tts(text_chunk, voice_name_param, output_file, style_degree, prosody):
-            tts_url = f"https://{service_region}.tts.speech.microsoft.com/cognitiveservices/v1"
-            ssml = build_advanced_ssml(text_chunk, voice_name_param, style_degree, prosody)
-            
-            # --- DEBUG: LOG SSML ---
-            logger.info(f"\n[DEBUG] Azure SSML Payload:\n{ssml}\n")
-            
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/ssml+xml",
-                "X-Microsoft-OutputFormat": "audio-16khz-128kbitrate-mono-mp3",
-                "User-Agent": "PollyGlot"
-            }
-            response = requests.post(tts_url, headers=headers, data=ssml.encode('utf-8'))
-            if response.status_code == 200:
-                with open(output_file, 'wb') as audio:
-                    audio.write(response.content)
-                return True
-            else:
-                logger.error(f"TTS REST Error {response.status_code}: {response.text}")
-                return False
-        
-        convert_single_chunk = azure_tts
+    try:
+        return plan_request(conversion)
+    except HTTPException:
+        if reserve:
+            await refund(db, current_user.id, len(conversion.text))
+        raise
 
-    # --- AWS POLLY IMPLEMENTATION ---
-    elif engine_type == "standard":
-        # Check AWS Credentials Existence
-        if not os.getenv("AWS_ACCESS_KEY_ID") and not os.getenv("AWS_PROFILE"):
-             logger.warning("AWS Credentials might be missing. Proceeding with boto3 defaults.")
 
-        def aws_tts(text_chunk, voice_name_param, output_file, style_degree, prosody):
-            try:
-                # explicitly get region
-                aws_region = os.getenv("AWS_REGION", "us-east-1")
-                
-                # Use default Boto3 session (checks env vars, config files, etc.)
-                polly_client = boto3.client('polly', region_name=aws_region)
-                
-                response = polly_client.synthesize_speech(
-                    Text=text_chunk,
-                    OutputFormat='mp3',
-                    VoiceId=voice_name_param,
-                    Engine='standard'
-                )
-                
-                if "AudioStream" in response:
-                    with open(output_file, 'wb') as file:
-                        file.write(response['AudioStream'].read())
-                    return True
-                return False
-            except Exception as e:
-                logger.error(f"AWS Polly Error: {e}")
-                return False
-        
-        convert_single_chunk = aws_tts
-        
-    else:
-        raise HTTPException(status_code=400, detail=f"Unsupported engine: {engine_type}")
+async def produce_conversion(conversion: ConversionCreate, plan, db, current_user: User) -> ConversionOut:
+    """
+    Synthesizes (or reuses) the audio, saves it and records the Conversion row.
+    The credits must already be reserved; they are refunded if anything fails.
+    """
+    chars = len(conversion.text)
+
+    try:
+        return await _produce_conversion(conversion, plan, db, current_user)
+    except BaseException:
+        await asyncio.shield(refund(db, current_user.id, chars))
+        raise
 
 
+async def _produce_conversion(conversion: ConversionCreate, plan, db, current_user: User) -> ConversionOut:
     try:
         # Determine output path (Shared Logic)
-        voice_name = conversion.voice_id or ("en-US-JennyNeural" if engine_type == "neural" else "Joanna")
-        now = datetime.now()
-        month_year = now.strftime("%B-%Y")
-        user_folder = str(current_user.id)
-        audio_base_path = static_path / "audio" / month_year / user_folder
-        audio_base_path.mkdir(parents=True, exist_ok=True)
-        filename = now.strftime("%b-%d_%H-%M-%S") + ".mp3"
-        file_path = audio_base_path / filename
-
-        # --- SMART SPLIT & MERGE ---
-        if len(conversion.text) > 3000:
-            chunks = smart_split(conversion.text)
-            logger.info(f"Text too long, split into {len(chunks)} chunks.")
-            
-            # Collect raw MP3 binary data from each chunk (no ffmpeg needed)
-            combined_mp3_bytes = bytearray()
-            
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip():
-                    continue
-                
-                temp_filename = f"temp_{current_user.id}_{i}_{now.timestamp()}.mp3"
-                temp_path = audio_base_path / temp_filename
-                
-                # CALL ENGINE API
-                success = convert_single_chunk(chunk, voice_name, str(temp_path), conversion.style_degree, conversion.prosody)
-                
-                if success:
-                    try:
-                        with open(str(temp_path), 'rb') as f:
-                            combined_mp3_bytes += f.read()
-                        logger.info(f"Processed chunk {i+1}/{len(chunks)}")
-                    except Exception as e:
-                        logger.error(f"Error reading chunk audio: {e}")
-                        raise
-                    finally:
-                        if temp_path.exists():
-                            try:
-                                os.remove(temp_path)
-                            except:
-                                pass
-                else:
-                    raise Exception("Failed to convert chunk via API")
-
-            # Write the concatenated MP3 bytes directly — no ffmpeg needed
-            with open(str(file_path), 'wb') as f:
-                f.write(combined_mp3_bytes)
-            logger.info(f"Merged {len(chunks)} chunks into: {file_path}")
-            
+        file_path, audio_url, now = new_audio_location(current_user.id)
+
+        # --- SYNTHESIS CACHE ---
+        # Identical provider input + output format means identical audio: reuse it
+        cached_entry = await run_db(db, audio_cache.lookup, plan.cache_key)
+
+        if cached_entry:
+            await run_in_threadpool(audio_cache.materialize, cached_entry, file_path)
+            logger.info(f"Synthesis cache hit ({plan.cache_key[:12]}). Audio saved at: {file_path}")
+
         else:
-            # --- SINGLE CALL ---
-            success = convert_single_chunk(conversion.text, voice_name, str(file_path), conversion.style_degree, conversion.prosody)
-            if success:
-                logger.info(f"Conversion successful. Audio saved at: {file_path}")
-            else:
-                 raise HTTPException(status_code=500, detail="Failed to generate audio")
-            
-        audio_url = f"/static/audio/{month_year}/{user_folder}/{filename}"
-        
-        db_conversion = Conversion(
-            text=conversion.text, audio_url=audio_url, 
-            voice_name=voice_name, user_id=current_user.id, created_at=now
+            await prepare_provider(plan)
+
+            # Chunks go to the provider in parallel; their MP3 streams are appended to the
+            # output file in original order — no ffmpeg, no temp files, no in-memory copy
+            try:
+                await write_conversion_audio(plan, file_path)
+            except tts_providers.ProviderError as e:
+                if len(plan.payloads) > 1:
+                    raise
+                logger.error(f"Single-call synthesis failed: {e}")
+                raise HTTPException(status_code=500, detail="Failed to generate audio")
+
+            logger.info(f"Conversion successful ({len(plan.payloads)} chunks). Audio saved at: {file_path}")
+
+            await run_db(db, audio_cache.store, plan.cache_key, file_path)
+
+        db_conversion = await run_db(
+            db, record_conversion, current_user, conversion.text, plan, audio_url, now, cached_entry
         )
-        db.add(db_conversion)
-        
-        # Increment Credits
-        current_user.credits_used = (current_user.credits_used or 0) + chars
-        
-        db.commit()
-        db.refresh(db_conversion)
         
         return ConversionOut(
             id=db_conversion.id, text=db_conversion.text, voice_name=db_conversion.voice_name,
-            engine=engine_type, # Add engine to output
+            engine=plan.engine_type, # Add engine to output
             audio_url=audio_url, created_at=db_conversion.created_at.isoformat()
         )
     except HTTPException as e:
@@ -716,36 +593,235 @@ def convert_text(conversion: ConversionCreate, db: Session = Depends(get_db), cu
         logger.error(f"Conversion Error: {e}\nTraceback:\n{error_trace}")
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
-@app.get("/api/history", response_model=list[ConversionOut])
-def get_history(
+
+@app.post("/api/convert", response_model=ConversionOut)
+async def convert_text(conversion: ConversionCreate, db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)):
+    plan = await start_conversion(conversion, db, current_user)
+    return await produce_conversion(conversion, plan, db, current_user)
+
+
+# --- BACKGROUND CONVERSION JOBS ---
+
+def find_user(db: Session, user_id: str) -> Optional[User]:
+    return db.query(User).filter(User.id == user_id).first()
+
+
+async def run_conversion_job(job: ConversionJob, db: Session) -> int:
+    """Job handler: runs a queued request through the same pipeline as /api/convert."""
+    # Off the event loop, like every other database call of the async handlers
+    user = await run_db(db, find_user, job.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    conversion = ConversionCreate.model_validate_json(job.request)
+
+    # 1. Credits are reserved when the job runs, so queued jobs cannot overspend either.
+    #    Only once per job: a retry reuses what the attempt that died had reserved
+    if not job.reserved:
+        limit_check = await run_db(db, conversion_jobs.reserve, job, len(conversion.text))
+        if not limit_check['allowed']:
+            raise HTTPException(status_code=403, detail=limit_check['reason'])
+
+    # 2. Same pipeline as /api/convert; a failed job gives its credits back
+    try:
+        plan = plan_request(conversion)
+        result = await _produce_conversion(conversion, plan, db, user)
+    except BaseException:
+        await asyncio.shield(run_db(db, conversion_jobs.release_reservation, job))
+        raise
+    return result.id
+
+
+def job_out(job: ConversionJob, db: Session) -> ConversionJobOut:
+    result = None
+    if job.conversion_id:
+        conv = db.query(Conversion).filter(Conversion.id == job.conversion_id).first()
+        if conv:
+            result = ConversionOut(
+                id=conv.id, text=conv.text, voice_name=conv.voice_name,
+                engine=json.loads(job.request).get("engine"),
+                audio_url=conv.audio_url, created_at=conv.created_at.isoformat()
+            )
+    return ConversionJobOut(
+        job_id=job.id, status=job.status, error=job.error,
+        created_at=job.created_at.isoformat(),
+        finished_at=job.finished_at.isoformat() if job.finished_at else None,
+        conversion=result,
+    )
+
+
+@app.post("/api/convert/jobs", response_model=ConversionJobOut, status_code=202)
+async def create_conversion_job(conversion: ConversionCreate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
+    """
+    Queues a conversion and returns immediately. Poll GET /api/convert/jobs/{job_id}
+    until the status is 'done' (conversion attached) or 'failed' (error attached).
+    """
+    # Validate up front so bad requests fail now rather than in the queue
+    await start_conversion(conversion, db, current_user, reserve=False)
+    job = await run_in_threadpool(conversion_jobs.enqueue, db, current_user.id, conversion.model_dump_json())
+    conversion_jobs.ensure_workers(run_conversion_job)
+    return job_out(job, db)
+
+
+def find_job(db: Session, job_id: str, user_id: str) -> Optional[ConversionJobOut]:
+    job = db.query(ConversionJob).filter(ConversionJob.id == job_id, ConversionJob.user_id == user_id).first()
+    return job_out(job, db) if job else None
+
+
+@app.get("/api/convert/jobs/{job_id}", response_model=ConversionJobOut)
+async def get_conversion_job(job_id: str, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
+    result = await run_in_threadpool(find_job, db, job_id, current_user.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # The process that queued it may be gone (Passenger recycles idle ones): whoever is
+    # polled works the queue
+    if result.status in ("queued", "running"):
+        conversion_jobs.ensure_workers(run_conversion_job)
+    return result
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    # Under uvicorn/serve.py: jobs left queued by a stopped process need no new POST
+    conversion_jobs.ensure_workers(run_conversion_job)
+
+
+# Background persistence tasks of streamed conversions (kept referenced until done)
+_stream_writers = set()
+
+@app.post("/api/convert/stream")
+async def convert_text_stream(conversion: ConversionCreate, db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)):
+    """
+    Same conversion as /api/convert, but MP3 bytes are streamed (chunked transfer) as soon as
+    the first chunk arrives from the provider. The full file and the Conversion row are written
+    alongside the stream; X-Audio-Url tells the client where the saved file will live.
+    """
+    plan = await start_conversion(conversion, db, current_user)
+    chars = len(conversion.text)
+    file_path, audio_url, now = new_audio_location(current_user.id)
+    headers = {"X-Audio-Url": audio_url, "Cache-Control": "no-store"}
+
+    try:
+        cached_entry = await run_db(db, audio_cache.lookup, plan.cache_key)
+        if cached_entry:
+            await run_in_threadpool(audio_cache.materialize, cached_entry, file_path)
+            await run_db(
+                db, record_conversion, current_user, conversion.text, plan, audio_url, now, cached_entry
+            )
+            return FileResponse(file_path, media_type="audio/mpeg", headers=headers)
+
+        # Fail with a proper status code (e.g. Azure token errors) before any audio is sent
+        await prepare_provider(plan)
+    except BaseException:
+        await asyncio.shield(refund(db, current_user.id, chars))
+        raise
+
+    pieces = asyncio.Queue()
+    listener = {"connected": True}
+
+    async def write_and_record():
+        """Producer: synthesizes in order, appends to the file and records the conversion."""
+        output = await run_in_threadpool(open, file_path, "wb")
+        try:
+            async for piece in iter_conversion_audio(plan):
+                await run_in_threadpool(output.write, piece)
+                if listener["connected"]:
+                    pieces.put_nowait(piece)
+            await run_in_threadpool(output.close)
+            await run_db(db, audio_cache.store, plan.cache_key, file_path)
+            await run_db(
+                db, record_conversion, current_user, conversion.text, plan, audio_url, now
+            )
+            logger.info(f"Streamed conversion saved at: {file_path}")
+        except BaseException as e:
+            output.close()
+            file_path.unlink(missing_ok=True)
+            logger.error(f"Streaming conversion failed: {e}")
+            await asyncio.shield(refund(db, current_user.id, chars))
+            raise
+        finally:
+            pieces.put_nowait(None)
+
+    writer = asyncio.ensure_future(write_and_record())
+    _stream_writers.add(writer)
+    writer.add_done_callback(_stream_writers.discard)
+
+    async def stream_pieces():
+        try:
+            while True:
+                piece = await pieces.get()
+                if piece is None:
+                    break
+                yield piece
+        finally:
+            # The client may have gone away: persistence still finishes, and the request's
+            # DB session stays open until it does. A failed writer aborts the (truncated) stream.
+            listener["connected"] = False
+            await asyncio.shield(writer)
+
+    return StreamingResponse(stream_pieces(), media_type="audio/mpeg", headers=headers)
+
+@app.get("/api/history", response_model=Union[list[ConversionOut], ConversionPage])
+async def get_history(
     page: int = 1, limit: int = 10, search: Optional[str] = None, date: Optional[str] = None,
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)
 ):
+    """
+    Offset mode (`page`) returns a list. Passing `cursor` (empty for the first page)
+    switches to keyset mode: {items, next_cursor}, newest first, stable while new
+    conversions are added.
+    """
+    return await db.run_sync(history_page, current_user, page, limit, search, date, cursor)
+
+
+def history_page(db: Session, current_user: UserSnapshot, page: int, limit: int, search: Optional[str], date: Optional[str], cursor: Optional[str]):
     # 1. Determine User's Plan & History Limit
-    latest_transaction = db.query(Transaction).filter(Transaction.user_id == current_user.id).order_by(Transaction.timestamp.desc()).first()
-    current_plan_name = latest_transaction.plan_type if latest_transaction else "Basic"
-    current_plan_name = current_plan_name.capitalize()
+    current_plan_name = get_user_plan(db, current_user).capitalize()
     
-    plan_limits = db.query(PlanLimits).filter(PlanLimits.plan_name == current_plan_name).first()
+    plan_limits = plan_limits_cache.get(db, current_plan_name, fallback=None)
     history_days = plan_limits.history_days if plan_limits else 7 # Default to 7 days if something goes wrong
     
     # Calculate cutoff date
     cutoff_date = datetime.utcnow() - timedelta(days=history_days)
 
-    offset_val = (page - 1) * limit
-    
     # 2. Build Query with Time Limit
     query = db.query(Conversion).filter(
         Conversion.user_id == current_user.id,
         Conversion.created_at >= cutoff_date 
     )
     
-    if search:
-        query = query.filter(Conversion.text.contains(search))
     if date:
-        query = query.filter(func.date(Conversion.created_at) == date)
-        
-    conversions = query.order_by(Conversion.created_at.desc()).offset(offset_val).limit(limit).all()
+        # Range instead of DATE(created_at) so (user_id, created_at) stays usable
+        day_start, day_end = day_range(date)
+        query = query.filter(Conversion.created_at >= day_start, Conversion.created_at < day_end)
+
+    keyset = cursor is not None
+    ranked = False
+    if search:
+        # Full-text index; best matches first unless paging by cursor (newest first)
+        query, ranked = apply_search(query, db, search, rank=not keyset)
+
+    if keyset:
+        # 3a. Seek past the last row sent: (user_id, created_at[, id]) index range, no OFFSET
+        if cursor:
+            last_created, last_id = decode_cursor(cursor)
+            try:
+                last_created = datetime.fromisoformat(last_created)
+                last_id = int(last_id)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.filter(or_(
+                Conversion.created_at < last_created,
+                and_(Conversion.created_at == last_created, Conversion.id < last_id),
+            ))
+        conversions = query.order_by(Conversion.created_at.desc(), Conversion.id.desc()).limit(limit + 1).all()
+        has_more = len(conversions) > limit
+        conversions = conversions[:limit]
+    else:
+        # 3b. Offset mode
+        if not ranked:
+            query = query.order_by(Conversion.created_at.desc())
+        conversions = query.offset((page - 1) * limit).limit(limit).all()
     
     results = []
     for c in conversions:
@@ -754,11 +830,16 @@ def get_history(
             audio_url=c.audio_url, 
             created_at=c.created_at.isoformat() if c.created_at else datetime.now().isoformat()
         ))
-    return results
+
+    if not keyset:
+        return results
+    last = conversions[-1] if conversions else None
+    next_cursor = encode_cursor(last.created_at.isoformat(), last.id) if has_more else None
+    return ConversionPage(items=results, next_cursor=next_cursor)
 
 
 @app.post("/api/history", response_model=ConversionOut)
-def save_history(conversion: ConversionCreate, audio_url: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def save_history(conversion: ConversionCreate, audio_url: str, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
     try:
         now = datetime.now()
         db_conversion = Conversion(
@@ -783,14 +864,90 @@ def save_history(conversion: ConversionCreate, audio_url: str, db: Session = Dep
         raise HTTPException(status_code=500, detail="Failed to save history")
 
 
+@app.delete("/api/history/{conversion_id}", status_code=204)
+def delete_history(conversion_id: int, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)):
+    conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+    if not conversion:
+        raise HTTPException(status_code=404, detail="Conversion not found")
+    if conversion.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Forbidden: You do not own this file")
+
+    # 1. Rows pointing at the conversion, then the conversion and its cache reference
+    db.query(DownloadHistory).filter(DownloadHistory.conversion_id == conversion.id).delete(synchronize_session=False)
+    db.query(ConversionJob).filter(ConversionJob.conversion_id == conversion.id).update(
+        {ConversionJob.conversion_id: None}, synchronize_session=False
+    )
+    if conversion.cache_key:
+        audio_cache.release(db, conversion.cache_key)
+    audio_url = conversion.audio_url
+    db.delete(conversion)
+    db.commit()
+
+    # 2. The user's own copy of the audio (the cache keeps its artifact until evicted)
+    if audio_url and audio_url.startswith("/static/audio/"):
+        (static_path / "audio" / audio_url.replace("/static/audio/", "")).unlink(missing_ok=True)
+    return Response(status_code=204)
+
+
 # --- STATIC & FRONTEND SERVING ---
 
+# --- AUDIO DELIVERY ---
+# Saved audio never changes once written, so clients may cache it for good
+AUDIO_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Optional proxy offload: "x-accel" (nginx) or "x-sendfile" (Apache/lighttpd)
+AUDIO_SENDFILE_MODE = settings.audio_sendfile_mode
+# nginx 'internal' location that maps to static/audio
+AUDIO_ACCEL_PREFIX = settings.audio_accel_prefix
+
+
+async def audio_etag(conversion: Conversion, full_path: Path, db: AsyncSession) -> str:
+    """Strong ETag from the file's content hash, computed once and stored on the row."""
+    if not conversion.content_hash:
+        conversion.content_hash = await run_in_threadpool(audio_cache.file_digest, full_path)
+        try:
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Failed to store content hash for conversion {conversion.id}: {e}")
+    return f'"{conversion.content_hash}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+async def serve_audio(request: Request, conversion: Conversion, full_path: Path, db: AsyncSession, headers: dict = None):
+    """
+    Serves a saved MP3 with validators: 304 for a matching If-None-Match, 206 for Range
+    requests (If-Range aware, handled by FileResponse), or a proxy sendfile hand-off.
+    """
+    etag = await audio_etag(conversion, full_path, db)
+    response_headers = {"ETag": etag, "Cache-Control": AUDIO_CACHE_CONTROL}
+    response_headers.update(headers or {})
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=response_headers)
+
+    if AUDIO_SENDFILE_MODE == "x-accel":
+        relative_path = full_path.relative_to(static_path / "audio").as_posix()
+        response_headers["X-Accel-Redirect"] = AUDIO_ACCEL_PREFIX + relative_path
+        return Response(media_type="audio/mpeg", headers=response_headers)
+    if AUDIO_SENDFILE_MODE == "x-sendfile":
+        response_headers["X-Sendfile"] = str(full_path.resolve())
+        return Response(media_type="audio/mpeg", headers=response_headers)
+
+    return FileResponse(full_path, media_type="audio/mpeg", headers=response_headers)
+
+
 @app.get("/static/audio/{file_path:path}")
-def get_audio_file(file_path: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_audio_file(file_path: str, request: Request, db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)):
     requested_url = f"/static/audio/{file_path}"
     
     # Security check
-    conversion = db.query(Conversion).filter(Conversion.audio_url == requested_url).first()
+    conversion = await db.scalar(select(Conversion).where(Conversion.audio_url == requested_url).limit(1))
     
     if not conversion:
         logger.warning(f"Access denied: No record found for {requested_url}")
@@ -805,12 +962,12 @@ def get_audio_file(file_path: str, db: Session = Depends(get_db), current_user:
     if not full_path.exists() or not full_path.is_file():
          raise HTTPException(status_code=404, detail="File not found on server")
          
-    return FileResponse(full_path)
+    return await serve_audio(request, conversion, full_path, db)
 
 @app.get("/api/download/{conversion_id}")
-def download_conversion(conversion_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def download_conversion(conversion_id: int, request: Request, db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user)):
     # 1. Fetch Conversion Record
-    conversion = db.query(Conversion).filter(Conversion.id == conversion_id).first()
+    conversion = await db.get(Conversion, conversion_id)
     if not conversion:
         raise HTTPException(status_code=404, detail="Conversion not found")
         
@@ -820,16 +977,19 @@ def download_conversion(conversion_id: int, db: Session = Depends(get_db), curre
 
     # 3. Record Download
     # Note: Download limits have been removed, but we still log history.
-    try:
-        new_download = DownloadHistory(
-            user_id=current_user.id,
-            conversion_id=conversion.id,
-            timestamp=datetime.utcnow()
-        )
-        db.add(new_download)
-        db.commit()
-    except Exception as e:
-        logger.error(f"Failed to log download history: {e}")
+    # Resumed downloads (Range past the first byte) continue an already logged one.
+    http_range = request.headers.get("range", "")
+    if not http_range or http_range.replace(" ", "").startswith("bytes=0-"):
+        try:
+            new_download = DownloadHistory(
+                user_id=current_user.id,
+                conversion_id=conversion.id,
+                timestamp=datetime.utcnow()
+            )
+            db.add(new_download)
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to log download history: {e}")
     
     # 4. Serve File
     try:
@@ -839,10 +999,9 @@ def download_conversion(conversion_id: int, db: Session = Depends(get_db), curre
         if not full_path.exists():
             raise HTTPException(status_code=404, detail="Audio file missing from server storage.")
 
-        return FileResponse(
-            full_path, 
-            headers={"Content-Disposition": f"attachment; filename={full_path.name}"},
-            media_type="audio/mpeg"
+        return await serve_audio(
+            request, conversion, full_path, db,
+            headers={"Content-Disposition": f"attachment; filename={full_path.name}"}
         )
     except Exception as e:
         logger.error(f"Download Error: {e}")
@@ -856,11 +1015,10 @@ app.mount("/static", StaticFiles(directory=static_path), name="static")
 # ==========================================
 
 # 1. Get Path from Environment Variable (Best Practice)
-FRONTEND_PATH = os.getenv("FRONTEND_PATH")
+FRONTEND_PATH = settings.frontend_path
 
 if not FRONTEND_PATH:
     logger.warning("FRONTEND_PATH not found in .env file! Frontend may not load.")
-    FRONTEND_PATH = None
 
 # 2. Serve Files if Path Exists
 if FRONTEND_PATH and os.path.exists(FRONTEND_PATH):
@@ -893,3 +1051,5 @@ else:
             "<p>Please check if <b>FRONTEND_PATH</b> is set correctly in your <b>.env</b> file.</p>", 
             status_code=404
         )# Update
+
+startup.mark("routes + frontend")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, UnicodeText, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, UnicodeText, Boolean, Float, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -12,12 +12,20 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     credits_used = Column(Integer, default=0)
+    # Plan of the latest Transaction, kept in step by utils.set_user_plan (see auto_migrate backfill)
+    current_plan = Column(String(50), nullable=True)
+    plan_changed_at = Column(DateTime, nullable=True)
     
     conversions = relationship("Conversion", back_populates="user")
 
 
 class Conversion(Base):
     __tablename__ = "conversions"
+    __table_args__ = (
+        # Audio fetches look conversions up by URL; history lists a user's newest first
+        Index("ix_conversions_audio_url", "audio_url"),
+        Index("ix_conversions_user_id_created_at", "user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -29,6 +37,10 @@ class Conversion(Base):
     audio_url = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     user_id = Column(String(5), ForeignKey("users.id"))
+    # Content address of the synthesized audio in the shared cache (see audio_cache.py)
+    cache_key = Column(String(64), nullable=True, index=True)
+    # sha256 of the saved MP3, used as its strong ETag (filled on first download)
+    content_hash = Column(String(64), nullable=True)
     
     user = relationship("User", back_populates="conversions")
 
@@ -45,6 +57,8 @@ class PasswordReset(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    # Latest transaction per user
+    __table_args__ = (Index("ix_transactions_user_id_timestamp", "user_id", "timestamp"),)
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(5), ForeignKey("users.id"))
@@ -64,8 +78,64 @@ class PlanLimits(Base):
 
 class DownloadHistory(Base):
     __tablename__ = "download_history"
+    __table_args__ = (Index("ix_download_history_user_id", "user_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(5), ForeignKey("users.id"))
     conversion_id = Column(Integer, ForeignKey("conversions.id"))
     timestamp = Column(DateTime, default=datetime.utcnow)
+
+
+class AudioCacheEntry(Base):
+    __tablename__ = "audio_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True)
+    file_name = Column(String(255))
+    size_bytes = Column(Integer, default=0)
+    ref_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ConversionJob(Base):
+    __tablename__ = "conversion_jobs"
+
+    # Random hex id so job ids cannot be enumerated
+    id = Column(String(32), primary_key=True, index=True)
+    user_id = Column(String(5), ForeignKey("users.id"), index=True)
+    status = Column(String(20), default="queued", index=True)
+    # The submitted ConversionCreate payload as JSON
+    request = Column(UnicodeText)
+    attempts = Column(Integer, default=0)
+    # Credits charged for this job and not yet refunded; a retry reuses them
+    reserved = Column(Integer, default=0)
+    error = Column(String(500), nullable=True)
+    conversion_id = Column(Integer, ForeignKey("conversions.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    # Refreshed by the worker running the job; a job whose heartbeat stops is requeued
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class StatsRollup(Base):
+    """Running totals for the admin dashboard, maintained by stats_rollup.py."""
+    __tablename__ = "stats_rollup"
+    __table_args__ = (UniqueConstraint("metric", "bucket", name="uq_stats_rollup_metric_bucket"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    # e.g. "users", "plan_transactions", "revenue_day"
+    metric = Column(String(50), nullable=False)
+    # "" for totals, the plan name or an ISO date otherwise
+    bucket = Column(String(50), nullable=False, default="")
+    value = Column(Float, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    """One row per revision applied by auto_migrate.run_migrations."""
+    __tablename__ = "schema_migrations"
+
+    revision = Column(String(100), primary_key=True)
+    description = Column(String(255))
+    applied_at = Column(DateTime, default=datetime.utcnow)
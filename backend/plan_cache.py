@@ -0,0 +1,114 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+import shared_state
+from models import PlanLimits
+
+logger = logging.getLogger(__name__)
+
+# Cached plan rows are re-read at least this often even without an invalidation
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "300"))
+# How often a worker checks the shared version stamp written by other workers
+PLAN_VERSION_CHECK_INTERVAL = float(os.getenv("PLAN_VERSION_CHECK_INTERVAL", "1"))
+
+VERSION_SLOT = "plan_limits_version.json"
+DEFAULT_PLAN = "Basic"
+
+
+@dataclass(frozen=True)
+class PlanSnapshot:
+    """Detached copy of a PlanLimits row, safe to share between requests and threads."""
+    id: int
+    plan_name: str
+    credit_limit: int
+    history_days: int
+
+
+class PlanLimitsCache:
+    """
+    Read-through cache of the (tiny) plan_limits table. Entries expire after `ttl`;
+    invalidate() drops them at once in this process and bumps a version stamp in
+    shared_state so every other worker process reloads on its next lookup.
+    """
+
+    def __init__(self, clock=time.time, ttl=PLAN_CACHE_TTL, check_interval=PLAN_VERSION_CHECK_INTERVAL):
+        self._clock = clock
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._plans: Optional[Dict[str, PlanSnapshot]] = None
+        self._loaded_at = 0.0
+        self._version = None
+        self._checked_at = 0.0
+
+    def _shared_version(self):
+        stamp = shared_state.read_json(VERSION_SLOT)
+        return stamp.get("version") if stamp else None
+
+    def _current(self, now) -> Optional[Dict[str, PlanSnapshot]]:
+        with self._lock:
+            plans = self._plans
+            if plans is None or now - self._loaded_at >= self.ttl:
+                return None
+            if now - self._checked_at < self.check_interval:
+                return plans
+            self._checked_at = now
+        # Outside the lock: a file read
+        if self._shared_version() != self._version:
+            return None
+        return plans
+
+    def _load(self, db: Session, now) -> Dict[str, PlanSnapshot]:
+        version = self._shared_version()
+        rows = db.query(PlanLimits).all()
+        plans = {
+            row.plan_name.lower(): PlanSnapshot(row.id, row.plan_name, row.credit_limit, row.history_days)
+            for row in rows if row.plan_name
+        }
+        # An empty table (not seeded yet) is never cached
+        if plans:
+            with self._lock:
+                self._plans = plans
+                self._loaded_at = now
+                self._checked_at = now
+                self._version = version
+        return plans
+
+    def all(self, db: Session) -> Dict[str, PlanSnapshot]:
+        now = self._clock()
+        plans = self._current(now)
+        if plans is None:
+            plans = self._load(db, now)
+        return plans
+
+    def get(self, db: Session, plan_name: Optional[str], fallback: Optional[str] = DEFAULT_PLAN) -> Optional[PlanSnapshot]:
+        """Limits of plan_name (case-insensitive, like the MySQL collation), else of `fallback`."""
+        plans = self.all(db)
+        plan = plans.get((plan_name or "").lower())
+        if plan is None and fallback:
+            plan = plans.get(fallback.lower())
+        return plan
+
+    def invalidate(self):
+        """Call after writing plan_limits; other workers notice within check_interval."""
+        with self._lock:
+            self._plans = None
+            self._version = None
+        shared_state.write_json(VERSION_SLOT, {"version": uuid.uuid4().hex, "at": self._clock()})
+        logger.info("Plan limits cache invalidated.")
+
+    def clear(self):
+        """Drops this process's copy only."""
+        with self._lock:
+            self._plans = None
+            self._version = None
+
+
+plan_limits = PlanLimitsCache()
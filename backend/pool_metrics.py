@@ -0,0 +1,179 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings (see config.Settings)
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+DB_POOL_RECYCLE = settings.db_pool_recycle
+DB_POOL_PRE_PING = settings.db_pool_pre_ping
+DB_POOL_PING_IDLE_SECONDS = settings.db_pool_ping_idle_seconds
+
+# Recent checkout latencies kept for the percentiles
+LATENCY_SAMPLES = 1000
+
+
+class PoolMetrics:
+    """Checkout counters and recent latencies of one engine's pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.waits = 0
+            self.wait_seconds = 0.0
+            self.timeouts = 0
+            self.overflow_events = 0
+            self.pings = 0
+            self.ping_failures = 0
+            self.max_checkout_seconds = 0.0
+            self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def observe_checkout(self, seconds: float, waited: bool, overflowed: bool):
+        with self._lock:
+            self.checkouts += 1
+            self._latencies.append(seconds)
+            self.max_checkout_seconds = max(self.max_checkout_seconds, seconds)
+            if waited:
+                self.waits += 1
+                self.wait_seconds += seconds
+            if overflowed:
+                self.overflow_events += 1
+
+    def observe_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def observe_ping(self, ok: bool):
+        with self._lock:
+            self.pings += 1
+            if not ok:
+                self.ping_failures += 1
+
+    def snapshot(self, pool=None) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data = {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 6),
+                "timeouts": self.timeouts,
+                "overflow_events": self.overflow_events,
+                "pings": self.pings,
+                "ping_failures": self.ping_failures,
+                "checkout_ms": {
+                    "p50": _percentile_ms(latencies, 0.50),
+                    "p95": _percentile_ms(latencies, 0.95),
+                    "p99": _percentile_ms(latencies, 0.99),
+                    "max": round(self.max_checkout_seconds * 1000, 3),
+                },
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                "pool_size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            })
+        return data
+
+
+def _percentile_ms(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+
+class _InstrumentedPool:
+    """Times QueuePool checkouts; subclasses carry their engine's PoolMetrics as `metrics`."""
+    metrics: PoolMetrics = None
+
+    def _do_get(self):
+        # Every pool and overflow slot busy: this checkout has to wait for a checkin
+        exhausted = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        overflow_before = self.overflow()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.observe_timeout()
+            logger.warning(f"Connection pool '{self.metrics.name}' timed out after {time.perf_counter() - start:.1f}s.")
+            raise
+        self.metrics.observe_checkout(
+            time.perf_counter() - start,
+            waited=exhausted,
+            overflowed=self.overflow() > max(overflow_before, 0),
+        )
+        return connection
+
+
+def instrumented_pool_class(metrics: PoolMetrics, async_driver: bool = False):
+    """A QueuePool class bound to `metrics`; engine.dispose() recreates the same class."""
+    base = AsyncAdaptedQueuePool if async_driver else QueuePool
+    return type(f"Instrumented{base.__name__}", (_InstrumentedPool, base), {"metrics": metrics})
+
+
+def pool_options(metrics: PoolMetrics, async_driver: bool = False) -> dict:
+    """create_engine() keyword arguments for a server database (MySQL)."""
+    return {
+        "poolclass": instrumented_pool_class(metrics, async_driver),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING == "always",
+    }
+
+
+def install_idle_ping(engine, metrics: PoolMetrics, idle_seconds: float = DB_POOL_PING_IDLE_SECONDS):
+    """
+    Pings a connection on checkout only if it sat idle for `idle_seconds`, so busy
+    connections skip the extra round trip. A failed ping makes the pool replace it.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "checkin")
+    def _mark_idle(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            alive = sync_engine.dialect.do_ping(dbapi_connection)
+        except Exception:
+            alive = False
+        metrics.observe_ping(alive)
+        if not alive:
+            # The pool discards this connection and retries with a fresh one
+            raise exc.DisconnectionError("Idle connection failed its ping.")
+
+
+def pool_config() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pre_ping": DB_POOL_PRE_PING,
+        "ping_idle_seconds": DB_POOL_PING_IDLE_SECONDS,
+    }
+
+
+sync_pool = PoolMetrics("sync")
+async_pool = PoolMetrics("async")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import re
 
 class UserCreate(BaseModel):
@@ -62,6 +62,20 @@ class ConversionOut(BaseModel):
     class Config:
         from_attributes = True
 
+
+class ConversionPage(BaseModel):
+    items: List[ConversionOut]
+    # Pass back as `cursor` for the next page; null on the last page
+    next_cursor: Optional[str] = None
+
+class ConversionJobOut(BaseModel):
+    job_id: str
+    status: str # queued | running | done | failed
+    error: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
+    conversion: Optional[ConversionOut] = None
+
 class ForgotPasswordRequest(BaseModel):
     email: str
 
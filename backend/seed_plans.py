@@ -1,6 +1,8 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import PlanLimits
+from plan_cache import plan_limits as plan_limits_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,17 +25,18 @@ def seed_plans(db: Session = None):
             {"plan_name": "Plus", "credit_limit": 50000, "history_days": 90}
         ]
 
+        # One query for the plans already there, instead of one per plan
+        existing = set(
+            db.scalars(select(PlanLimits.plan_name).where(PlanLimits.plan_name.in_([p["plan_name"] for p in plans])))
+        )
         for plan_data in plans:
-            existing_plan = db.query(PlanLimits).filter(PlanLimits.plan_name == plan_data["plan_name"]).first()
-            if not existing_plan:
+            if plan_data["plan_name"] not in existing:
                 new_plan = PlanLimits(**plan_data)
                 db.add(new_plan)
                 logger.info(f"Seeded plan: {plan_data['plan_name']}")
-            else:
-                # Optional: Update existing plan limits if they changed
-                pass
         
         db.commit()
+        plan_limits_cache.invalidate()
     except Exception as e:
         logger.error(f"Failed to seed plans: {e}")
         db.rollback()
@@ -0,0 +1,281 @@
+import re
+import zlib
+import logging
+import unicodedata
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Custom markup understood by ssml.build_advanced_ssml; a chunk never ends inside one
+_TAG = r'\[(?:voice|style|break):[^\]]*\]|\[/(?:voice|style)\]'
+# Latin full stops need whitespace after them ("3.14", "e.g.x"); CJK and Devanagari ones do not
+_LATIN_STOPS = ".!?"
+_SCRIPT_STOPS = "。！？｡।॥"
+_CLOSERS = "\"'”’」』）)"
+_LATIN_CLAUSE = ",;:"
+_SCRIPT_CLAUSE = "，、；："
+
+_WORD = rf"[^\s\[{re.escape(_LATIN_STOPS + _SCRIPT_STOPS + _LATIN_CLAUSE + _SCRIPT_CLAUSE)}]+"
+
+# One pass over the text: every character belongs to exactly one atom
+_ATOM = re.compile(
+    rf"(?P<tag>{_TAG})"
+    rf"|(?P<space>\s+)"
+    rf"|(?P<stop>[{re.escape(_LATIN_STOPS + _SCRIPT_STOPS)}]+[{re.escape(_CLOSERS)}]*)"
+    rf"|(?P<clause>[{re.escape(_LATIN_CLAUSE + _SCRIPT_CLAUSE)}]+)"
+    # Words joined by whitespace, up to the next punctuation or markup; word breaks inside a
+    # run are only looked for when the run has to be cut
+    rf"|(?P<run>{_WORD}(?:\s+{_WORD})*)"
+    r"|(?P<other>.)",
+    re.DOTALL,
+)
+_LAST_SPACE = re.compile(r".*\s", re.DOTALL)
+_ATOM_TAG_ONLY = re.compile(rf"(?:\s|{_TAG})*")
+_VOICE_OPEN = re.compile(r'\[voice:(.*)\]', re.DOTALL)
+_STYLE_OPEN = re.compile(r'\[style:(.*)\]', re.DOTALL)
+
+# Break quality, best last: inside-a-word fallback, word, clause, sentence
+FORCE, WORD, CLAUSE, SENTENCE = range(4)
+
+# On average every Nth sentence is an anchor where a chunk may end early
+ANCHOR_DIVISOR = 8
+
+_ZERO_WIDTH_JOINERS = "\u200c\u200d"
+
+
+def utf8_len(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+@dataclass
+class SegmentBudget:
+    """How much text fits in one provider request."""
+    limit: int
+    # Cost of plain text (characters for Polly, UTF-8 bytes of SSML for Azure)
+    measure: Callable[[str], int] = len
+    # Cost of one markup tag once rendered; defaults to measure(tag)
+    tag_cost: Optional[Callable[[str], int]] = None
+    # Fixed cost of every chunk (e.g. the <speak> envelope)
+    overhead: int = 0
+
+
+def _is_anchor(sentence: str) -> bool:
+    return zlib.crc32(sentence.strip().encode("utf-8")) % ANCHOR_DIVISOR == 0
+
+
+def _splits_cluster(text: str, i: int) -> bool:
+    """True if cutting before text[i] would separate a base letter from its marks or a conjunct."""
+    return (
+        unicodedata.category(text[i])[0] == "M"
+        or text[i] in _ZERO_WIDTH_JOINERS
+        or text[i - 1] in _ZERO_WIDTH_JOINERS
+        or unicodedata.combining(text[i - 1]) == 9  # virama
+    )
+
+
+def _safe_cut(text: str, start: int, cut: int) -> int:
+    """Moves a forced cut back to a grapheme boundary (keeps it if the whole run is one cluster)."""
+    i = cut
+    while i > start + 1 and _splits_cluster(text, i):
+        i -= 1
+    return cut if _splits_cluster(text, i) else i
+
+
+class _Segmenter:
+
+    def __init__(self, text: str, budget: SegmentBudget, anchors: bool, min_fill: float):
+        self.text = text
+        self.budget = budget
+        self.measure = budget.measure
+        self.tag_cost = budget.tag_cost or budget.measure
+        self.anchors = anchors
+        self.anchor_fill = budget.limit * min_fill
+        self.chunks = []
+
+        # Running cost from the start of the text; chunk costs are differences of these
+        self.cum = 0
+        self.start = 0
+        self.start_cum = 0
+        self.start_prefix = ""
+        self.start_prefix_cost = 0
+        self.voice = None
+        self.style = None
+        # Latest break point of each quality inside the current chunk: (pos, cum, voice, style)
+        self.best = [None] * 4
+        self.last_sentence = 0
+
+    def chunk_cost(self) -> int:
+        return self.cum - self.start_cum + self.budget.overhead + self.start_prefix_cost
+
+    def candidate(self, quality, pos):
+        self.best[quality] = (pos, self.cum, self.voice, self.style)
+
+    def flush(self, pos, cum, voice, style):
+        body = self.text[self.start:pos].strip()
+        # Chunks made only of markup carry no speech; their state moves on via the prefix
+        if _ATOM_TAG_ONLY.fullmatch(body) is None:
+            self.chunks.append(self.start_prefix + body)
+
+        self.start = pos
+        self.start_cum = cum
+        # Re-open the voice/style that is still active at the cut
+        prefix = ""
+        if voice is not None:
+            prefix += f"[voice:{voice}]"
+        if style is not None:
+            prefix += f"[style:{style}]"
+        self.start_prefix = prefix
+        self.start_prefix_cost = self.tag_cost(f"[voice:{voice}]") if voice is not None else 0
+        if style is not None:
+            self.start_prefix_cost += self.tag_cost(f"[style:{style}]")
+        self.best = [c if c is not None and c[0] > pos else None for c in self.best]
+
+    def flush_best(self) -> bool:
+        for quality in (SENTENCE, CLAUSE, WORD, FORCE):
+            c = self.best[quality]
+            if c is not None and c[0] > self.start:
+                self.flush(*c)
+                return True
+        return False
+
+    def fit(self, s, e) -> int:
+        """End of the longest prefix of text[s:e] that still fits the current chunk (at least one char)."""
+        available = self.budget.limit - self.chunk_cost()
+        # Every measure charges at least one per character: nothing past s + available fits,
+        # so only that much of a (possibly huge) run is ever measured
+        end = min(e, s + max(1, available))
+        if self.measure is len or self.measure(self.text[s:end]) == end - s:
+            return end
+        # Bisect on the prefix cost (measures are additive): a few C-speed measures per cut
+        # instead of one Python call per character
+        low, high = s, end
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.measure(self.text[s:mid]) <= available:
+                low = mid
+            else:
+                high = mid - 1
+        return max(low, s + 1)
+
+    def cut_at(self, s, pos):
+        """Ends the chunk inside the atom starting at s."""
+        self.cum += self.measure(self.text[s:pos])
+        self.flush(pos, self.cum, self.voice, self.style)
+
+    def add_run(self, s, e):
+        limit = self.budget.limit
+        while True:
+            # A run longer (in characters) than the room left cannot fit: skip measuring it,
+            # so each pass costs at most one chunk's worth of text
+            available = limit - self.chunk_cost()
+            if e - s <= available:
+                cost = self.measure(self.text[s:e])
+                if cost <= available:
+                    self.cum += cost
+                    return
+            # Punctuation breaks before the run beat word breaks inside it
+            for quality in (SENTENCE, CLAUSE):
+                c = self.best[quality]
+                if c is not None and c[0] > self.start:
+                    self.flush(*c)
+                    break
+            else:
+                end = self.fit(s, e)
+                last_space = _LAST_SPACE.match(self.text, s, end)
+                if last_space is not None:
+                    self.cut_at(s, last_space.end())
+                    s = last_space.end()
+                elif not self.flush_best():
+                    # The run starts the chunk and has no usable break: cut between graphemes
+                    cut = _safe_cut(self.text, self.start, end) if end < e else end
+                    self.cut_at(s, cut)
+                    s = cut
+
+    def add(self, kind, s, e):
+        if kind == "run":
+            return self.add_run(s, e)
+
+        atom = self.text[s:e]
+        cost = self.tag_cost(atom) if kind == "tag" else self.measure(atom)
+        while self.chunk_cost() + cost > self.budget.limit and self.flush_best():
+            pass
+        if self.chunk_cost() + cost > self.budget.limit:
+            # Oversized markup or punctuation run: keep it whole rather than cut it
+            logger.warning(f"Atom {atom[:40]!r} alone exceeds the chunk budget ({cost} > {self.budget.limit}).")
+
+        self.cum += cost
+        if kind == "tag":
+            self.apply_tag(atom)
+
+    def apply_tag(self, tag):
+        voice = _VOICE_OPEN.fullmatch(tag)
+        style = _STYLE_OPEN.fullmatch(tag)
+        if voice:
+            self.voice = voice.group(1)
+        elif tag == "[/voice]":
+            self.voice = None
+        elif style:
+            self.style = style.group(1)
+        elif tag == "[/style]":
+            self.style = None
+
+    def sentence_end(self, pos):
+        self.candidate(SENTENCE, pos)
+        sentence = self.text[self.last_sentence:pos]
+        self.last_sentence = pos
+        # Content-defined cut: boundaries follow the text, not the offset from the start
+        if self.anchors and self.chunk_cost() >= self.anchor_fill and _is_anchor(sentence):
+            self.flush(pos, self.cum, self.voice, self.style)
+
+    def run(self) -> List[str]:
+        pending = None  # SENTENCE or CLAUSE once punctuation waits for whitespace
+        for match in _ATOM.finditer(self.text):
+            kind = match.lastgroup
+            s, e = match.span()
+            self.add(kind, s, e)
+
+            if kind == "space":
+                if pending == SENTENCE:
+                    self.sentence_end(e)
+                else:
+                    self.candidate(pending if pending is not None else WORD, e)
+                pending = None
+            elif kind == "stop":
+                self.candidate(FORCE, e)
+                if any(ch in _SCRIPT_STOPS for ch in match.group()):
+                    self.sentence_end(e)
+                    pending = None
+                else:
+                    pending = SENTENCE
+            elif kind == "clause":
+                self.candidate(FORCE, e)
+                if match.group()[-1] in _SCRIPT_CLAUSE:
+                    self.candidate(CLAUSE, e)
+                pending = CLAUSE if pending is None else pending
+            elif kind == "tag":
+                # Markup is invisible to sentence detection
+                self.candidate(FORCE, e)
+            else:
+                self.candidate(FORCE, e)
+                pending = None
+
+        if self.start < len(self.text):
+            self.flush(len(self.text), self.cum, self.voice, self.style)
+        return self.chunks
+
+
+def segment_text(text: str, budget: SegmentBudget, anchors: bool = True, min_fill: float = 0.3) -> List[str]:
+    """
+    Splits text into provider-sized chunks in one pass over atom offsets.
+
+    Chunks end at the best break inside the budget (sentence, then clause, then word,
+    then a forced cut that keeps grapheme clusters whole), never inside [voice:...],
+    [style:...] or [break:...] markup. A chunk that starts while a voice or style is
+    active re-opens it. With `anchors`, chunks also end after sentences picked by a
+    hash of their content once `min_fill` of the budget is used, so an edit only moves
+    the boundaries near it.
+    """
+    if not text:
+        return []
+    return _Segmenter(text, budget, anchors, min_fill).run()
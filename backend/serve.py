@@ -0,0 +1,345 @@
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+from typing import Dict
+
+from startup_profile import startup
+from config import settings
+
+logger = logging.getLogger("serve")
+
+# Workers that die this soon after being forked are respawned with a delay, not in a tight loop
+MIN_WORKER_LIFETIME = 5.0
+RESPAWN_DELAY = 1.0
+
+
+def load_app():
+    from main import app
+    return app
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """The listening socket, opened once in the master and shared by every worker."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# --- WARM-UP ---
+
+def _warm_sync_db(session_factory):
+    import database
+    from sqlalchemy import text
+    from plan_cache import plan_limits as plan_limits_cache
+    with (session_factory or database.SessionLocal)() as db:
+        db.execute(text("SELECT 1"))
+        plan_limits_cache.all(db)
+
+
+async def warm_up(session_factory=None, async_engine=None):
+    """
+    Readies a worker before it takes traffic: opens a connection in each pool, loads the
+    plan limits and picks up the Azure token (from the shared slot when another process
+    already issued it). Failures are logged, never fatal: the first request retries them.
+    """
+    import database
+    from sqlalchemy import text
+    from fastapi.concurrency import run_in_threadpool
+    from token_broker import azure_tokens
+
+    # 1. Sync pool + plan limits cache
+    try:
+        await run_in_threadpool(_warm_sync_db, session_factory)
+    except Exception as e:
+        logger.warning(f"Warm-up: database/plan cache not ready: {e}")
+
+    # 2. Async pool
+    try:
+        async with (async_engine or database.async_engine).connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.warning(f"Warm-up: async database not ready: {e}")
+
+    # 3. Azure token (Polly needs none: its client is built on first use)
+    speech_key, region = os.getenv("AZURE_SPEECH_KEY"), os.getenv("AZURE_SPEECH_REGION")
+    if speech_key and region:
+        try:
+            await azure_tokens.get_token(speech_key, region)
+        except Exception as e:
+            logger.warning(f"Warm-up: Azure token not ready: {e}")
+
+
+async def prefetch_shared_state():
+    """
+    Run once in the master before forking: issues the Azure token into the shared slot,
+    so workers warming up at the same time read it instead of each calling issueToken.
+    """
+    import tts_providers
+    from token_broker import azure_tokens
+    speech_key, region = os.getenv("AZURE_SPEECH_KEY"), os.getenv("AZURE_SPEECH_REGION")
+    if not (speech_key and region):
+        return
+    try:
+        await azure_tokens.get_token(speech_key, region)
+    except Exception as e:
+        logger.warning(f"Could not prefetch the Azure token: {e}")
+    finally:
+        # Nothing bound to this event loop may leak into the workers
+        azure_tokens.shutdown()
+        await tts_providers.aclose()
+
+
+# --- WORKER ---
+
+async def _serve(server, sock: socket.socket, ready_fd: int):
+    await warm_up()
+    startup.mark("worker warm-up")
+    serving = asyncio.ensure_future(server.serve(sockets=[sock]))
+    while not server.started and not serving.done():
+        await asyncio.sleep(0.05)
+    if server.started:
+        # Tells the master this worker accepts connections (it waits for that on reload)
+        os.write(ready_fd, b"1")
+    os.close(ready_fd)
+    await serving
+
+
+def _exit_worker(signum, frame):
+    raise SystemExit(0)
+
+
+def run_worker(app, sock: socket.socket, ready_fd: int):
+    """Body of a forked worker process; never returns."""
+    import uvicorn
+
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    # uvicorn handles TERM/INT while serving (drain, then re-raise); outside of that they end
+    # the worker cleanly
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _exit_worker)
+    # The master reported the preload; this worker's profile covers what happens after the fork
+    startup.reset()
+    code = 0
+    try:
+        app = app or load_app()
+        import database
+        # Pools copied from the master must not share its sockets (close=False leaves them to it)
+        database.engine.dispose(close=False)
+        database.async_engine.sync_engine.dispose(close=False)
+
+        config = uvicorn.Config(
+            app,
+            lifespan="on",
+            log_config=None,
+            access_log=False,
+            proxy_headers=True,
+            timeout_graceful_shutdown=settings.graceful_timeout,
+        )
+        server = uvicorn.Server(config)
+        asyncio.run(_serve(server, sock, ready_fd))
+    except BaseException as e:
+        if not isinstance(e, (KeyboardInterrupt, SystemExit)):
+            logger.critical(f"Worker {os.getpid()} crashed: {e}", exc_info=True)
+            code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+# --- MASTER ---
+
+class Worker:
+    def __init__(self, pid: int, generation: int, ready_fd: int):
+        self.pid = pid
+        self.generation = generation
+        self.ready_fd = ready_fd
+        self.started_at = time.monotonic()
+        self.ready = False
+
+
+class Master:
+    """
+    Pre-fork master: owns the listening socket and keeps `workers` uvicorn processes
+    serving it. With `app` preloaded, workers are forked with the app already imported
+    and share its memory copy-on-write; without it, each worker imports the app itself.
+
+    Signals: TERM/INT drain the workers and exit; HUP replaces them with a new generation
+    (new workers warm up and accept connections before the old ones drain). Only a master
+    without a preloaded app picks up new code on HUP.
+    """
+
+    def __init__(self, sock: socket.socket, workers: int, app=None, graceful_timeout: float = 30.0):
+        self.sock = sock
+        self.size = max(1, workers)
+        self.app = app
+        self.graceful_timeout = graceful_timeout
+        self.generation = 0
+        self.workers: Dict[int, Worker] = {}
+        self._signals = []
+        self._stopping = False
+
+    def spawn(self) -> Worker:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            run_worker(self.app, self.sock, write_fd)
+        os.close(write_fd)
+        worker = Worker(pid, self.generation, read_fd)
+        self.workers[pid] = worker
+        logger.info(f"Started worker {pid} (generation {self.generation}).")
+        return worker
+
+    def wait_ready(self, workers, timeout: float) -> bool:
+        """Waits until every worker reported it is serving; False if one died or time ran out."""
+        pending = {w.ready_fd: w for w in workers if not w.ready}
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                readable, _, _ = select.select(list(pending), [], [], remaining)
+            except InterruptedError:
+                continue
+            for fd in readable:
+                if os.read(fd, 1):
+                    pending.pop(fd).ready = True
+                else:
+                    # EOF without the byte: the worker exited before serving
+                    return False
+        return True
+
+    def run(self) -> int:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, lambda signum, frame: self._signals.append(signum))
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+        for _ in range(self.size):
+            self.spawn()
+        logger.info(f"Serving on {self._address()} with {self.size} workers (pid {os.getpid()}).")
+
+        while not self._stopping:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    self._stopping = True
+            if not self._stopping:
+                self.reap()
+                self.maintain()
+                time.sleep(0.2)
+        return self.stop()
+
+    def reload(self):
+        logger.info("Reload requested: starting a new generation of workers.")
+        old = [w for w in self.workers.values() if w.generation == self.generation]
+        self.generation += 1
+        new = [self.spawn() for _ in range(self.size)]
+        if self.wait_ready(new, self.graceful_timeout):
+            self.kill(old, signal.SIGTERM)
+            logger.info(f"Reload done: generation {self.generation} is serving.")
+            return
+        # Keep the generation that works; drop the one that did not come up
+        logger.error("Reload failed: new workers did not start; keeping the current ones.")
+        self.kill(new, signal.SIGTERM)
+        self.generation -= 1
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.ready_fd)
+            if worker.generation == self.generation and not self._stopping:
+                logger.warning(f"Worker {pid} exited unexpectedly (status {os.waitstatus_to_exitcode(status)}).")
+                if time.monotonic() - worker.started_at < MIN_WORKER_LIFETIME:
+                    time.sleep(RESPAWN_DELAY)
+
+    def maintain(self):
+        """Replaces workers of the current generation that exited."""
+        current = sum(1 for w in self.workers.values() if w.generation == self.generation)
+        for _ in range(self.size - current):
+            self.spawn()
+
+    def kill(self, workers, signum):
+        for worker in workers:
+            try:
+                os.kill(worker.pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(self) -> int:
+        logger.info("Shutting down: draining workers.")
+        self.kill(list(self.workers.values()), signal.SIGTERM)
+        # Workers finish in-flight requests for up to graceful_timeout
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.workers:
+            logger.warning(f"Killing {len(self.workers)} workers that did not stop in time.")
+            self.kill(list(self.workers.values()), signal.SIGKILL)
+            while self.workers:
+                self.reap()
+                time.sleep(0.05)
+        self.sock.close()
+        return 0
+
+    def _address(self) -> str:
+        host, port = self.sock.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-fork ASGI server for the TTS backend.")
+    parser.add_argument("--host", default=settings.serve_host)
+    parser.add_argument("--port", type=int, default=settings.serve_port)
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency)
+    parser.add_argument("--no-preload", dest="preload", action="store_false", default=settings.serve_preload,
+                        help="import the app in each worker (HUP then reloads code)")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py needs os.fork(); on Windows run `uvicorn main:app` instead.")
+
+    app = None
+    if args.preload:
+        app = load_app()
+        asyncio.run(prefetch_shared_state())
+        startup.mark("prefetch shared state")
+        startup.report()
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    try:
+        sock = bind_socket(args.host, args.port)
+    except OSError as e:
+        if e.errno == errno.EADDRINUSE:
+            sys.exit(f"{args.host}:{args.port} is already in use.")
+        raise
+    master = Master(sock, args.workers, app=app, graceful_timeout=settings.graceful_timeout)
+    return master.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
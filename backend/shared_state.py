@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by every worker process on the host (Passenger spawns several)
+STATE_DIR = Path(os.getenv("SHARED_STATE_DIR", str(Path(__file__).parent / "tmp")))
+
+
+def state_path(name: str) -> Path:
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    return STATE_DIR / name
+
+
+def read_json(name: str) -> Optional[dict]:
+    """Reads a JSON slot written by any worker. Missing or half-written files read as None."""
+    try:
+        with open(state_path(name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(name: str, data: dict):
+    """Atomically replaces a JSON slot so readers never observe a partial write."""
+    path = state_path(name)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        fd = os.open(str(tmp_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write shared state '{name}': {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def remove(name: str):
+    try:
+        os.remove(state_path(name))
+    except OSError:
+        pass
+
+
+def try_lease(name: str, ttl: float) -> bool:
+    """
+    Best-effort cross-process lease backed by an exclusively created file.
+    A lease older than `ttl` seconds is considered abandoned and can be taken over.
+    """
+    path = state_path(name)
+    try:
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        os.close(fd)
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - path.stat().st_mtime > ttl:
+                os.remove(path)
+                return try_lease(name, ttl)
+        except OSError:
+            pass
+        return False
+    except OSError as e:
+        logger.warning(f"Could not take lease '{name}': {e}")
+        return True
+
+
+def release_lease(name: str):
+    remove(name)
@@ -0,0 +1,158 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Custom markup, tokenized in a single pass: [voice:x] [/voice] [style:x] [/style] [break:x]
+_MARKUP = re.compile(r'\[(voice|style|break):([^\]]*)\]|\[/(voice|style)\]')
+
+# Values that end up inside XML attributes
+_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.:\-]*')
+_BREAK_TIME = re.compile(r'\d+(?:\.\d+)?(?:ms|s)')
+_BREAK_STRENGTHS = {"none", "x-weak", "weak", "medium", "strong", "x-strong"}
+
+_TEXT_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+_ATTR_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+
+_SPEAK_OPEN = """<speak version='1.0' xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="https://www.w3.org/2001/mstts" xml:lang='en-US'>"""
+_SPEAK_CLOSE = "</speak>"
+
+SSML_CACHE_SIZE = int(os.getenv("SSML_CACHE_SIZE", "256"))
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class SSMLError(ValueError):
+    """Raised when the custom markup cannot be turned into valid SSML."""
+
+
+def escape_text(text: str) -> str:
+    return text.translate(_TEXT_ESCAPES)
+
+
+def escaped_size(text: str) -> int:
+    """UTF-8 size of text once escaped, without building the escaped string."""
+    size = len(text) if text.isascii() else len(text.encode("utf-8"))
+    return size + 4 * text.count("&") + 3 * (text.count("<") + text.count(">"))
+
+
+def _attr(value) -> str:
+    return str(value).translate(_ATTR_ESCAPES)
+
+
+def _check_name(kind: str, value: str) -> str:
+    value = value.strip()
+    if not _NAME.fullmatch(value):
+        raise SSMLError(f"Invalid {kind} name: {value!r}")
+    return value
+
+
+def _check_break(value: str) -> str:
+    value = value.strip()
+    if not (_BREAK_TIME.fullmatch(value) or value in _BREAK_STRENGTHS):
+        raise SSMLError(f"Invalid break: {value!r} (use e.g. 500ms, 2s or a strength like 'strong')")
+    if value in _BREAK_STRENGTHS:
+        return f'<break strength="{value}" />'
+    return f'<break time="{value}" />'
+
+
+def _render(text, voice_name, style_degree, rate, pitch):
+    """Lexes the markup once and writes the SSML into a list that is joined at the end."""
+    out = [_SPEAK_OPEN]
+    write = out.append
+
+    prosody_open = f'<prosody rate="{_attr(rate)}" pitch="{_attr(pitch)}">'
+    degree_attr = f' styledegree="{_attr(style_degree)}"' if style_degree and style_degree != 1.0 else ""
+    default_voice = _attr(voice_name)
+
+    active_voice = default_voice
+    active_style = None
+
+    def open_segment():
+        # Voice and prosody wrappers, plus the active style if any
+        write(f'<voice name="{active_voice}">')
+        write(prosody_open)
+        if active_style:
+            write(f'<mstts:express-as style="{active_style}"{degree_attr}>')
+
+    def close_segment():
+        if active_style:
+            write('</mstts:express-as>')
+        write('</prosody></voice>')
+
+    open_segment()
+    pos = 0
+    for match in _MARKUP.finditer(text):
+        start = match.start()
+        if start > pos:
+            write(escape_text(text[pos:start]))
+        pos = match.end()
+
+        kind, value, closing = match.groups()
+        if kind == "break":
+            write(_check_break(value))
+        elif kind == "voice":
+            # Switch speaker: close the current segment and re-open with the new voice
+            close_segment()
+            active_voice = _check_name("voice", value)
+            open_segment()
+        elif kind == "style":
+            if active_style:
+                write('</mstts:express-as>')
+            active_style = _check_name("style", value)
+            write(f'<mstts:express-as style="{active_style}"{degree_attr}>')
+        elif closing == "voice":
+            # Back to the default speaker
+            close_segment()
+            active_voice = default_voice
+            open_segment()
+        else:
+            if not active_style:
+                raise SSMLError("[/style] without an open [style:...]")
+            write('</mstts:express-as>')
+            active_style = None
+
+    if pos < len(text):
+        write(escape_text(text[pos:]))
+    close_segment()
+    write(_SPEAK_CLOSE)
+    return "".join(out)
+
+
+def build_advanced_ssml(text, voice_name, style_degree, prosody, cache=True):
+    """
+    Converts text with custom tags [voice], [style], [break] into valid Azure SSML.
+    Text and attribute values are XML-escaped; malformed markup raises SSMLError.
+    Results are memoized (LRU) on the text's hash and the voice settings unless cache=False.
+    """
+    # 1. Default Prosody Values
+    rate = prosody.get("rate", "medium") if prosody else "medium"
+    pitch = prosody.get("pitch", "medium") if prosody else "medium"
+    # Ensure percentages/semitones are handled if passed as integers/floats
+    if isinstance(rate, (int, float)): rate = f"{rate}%"
+    if isinstance(pitch, (int, float)): pitch = f"{pitch}st"
+
+    if not cache:
+        return _render(text, voice_name, style_degree, rate, pitch)
+
+    # 2. Memo lookup
+    key = (hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(), voice_name, style_degree, rate, pitch)
+    with _cache_lock:
+        ssml = _cache.get(key)
+        if ssml is not None:
+            _cache.move_to_end(key)
+            return ssml
+
+    ssml = _render(text, voice_name, style_degree, rate, pitch)
+
+    with _cache_lock:
+        _cache[key] = ssml
+        if len(_cache) > SSML_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return ssml
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,63 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Read straight from the process environment: the profile starts before any .env is loaded
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class StartupProfile:
+    """
+    Wall-clock phases of a cold start. mark() closes the phase that began at the previous
+    mark (or at construction); marks are always recorded (a perf_counter call each) and
+    only reported when enabled.
+    """
+
+    def __init__(self, clock=time.perf_counter, enabled=STARTUP_PROFILE):
+        self._clock = clock
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """Starts over, e.g. in a worker forked from a master that already reported its own phases."""
+        self.started_at = self._clock()
+        self._last = self.started_at
+        self.phases = []
+        self.reported = False
+
+    def mark(self, phase: str) -> float:
+        now = self._clock()
+        seconds = now - self._last
+        self.phases.append((phase, seconds))
+        self._last = now
+        return seconds
+
+    def total(self) -> float:
+        return self._last - self.started_at
+
+    def snapshot(self) -> dict:
+        return {
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases},
+            "total_ms": round(self.total() * 1000, 1),
+        }
+
+    def report(self, force: bool = False):
+        """Logs every phase once (when enabled, or with force), slowest first."""
+        if self.reported or not (self.enabled or force):
+            return
+        self.reported = True
+        for phase, seconds in sorted(self.phases, key=lambda item: item[1], reverse=True):
+            logger.info(f"Startup profile: {phase:<28} {seconds * 1000:8.1f} ms")
+        logger.info(f"Startup profile: {'total':<28} {self.total() * 1000:8.1f} ms (pid {os.getpid()})")
+
+
+# The clock starts with the first import of this module: passenger_wsgi imports it before main
+startup = StartupProfile()
+
+
+if __name__ == "__main__":
+    # python startup_profile.py: a cold import of the app in this process, phase by phase
+    import main
+    main.startup.report(force=True)
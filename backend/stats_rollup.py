@@ -0,0 +1,143 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select, update, insert, delete, or_
+from sqlalchemy.orm import Session
+
+from models import User, Transaction, Conversion, StatsRollup
+
+logger = logging.getLogger(__name__)
+
+# Daily buckets returned to the dashboard
+DAILY_WINDOW_DAYS = 30
+
+USERS = "users"
+EARNINGS = "earnings"
+CONVERSIONS = "conversions"
+PLAN_TRANSACTIONS = "plan_transactions"
+REVENUE_DAY = "revenue_day"
+CONVERSIONS_DAY = "conversions_day"
+
+_TOTALS = (USERS, EARNINGS, CONVERSIONS, PLAN_TRANSACTIONS)
+_DAILY = (REVENUE_DAY, CONVERSIONS_DAY)
+
+
+def _day(value) -> str:
+    return (value or datetime.utcnow()).date().isoformat()
+
+
+def _increment(connection, metric: str, bucket: str, amount: float):
+    """Adds `amount` to one rollup row, creating it if needed, in a single statement."""
+    table = StatsRollup.__table__
+    values = {"metric": metric, "bucket": bucket, "value": amount}
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=["metric", "bucket"], set_={"value": table.c.value + stmt.excluded.value})
+    elif dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table).values(**values)
+        stmt = stmt.on_duplicate_key_update(value=table.c.value + stmt.inserted.value)
+    else:
+        updated = connection.execute(
+            update(table)
+            .where(table.c.metric == metric, table.c.bucket == bucket)
+            .values(value=table.c.value + amount)
+        ).rowcount
+        if updated:
+            return
+        stmt = insert(table).values(**values)
+    connection.execute(stmt)
+
+
+def deltas_for(objects, sign: int = 1, deltas=None) -> dict:
+    """Rollup changes caused by inserting (sign 1) or deleting (sign -1) these ORM objects."""
+    deltas = defaultdict(float) if deltas is None else deltas
+    for obj in objects:
+        if isinstance(obj, User):
+            deltas[(USERS, "")] += sign
+        elif isinstance(obj, Transaction):
+            amount = obj.amount or 0
+            deltas[(PLAN_TRANSACTIONS, obj.plan_type or "")] += sign
+            if amount:
+                deltas[(EARNINGS, "")] += sign * amount
+                deltas[(REVENUE_DAY, _day(obj.timestamp))] += sign * amount
+        elif isinstance(obj, Conversion):
+            deltas[(CONVERSIONS, "")] += sign
+            deltas[(CONVERSIONS_DAY, _day(obj.created_at))] += sign
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _roll_up_flushed_rows(session, flush_context):
+    # session.new / session.deleted still list the objects this flush inserted or deleted;
+    # the increments run on the same connection, so they commit or roll back together with
+    # the rows themselves
+    deltas = deltas_for(session.new)
+    deltas_for(session.deleted, sign=-1, deltas=deltas)
+    deltas = {key: amount for key, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    connection = session.connection()
+    for (metric, bucket), amount in sorted(deltas.items()):
+        _increment(connection, metric, bucket, amount)
+
+
+def rebuild(db: Session):
+    """Recomputes every rollup row from the history tables (one-off, e.g. when the table is new)."""
+    rows = defaultdict(float)
+    rows[(USERS, "")] = db.query(func.count(User.id)).scalar() or 0
+    rows[(EARNINGS, "")] = db.query(func.sum(Transaction.amount)).scalar() or 0
+    rows[(CONVERSIONS, "")] = db.query(func.count(Conversion.id)).scalar() or 0
+    for plan_type, count in db.query(Transaction.plan_type, func.count(Transaction.id)).group_by(Transaction.plan_type):
+        rows[(PLAN_TRANSACTIONS, plan_type or "")] += count
+    for day, amount in db.query(func.date(Transaction.timestamp), func.sum(Transaction.amount)).group_by(func.date(Transaction.timestamp)):
+        if day and amount:
+            rows[(REVENUE_DAY, str(day))] += amount
+    for day, count in db.query(func.date(Conversion.created_at), func.count(Conversion.id)).group_by(func.date(Conversion.created_at)):
+        if day:
+            rows[(CONVERSIONS_DAY, str(day))] += count
+
+    db.execute(delete(StatsRollup))
+    db.execute(insert(StatsRollup), [
+        {"metric": metric, "bucket": bucket, "value": value} for (metric, bucket), value in rows.items()
+    ])
+    db.commit()
+    logger.info(f"Rebuilt stats rollup ({len(rows)} rows).")
+
+
+def rebuild_if_empty(db: Session):
+    if db.query(StatsRollup.id).first() is None and db.query(User.id).first() is not None:
+        rebuild(db)
+
+
+def read(db: Session, days: int = DAILY_WINDOW_DAYS) -> dict:
+    """Totals plus the last `days` daily buckets, from a bounded number of rollup rows."""
+    since = (datetime.utcnow() - timedelta(days=days - 1)).date().isoformat()
+    rows = db.execute(
+        select(StatsRollup.metric, StatsRollup.bucket, StatsRollup.value).where(
+            or_(
+                StatsRollup.metric.in_(_TOTALS),
+                StatsRollup.metric.in_(_DAILY) & (StatsRollup.bucket >= since),
+            )
+        )
+    ).all()
+
+    stats = {
+        USERS: 0, EARNINGS: 0.0, CONVERSIONS: 0,
+        PLAN_TRANSACTIONS: {}, REVENUE_DAY: {}, CONVERSIONS_DAY: {},
+    }
+    for metric, bucket, value in rows:
+        if metric in (USERS, CONVERSIONS):
+            stats[metric] = int(value)
+        elif metric == EARNINGS:
+            stats[metric] = value
+        elif metric == PLAN_TRANSACTIONS:
+            stats[metric][bucket] = int(value)
+        elif metric == REVENUE_DAY:
+            stats[metric][bucket] = value
+        else:
+            stats[metric][bucket] = int(value)
+    return stats
@@ -0,0 +1,366 @@
+import os
+import shutil
+import asyncio
+import logging
+import threading
+import weakref
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+import audio_cache
+import tts_providers
+from models import Conversion
+from ssml import build_advanced_ssml, escaped_size, SSMLError
+from token_broker import azure_tokens
+from segmenter import SegmentBudget, segment_text, utf8_len
+
+logger = logging.getLogger(__name__)
+
+# Max chunks of a single document sent to the provider at the same time
+CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "4"))
+# Max provider calls in flight across every request served by this process
+GLOBAL_CONCURRENCY = int(os.getenv("TTS_GLOBAL_CONCURRENCY", "16"))
+# Azure accepts much larger SSML documents but caps audio at 10 minutes per request;
+# this many bytes of SSML stays inside both and still splits documents for parallel synthesis
+AZURE_CHUNK_MAX_BYTES = int(os.getenv("AZURE_CHUNK_MAX_BYTES", "8192"))
+# Polly's per-request limit on billed characters
+POLLY_CHUNK_MAX_CHARS = 3000
+# Buffer used when appending chunk files to the final MP3
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# asyncio primitives belong to one event loop, so keep one global limiter per loop
+_global_slots = weakref.WeakKeyDictionary()
+
+
+def _get_global_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _global_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(max(1, GLOBAL_CONCURRENCY))
+        _global_slots[loop] = slots
+    return slots
+
+
+async def iter_in_order(chunks, synthesize_one, max_concurrency=None, on_discard=None):
+    """
+    Yields `await synthesize_one(index, chunk)` for every chunk in original order while a
+    sliding window of the following chunks is already being synthesized. Only the window is
+    ever held in memory. The first failing chunk cancels the others and re-raises.
+    Finished results that are never yielded are passed to `on_discard`.
+    """
+    total = len(chunks)
+    if not total:
+        return
+
+    workers = max(1, min(max_concurrency or CHUNK_CONCURRENCY, total))
+    global_slots = _get_global_slots()
+
+    async def run(i):
+        async with global_slots:
+            return await synthesize_one(i, chunks[i])
+
+    pending = {}
+    next_to_start = 0
+    try:
+        for i in range(total):
+            while next_to_start < total and next_to_start < i + workers:
+                pending[next_to_start] = asyncio.ensure_future(run(next_to_start))
+                next_to_start += 1
+            yield await pending.pop(i)
+    finally:
+        for task in pending.values():
+            task.cancel()
+        if pending:
+            results = await asyncio.gather(*pending.values(), return_exceptions=True)
+            if on_discard is not None:
+                for result in results:
+                    if not isinstance(result, BaseException):
+                        on_discard(result)
+
+
+@dataclass
+class ConversionPlan:
+    """Everything needed to synthesize one conversion, resolved before any provider call."""
+    engine_type: str
+    voice_name: str
+    output_format: str
+    payloads: List[str]
+    cache_key: str
+    chunk_keys: List[str]
+    # Awaitable (payload, out): streams one exact provider payload's MP3 into binary file `out`
+    synthesize_payload: Callable
+    # Awaitable run once before synthesis when at least one chunk misses the cache
+    prepare: Optional[Callable] = None
+
+
+def azure_segment_budget(voice_name: str, style_degree, prosody) -> SegmentBudget:
+    """Chunk budget in bytes of the SSML that build_advanced_ssml will produce."""
+    def rendered_size(markup):
+        # Probes stay out of the SSML memo so they don't evict real documents
+        return utf8_len(build_advanced_ssml(markup, voice_name, style_degree, prosody, cache=False))
+
+    envelope = rendered_size("")
+    tag_costs = {}
+
+    def tag_cost(tag):
+        # Rendered size of one markup tag, e.g. the voice switch it turns into
+        if tag not in tag_costs:
+            if tag == "[/style]":
+                # Only valid after an opening tag
+                tag_costs[tag] = rendered_size("[style:x][/style]") - rendered_size("[style:x]")
+            else:
+                tag_costs[tag] = rendered_size(tag) - envelope
+        return tag_costs[tag]
+
+    # Text is measured as it will be sent: '&' and '<' grow when XML-escaped
+    return SegmentBudget(AZURE_CHUNK_MAX_BYTES, measure=escaped_size, tag_cost=tag_cost, overhead=envelope)
+
+
+def plan_conversion(text: str, engine: Optional[str], voice_id: Optional[str], style_degree, prosody) -> ConversionPlan:
+    # Determine Engine
+    engine_type = engine.lower() if engine else "neural"
+    voice_name = voice_id or ("en-US-JennyNeural" if engine_type == "neural" else "Joanna")
+
+    # --- AZURE IMPLEMENTATION ---
+    if engine_type == "neural":
+        speech_key = os.getenv("AZURE_SPEECH_KEY")
+        service_region = os.getenv("AZURE_SPEECH_REGION")
+
+        if not speech_key or not service_region:
+            logger.error(f"AZURE CONFIGURATION MISSING. Key: {bool(speech_key)}, Region: {service_region}")
+            raise HTTPException(status_code=500, detail="Azure Configuration Error")
+
+        output_format = tts_providers.AZURE_OUTPUT_FORMAT
+
+        def to_payload(text_chunk):
+            return build_advanced_ssml(text_chunk, voice_name, style_degree, prosody)
+
+        budget = azure_segment_budget(voice_name, style_degree, prosody)
+
+        async def prepare():
+            # Get Access Token (cached and refreshed ahead of expiry by the broker)
+            try:
+                await azure_tokens.get_token(speech_key, service_region)
+            except tts_providers.ProviderError as e:
+                logger.error(f"Failed to get Azure Token: {e}")
+                raise HTTPException(status_code=500, detail="Text-to-Speech Service Unavailable (Azure)")
+
+        async def synthesize_payload(ssml, out):
+            # --- DEBUG: LOG SSML ---
+            logger.info(f"\n[DEBUG] Azure SSML Payload:\n{ssml}\n")
+
+            token = await azure_tokens.get_token(speech_key, service_region)
+            try:
+                return await tts_providers.azure_synthesize_to(ssml, token, service_region, out)
+            except tts_providers.ProviderError as e:
+                # Status errors are raised before any audio is written, so retrying is safe
+                if e.status_code != 401:
+                    raise
+                # Token revoked or rotated upstream: drop it and retry once with a fresh one
+                azure_tokens.invalidate()
+                token = await azure_tokens.get_token(speech_key, service_region)
+                return await tts_providers.azure_synthesize_to(ssml, token, service_region, out)
+
+    # --- AWS POLLY IMPLEMENTATION ---
+    elif engine_type == "standard":
+        # Check AWS Credentials Existence
+        if not os.getenv("AWS_ACCESS_KEY_ID") and not os.getenv("AWS_PROFILE"):
+            logger.warning("AWS Credentials might be missing. Proceeding with boto3 defaults.")
+
+        output_format = tts_providers.POLLY_OUTPUT_FORMAT
+        prepare = None
+
+        def to_payload(text_chunk):
+            return text_chunk
+
+        budget = SegmentBudget(POLLY_CHUNK_MAX_CHARS)
+
+        async def synthesize_payload(text_chunk, out):
+            return await tts_providers.polly_synthesize_to(text_chunk, voice_name, out)
+
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported engine: {engine_type}")
+
+    # --- SMART SPLIT ---
+    # Sized by the provider's real budget; content-anchored boundaries keep unchanged
+    # chunks cacheable across edits
+    try:
+        chunks = segment_text(text, budget) or [text]
+        if len(chunks) > 1:
+            logger.info(f"Text too long, split into {len(chunks)} chunks.")
+        payloads = [to_payload(chunk) for chunk in chunks]
+    except SSMLError as e:
+        # Caught here rather than as a failed provider round trip
+        raise HTTPException(status_code=400, detail=f"Invalid markup: {e}")
+
+    return ConversionPlan(
+        engine_type=engine_type,
+        voice_name=voice_name,
+        output_format=output_format,
+        payloads=payloads,
+        # Identical provider input + output format means identical audio
+        cache_key=audio_cache.make_cache_key(engine_type, output_format, payloads, voice=voice_name),
+        chunk_keys=[
+            audio_cache.make_cache_key(engine_type, output_format, [payload], voice=voice_name)
+            for payload in payloads
+        ],
+        synthesize_payload=synthesize_payload,
+        prepare=prepare,
+    )
+
+
+async def prepare_provider(plan: ConversionPlan):
+    """Runs the provider's preparation step unless every chunk is already cached."""
+    misses = sum(1 for key in plan.chunk_keys if not audio_cache.has_chunk(key))
+    logger.info(f"Chunk cache: {len(plan.payloads) - misses}/{len(plan.payloads)} chunks reused.")
+    if misses and plan.prepare is not None:
+        await plan.prepare()
+
+
+class ChunkSink:
+    """
+    Write target of one chunk while it is synthesized. The audio always goes to the chunk
+    cache; once the chunk is next in order it also goes straight into the conversion's
+    output, after the part spooled before that point is copied over once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spool = None
+        self._output = None
+        self._finished = False
+
+    def start(self, spool):
+        with self._lock:
+            self._spool = spool
+
+    def write(self, block):
+        with self._lock:
+            self._spool.write(block)
+            if self._output is not None:
+                self._output.write(block)
+
+    def attach(self, output):
+        """Called by the consumer once every earlier chunk is in `output`."""
+        with self._lock:
+            if self._finished:
+                # Done before its turn: the consumer copies the cached chunk instead
+                return
+            if self._spool is not None:
+                self._spool.flush()
+                with open(self._spool.name, "rb") as spooled:
+                    shutil.copyfileobj(spooled, output, COPY_BUFFER_SIZE)
+            self._output = output
+
+    def finish(self) -> bool:
+        """Closes the sink; True if the whole chunk already went into the output."""
+        with self._lock:
+            self._finished = True
+            return self._output is not None
+
+
+async def synthesize_plan_chunk(plan: ConversionPlan, i: int, payload: str, sink: ChunkSink = None):
+    """
+    Returns an open binary file with chunk i's audio, or None when the chunk was streamed
+    into the output through `sink`. The provider always writes the per-chunk cache, so
+    after an edit only the changed chunks go back to the provider; only chunks that
+    finished before their turn are read back from it.
+    """
+    chunk_key = plan.chunk_keys[i]
+    chunk_file = await run_in_threadpool(audio_cache.open_chunk, chunk_key)
+    if chunk_file is None:
+        # CALL ENGINE API
+        with audio_cache.chunk_writer(chunk_key) as spool:
+            if sink is None:
+                await plan.synthesize_payload(payload, spool)
+                streamed = False
+            else:
+                sink.start(spool)
+                try:
+                    await plan.synthesize_payload(payload, sink)
+                finally:
+                    # Also on failure: the spool is about to be closed and removed
+                    streamed = sink.finish()
+        if streamed:
+            await run_in_threadpool(audio_cache.maybe_prune_chunks)
+            logger.info(f"Processed chunk {i+1}/{len(plan.payloads)} (streamed)")
+            return None
+        # Opened before pruning: the handle stays readable even if the file is evicted
+        chunk_file = await run_in_threadpool(audio_cache.open_chunk, chunk_key)
+        await run_in_threadpool(audio_cache.maybe_prune_chunks)
+        if chunk_file is None:
+            raise tts_providers.ProviderError(f"Chunk {i+1} audio could not be read back")
+    logger.info(f"Processed chunk {i+1}/{len(plan.payloads)}")
+    return chunk_file
+
+
+def _close_chunk(chunk_file):
+    if chunk_file is not None:
+        chunk_file.close()
+
+
+def _iter_chunk_files(plan: ConversionPlan, sinks=None):
+    async def synthesize_one(i, payload):
+        return await synthesize_plan_chunk(plan, i, payload, sinks[i] if sinks else None)
+
+    return iter_in_order(plan.payloads, synthesize_one, on_discard=_close_chunk)
+
+
+async def iter_conversion_audio(plan: ConversionPlan):
+    """Async iterator over the conversion's MP3 bytes, in order, synthesized in parallel."""
+    async with aclosing(_iter_chunk_files(plan)) as chunk_files:
+        async for chunk_file in chunk_files:
+            with chunk_file:
+                while True:
+                    block = await run_in_threadpool(chunk_file.read, tts_providers.STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+
+
+async def write_conversion_audio(plan: ConversionPlan, file_path) -> int:
+    """
+    Writes every chunk's audio to file_path in order. The chunk that is next in order
+    streams into the file as it arrives; chunks that finished early are copied from the
+    chunk cache. Memory stays flat no matter how long the document is. Returns the file size.
+    """
+    output = await run_in_threadpool(open, file_path, "wb")
+    sinks = [ChunkSink() for _ in plan.payloads]
+    try:
+        async with aclosing(_iter_chunk_files(plan, sinks)) as chunk_files:
+            if sinks:
+                await run_in_threadpool(sinks[0].attach, output)
+            written = 0
+            async for chunk_file in chunk_files:
+                if chunk_file is not None:
+                    with chunk_file:
+                        await run_in_threadpool(shutil.copyfileobj, chunk_file, output, COPY_BUFFER_SIZE)
+                written += 1
+                if written < len(sinks):
+                    await run_in_threadpool(sinks[written].attach, output)
+        await run_in_threadpool(output.close)
+    except BaseException:
+        output.close()
+        file_path.unlink(missing_ok=True)
+        raise
+    return file_path.stat().st_size
+
+
+def record_conversion(db, user, text: str, plan: ConversionPlan, audio_url: str, created_at, cached_entry=None):
+    """Creates the Conversion row (credits were already reserved by utils.reserve_credits)."""
+    db_conversion = Conversion(
+        text=text, audio_url=audio_url,
+        voice_name=plan.voice_name, user_id=user.id, created_at=created_at,
+        cache_key=plan.cache_key
+    )
+    db.add(db_conversion)
+    if cached_entry:
+        audio_cache.add_reference(db, cached_entry)
+
+    db.commit()
+    db.refresh(db_conversion)
+    return db_conversion
@@ -1,26 +1,37 @@
 import pytest
 import sys
 import os
+import tempfile
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import StaticPool, NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from fastapi.testclient import TestClient
 
 # Add the parent directory (backend) to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+# One SQLite file, shared by the test session, the async engine of the async routes and
+# anything in the app that opens its own sessions (background job workers)
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="tts-test-db-"), "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
+
 # Set environment variables for testing BEFORE importing app
-os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ["DATABASE_URL"] = SQLALCHEMY_DATABASE_URL
 os.environ["AWS_ACCESS_KEY_ID"] = "testing"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
 os.environ["AWS_REGION"] = "us-east-1"
 os.environ["TESTING"] = "True"
+os.environ["SENTRY_DSN"] = ""
+# Cheap hashes keep the many signups/logins fast; production uses the default cost
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["SHARED_STATE_DIR"] = tempfile.mkdtemp(prefix="tts-shared-state-")
+os.environ["AUDIO_CACHE_DIR"] = tempfile.mkdtemp(prefix="tts-audio-cache-")
 
-from database import Base, get_db
+from database import Base, get_db, get_async_db
 from main import app
-
-# Use SQLite in-memory database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+from plan_cache import plan_limits
+from user_cache import user_snapshots
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -28,11 +39,21 @@ engine = create_engine(
     poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Readers never wait for the other engine's writer
+with engine.connect() as connection:
+    connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+# NullPool: each TestClient runs its own event loop, so async connections are never reused
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 @pytest.fixture(scope="function")
 def db_session():
     """Create a new database session with a fresh schema for each test."""
     Base.metadata.create_all(bind=engine)
+    # Every test starts from an empty database, so no cached plan or user rows either
+    plan_limits.clear()
+    user_snapshots.clear()
     session = TestingSessionLocal()
     try:
         yield session
@@ -40,6 +61,11 @@ def db_session():
         session.close()
         Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture(scope="function")
+def async_sessions(db_session):
+    """AsyncSession factory on the same test database."""
+    return TestingAsyncSessionLocal
+
 @pytest.fixture(scope="function")
 def client(db_session):
     """Create a TestClient that uses the override_get_db dependency."""
@@ -49,7 +75,12 @@ def client(db_session):
         finally:
             pass
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
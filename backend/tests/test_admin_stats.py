@@ -0,0 +1,100 @@
+from datetime import date
+
+from sqlalchemy import event
+
+import stats_rollup
+from models import User, Transaction, StatsRollup
+
+
+def signup(client, email):
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    login = client.post("/api/login", json={"email": email, "password": "password123"})
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+def rollup_rows(db_session):
+    return {(r.metric, r.bucket): r.value for r in db_session.query(StatsRollup)}
+
+
+def test_dashboard_reads_rollup_maintained_on_writes(client, db_session):
+    admin_headers = signup(client, "admin@test.com")
+    db_session.query(User).filter(User.email == "admin@test.com").update({"is_admin": True})
+    db_session.commit()
+    user_headers = signup(client, "member@test.com")
+    member = db_session.query(User).filter(User.email == "member@test.com").first()
+
+    db_session.add(Transaction(user_id=member.id, plan_type="Pro", amount=19.5))
+    db_session.commit()
+    for text in ("first conversion text", "second conversion text"):
+        response = client.post("/api/history", params={"audio_url": "/static/audio/x.mp3"},
+                               json={"text": text, "voice_id": "Joanna"}, headers=user_headers)
+        assert response.status_code == 200
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        stats = client.get("/api/admin/stats", headers=admin_headers).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert stats["totalUsers"] == 2
+    assert stats["totalEarnings"] == 19.5
+    assert stats["userPlanBreakdown"] == {"basic": 2, "Pro": 1}
+    assert stats["totalConversions"] == 2
+    assert stats["dailyRevenue"] == {date.today().isoformat(): 19.5}
+    assert sum(stats["dailyConversions"].values()) == 2
+    assert [a["user"] for a in stats["recentActivity"]] == ["member@test.com"] * 2
+    assert stats["recentActivity"][0]["details"] == "Generated audio: second conversion te..."
+    # No aggregate over the history tables
+    assert not any("FROM transactions" in s for s in statements)
+
+    # The incrementally maintained rows match a full recomputation
+    maintained = rollup_rows(db_session)
+    stats_rollup.rebuild(db_session)
+    assert rollup_rows(db_session) == maintained
+
+
+def test_deleted_conversion_is_taken_out_of_the_rollup(client, db_session):
+    headers = signup(client, "deleter@test.com")
+    created = [
+        client.post("/api/history", params={"audio_url": "/static/audio/x.mp3"},
+                    json={"text": text, "voice_id": "Joanna"}, headers=headers).json()
+        for text in ("kept conversion", "deleted conversion")
+    ]
+
+    assert client.delete(f"/api/history/{created[1]['id']}", headers=headers).status_code == 204
+
+    db_session.expire_all()
+    stats = stats_rollup.read(db_session)
+    assert stats["conversions"] == 1
+    assert stats["conversions_day"] == {date.today().isoformat(): 1}
+    stats_rollup.rebuild(db_session)
+    assert stats_rollup.read(db_session) == stats
+
+
+def test_rolled_back_rows_are_not_counted(db_session):
+    db_session.add(User(id="R0001", email="gone@test.com", hashed_password="x"))
+    db_session.flush()
+    assert rollup_rows(db_session)[("users", "")] == 1
+    db_session.rollback()
+
+    assert rollup_rows(db_session) == {}
+
+
+def test_rebuild_if_empty_seeds_from_history(db_session):
+    db_session.add(User(id="H0001", email="old@test.com", hashed_password="x"))
+    db_session.add(Transaction(user_id="H0001", plan_type="Plus", amount=5))
+    db_session.commit()
+    db_session.query(StatsRollup).delete()
+    db_session.commit()
+
+    stats_rollup.rebuild_if_empty(db_session)
+    stats = stats_rollup.read(db_session)
+    assert stats["users"] == 1
+    assert stats["earnings"] == 5
+    assert stats["plan_transactions"] == {"Plus": 1}
@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import event
+
+from models import User, Transaction
+from seed_plans import seed_plans
+
+
+@pytest.fixture
+def admin_headers(client, db_session):
+    seed_plans(db=db_session)
+    client.post("/api/signup", json={"email": "root@test.com", "password": "password123"})
+    db_session.query(User).filter(User.email == "root@test.com").update({"is_admin": True, "credits_used": 0})
+    db_session.commit()
+    login = client.post("/api/login", json={"email": "root@test.com", "password": "password123"})
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+@pytest.fixture
+def users(db_session, admin_headers):
+    plans = ["Pro", "Plus", "basic", None, "Enterprise"]
+    for i in range(25):
+        db_session.add(User(
+            id=f"T{i:04d}", email=f"user{i:02d}@example.com", hashed_password="x",
+            credits_used=(i * 7) % 10 * 100, current_plan=plans[i % len(plans)],
+        ))
+    # Not backfilled yet: the plan comes from the latest transaction
+    db_session.add(Transaction(user_id="T0003", plan_type="Pro", amount=0))
+    db_session.commit()
+
+
+def fetch_all(client, headers, params):
+    items, cursor, pages = [], None, 0
+    while True:
+        response = client.get("/api/admin/user-details", params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert response.status_code == 200
+        items += response.json()
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return items, pages
+
+
+def test_listing_uses_a_single_query(client, db_session, admin_headers, users):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if "FROM users" in statement and "plan_limits" in statement:
+            statements.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/api/admin/user-details", headers=admin_headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    details = {d["user_id"]: d for d in response.json()}
+    assert len(details) == 26
+    assert len(statements) == 1
+
+    assert details["T0000"]["usage"] == {"credits_used": 0, "credit_limit": 10000}
+    assert details["T0001"]["current_plan"] == "Plus"
+    assert details["T0002"]["is_default_plan"] is True
+    assert details["T0003"]["current_plan"] == "Pro"
+    # Unknown plans get the Basic limit
+    assert details["T0004"]["usage"]["credit_limit"] == 3000
+
+
+@pytest.mark.parametrize("sort,order", [("id", "asc"), ("email", "desc"), ("credits_used", "asc"), ("credits_used", "desc")])
+def test_keyset_pages_cover_every_user_once(client, admin_headers, users, sort, order):
+    everything = client.get("/api/admin/user-details", params={"sort": sort, "order": order}, headers=admin_headers).json()
+    paged, pages = fetch_all(client, admin_headers, {"limit": 7, "sort": sort, "order": order})
+
+    assert pages == 4
+    assert [d["user_id"] for d in paged] == [d["user_id"] for d in everything]
+    if sort != "id":
+        key = "email" if sort == "email" else None
+        values = [d[key] if key else d["usage"]["credits_used"] for d in paged]
+        assert values == sorted(values, reverse=(order == "desc"))
+
+
+def test_filters_and_validation(client, admin_headers, users):
+    pro = client.get("/api/admin/user-details", params={"plan": "pro"}, headers=admin_headers).json()
+    assert {d["user_id"] for d in pro} == {"T0000", "T0003", "T0005", "T0010", "T0015", "T0020"}
+
+    search = client.get("/api/admin/user-details", params={"search": "user1"}, headers=admin_headers).json()
+    assert len(search) == 10
+
+    assert client.get("/api/admin/user-details", params={"sort": "password"}, headers=admin_headers).status_code == 400
+    assert client.get("/api/admin/user-details", params={"cursor": "not-a-cursor"}, headers=admin_headers).status_code == 400
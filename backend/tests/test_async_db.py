@@ -0,0 +1,47 @@
+import asyncio
+import inspect
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+from main import app
+from models import User
+from utils import get_user_plan
+
+
+def test_async_database_url(monkeypatch):
+    """Test that the async engine URL follows DATABASE_URL unless overridden."""
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    assert database.async_database_url("mysql+mysqlconnector://u:p@db/tts?charset=utf8mb4") == "mysql+asyncmy://u:p@db/tts?charset=utf8mb4"
+    assert database.async_database_url("sqlite:///tts.db") == "sqlite+aiosqlite:///tts.db"
+    with pytest.raises(ValueError):
+        database.async_database_url("postgresql://u:p@db/tts")
+    monkeypatch.setenv("ASYNC_DATABASE_URL", "postgresql+asyncpg://u:p@db/tts")
+    assert database.async_database_url("postgresql://u:p@db/tts") == "postgresql+asyncpg://u:p@db/tts"
+
+
+def test_hot_routes_are_async():
+    """Test that the hot endpoints run on the event loop rather than in the threadpool."""
+    hot = {
+        ("POST", "/api/convert"), ("POST", "/api/convert/stream"), ("GET", "/api/history"),
+        ("GET", "/api/me"), ("GET", "/static/audio/{file_path:path}"), ("GET", "/api/download/{conversion_id}"),
+    }
+    routes = {(method, route.path): route.endpoint for route in app.routes for method in getattr(route, "methods", ())}
+    for key in hot:
+        assert inspect.iscoroutinefunction(routes[key]), key
+
+
+def test_run_db_accepts_both_session_kinds(db_session, async_sessions):
+    """Test that sync helpers give the same answer through either kind of session."""
+    db_session.add(User(id="S0001", email="both@test.com", hashed_password="x", current_plan="Pro"))
+    db_session.commit()
+
+    async def both():
+        sync_plan = await database.run_db(db_session, lambda s: get_user_plan(s, s.get(User, "S0001")))
+        async with async_sessions() as session:
+            assert isinstance(session, AsyncSession)
+            async_plan = await database.run_db(session, lambda s: get_user_plan(s, s.get(User, "S0001")))
+        return sync_plan, async_plan
+
+    assert asyncio.run(both()) == ("Pro", "Pro")
@@ -0,0 +1,177 @@
+import io
+import pytest
+from botocore.response import StreamingBody
+import pathlib
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+import audio_cache
+from models import AudioCacheEntry, Conversion, User
+from utils import set_user_plan
+
+BACKEND_DIR = pathlib.Path(__file__).parent.parent
+
+
+class TestSynthesisCache:
+
+    @pytest.fixture(autouse=True)
+    def setup_mocks(self, db_session):
+        from seed_plans import seed_plans
+        seed_plans(db=db_session)
+
+        with patch('tts_providers.polly_client') as mock_polly:
+            self.mock_polly = mock_polly
+            # Every call gets a fresh stream, like the real client
+            self.mock_polly.synthesize_speech.side_effect = lambda **kwargs: {
+                'AudioStream': StreamingBody(io.BytesIO(b'fake_audio_content'), len(b'fake_audio_content'))
+            }
+            yield
+
+    def _login(self, client, email):
+        client.post("/api/signup", json={"email": email, "password": "password123"})
+        login = client.post("/api/login", json={"email": email, "password": "password123"})
+        return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    def test_identical_conversion_is_served_from_cache(self, client: TestClient, db_session):
+        headers = self._login(client, "cache1@test.com")
+        payload = {"text": "Hello cached world", "voice_id": "Joanna", "engine": "standard"}
+
+        first = client.post("/api/convert", json=payload, headers=headers)
+        # Resubmissions within the same second would share a filename; users resubmit later
+        with patch('main.datetime') as mock_dt:
+            mock_dt.now.return_value = datetime.now() + timedelta(seconds=5)
+            second = client.post("/api/convert", json=payload, headers=headers)
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert self.mock_polly.synthesize_speech.call_count == 1
+        assert first.json()["audio_url"] != second.json()["audio_url"]
+
+        second_file = BACKEND_DIR / second.json()["audio_url"].lstrip("/")
+        assert second_file.read_bytes() == b"fake_audio_content"
+
+        entry = db_session.query(AudioCacheEntry).one()
+        assert entry.ref_count == 2
+        keys = {c.cache_key for c in db_session.query(Conversion).all()}
+        assert keys == {entry.cache_key}
+
+    def test_deleting_a_conversion_releases_its_cache_entry(self, client: TestClient, db_session):
+        headers = self._login(client, "cache4@test.com")
+        kept = client.post("/api/convert", json={"text": "Keep me", "engine": "standard"}, headers=headers).json()
+        with patch('main.datetime') as mock_dt:
+            mock_dt.now.return_value = datetime.now() + timedelta(seconds=5)
+            deleted = client.post("/api/convert", json={"text": "Delete me", "engine": "standard"}, headers=headers).json()
+
+        other = self._login(client, "cache5@test.com")
+        assert client.delete(f"/api/history/{deleted['id']}", headers=other).status_code == 403
+        assert client.delete(f"/api/history/{deleted['id']}", headers=headers).status_code == 204
+        assert not (BACKEND_DIR / deleted["audio_url"].lstrip("/")).exists()
+        assert client.get("/api/history", headers=headers).json()[0]["id"] == kept["id"]
+
+        db_session.expire_all()
+        kept_key = db_session.query(Conversion).filter(Conversion.id == kept["id"]).one().cache_key
+        entries = {e.cache_key: e for e in db_session.query(AudioCacheEntry).all()}
+        assert {key: e.ref_count for key, e in entries.items()}[kept_key] == 1
+        assert sorted(e.ref_count for e in entries.values()) == [0, 1]
+
+        # The referenced entry is the least recently used, yet eviction spares it
+        entries[kept_key].last_used_at = datetime.utcnow() - timedelta(days=30)
+        db_session.commit()
+        audio_cache.evict(db_session, max_bytes=len(b'fake_audio_content'))
+
+        assert [e.cache_key for e in db_session.query(AudioCacheEntry).all()] == [kept_key]
+
+    def test_different_voice_is_a_cache_miss(self, client: TestClient, db_session):
+        headers = self._login(client, "cache2@test.com")
+        client.post("/api/convert", json={"text": "Same text", "voice_id": "Joanna", "engine": "standard"}, headers=headers)
+        with patch('main.datetime') as mock_dt:
+            mock_dt.now.return_value = datetime.now() + timedelta(seconds=5)
+            client.post("/api/convert", json={"text": "Same text", "voice_id": "Matthew", "engine": "standard"}, headers=headers)
+
+        assert self.mock_polly.synthesize_speech.call_count == 2
+        assert db_session.query(AudioCacheEntry).count() == 2
+
+
+    def test_edited_document_only_resynthesizes_changed_chunks(self, client: TestClient, db_session):
+        headers = self._login(client, "cache3@test.com")
+        user = db_session.query(User).filter(User.email == "cache3@test.com").first()
+        # Two conversions of ~19k characters each fit the Plus plan
+        set_user_plan(db_session, user, "Plus")
+        db_session.commit()
+
+        sentences = [f"This is sentence number {i} of a rather long script." for i in range(350)]
+        original = " ".join(sentences)
+        client.post("/api/convert", json={"text": original, "engine": "standard"}, headers=headers)
+        first_calls = self.mock_polly.synthesize_speech.call_count
+        assert first_calls > 5
+
+        sentences[10] = "This sentence was fixed after a typo."
+        with patch('main.datetime') as mock_dt:
+            mock_dt.now.return_value = datetime.now() + timedelta(seconds=5)
+            res = client.post("/api/convert", json={"text": " ".join(sentences), "engine": "standard"}, headers=headers)
+
+        assert res.status_code == 200
+        assert self.mock_polly.synthesize_speech.call_count - first_calls <= 2
+
+
+class TestCacheKeyAndEviction:
+
+    def test_cache_key_covers_format_and_payload(self):
+        base = audio_cache.make_cache_key("neural", "fmt-a", ["<speak>a</speak>"])
+        assert base == audio_cache.make_cache_key("neural", "fmt-a", ["<speak>a</speak>"])
+        assert base != audio_cache.make_cache_key("neural", "fmt-b", ["<speak>a</speak>"])
+        assert base != audio_cache.make_cache_key("neural", "fmt-a", ["<speak>b</speak>"])
+        # Chunk boundaries are part of the address
+        assert audio_cache.make_cache_key("standard", "mp3", ["ab", "c"]) != audio_cache.make_cache_key("standard", "mp3", ["a", "bc"])
+
+    def test_eviction_prefers_unreferenced_then_lru(self, db_session, tmp_path, monkeypatch):
+        monkeypatch.setattr(audio_cache, "CACHE_DIR", tmp_path)
+        now = datetime.utcnow()
+        specs = [
+            ("a" * 64, 0, now - timedelta(days=1)),   # unreferenced, recent
+            ("b" * 64, 3, now - timedelta(days=9)),   # referenced, oldest
+            ("c" * 64, 0, now - timedelta(days=5)),   # unreferenced, old
+        ]
+        for key, refs, used in specs:
+            source = tmp_path / f"src-{key[0]}.mp3"
+            source.write_bytes(b"x" * 100)
+            entry = audio_cache.store(db_session, key, source)
+            entry.ref_count = refs
+            entry.last_used_at = used
+        db_session.commit()
+
+        audio_cache.evict(db_session, max_bytes=150)
+
+        remaining = {e.cache_key for e in db_session.query(AudioCacheEntry).all()}
+        assert remaining == {"b" * 64}
+        assert not (tmp_path / "cc" / f"{'c' * 64}.mp3").exists()
+
+    def test_chunk_layer_round_trip_and_prune(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(audio_cache, "CACHE_DIR", tmp_path)
+        import os
+        import time
+
+        for key, data in (("1" * 64, b"a" * 100), ("2" * 64, b"b" * 100)):
+            with audio_cache.chunk_writer(key) as f:
+                f.write(data)
+        old = time.time() - 1000
+        os.utime(audio_cache._chunk_path("1" * 64), (old, old))
+
+        assert audio_cache.has_chunk("2" * 64)
+        audio_cache.prune_chunks(max_bytes=150)
+
+        assert audio_cache.open_chunk("1" * 64) is None
+        with audio_cache.open_chunk("2" * 64) as f:
+            assert f.read() == b"b" * 100
+
+    def test_failed_chunk_write_leaves_no_entry(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(audio_cache, "CACHE_DIR", tmp_path)
+
+        with pytest.raises(RuntimeError):
+            with audio_cache.chunk_writer("3" * 64) as f:
+                f.write(b"partial")
+                raise RuntimeError("provider stream broke")
+
+        assert not audio_cache.has_chunk("3" * 64)
+        assert list((tmp_path / "chunks").glob("*/*")) == []
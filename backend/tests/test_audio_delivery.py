@@ -0,0 +1,99 @@
+import hashlib
+import pathlib
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+
+from models import Conversion, DownloadHistory, User
+
+AUDIO_DIR = pathlib.Path(__file__).parent.parent / "static" / "audio" / "delivery-tests"
+AUDIO_BYTES = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def owned_audio(client: TestClient, db_session):
+    from seed_plans import seed_plans
+    seed_plans(db=db_session)
+
+    email = "delivery@test.com"
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    login = client.post("/api/login", json={"email": email, "password": "password123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    AUDIO_DIR.mkdir(parents=True, exist_ok=True)
+    (AUDIO_DIR / "clip.mp3").write_bytes(AUDIO_BYTES)
+    user = db_session.query(User).filter(User.email == email).first()
+    conv = Conversion(text="clip", audio_url="/static/audio/delivery-tests/clip.mp3", user_id=user.id, created_at=datetime.utcnow())
+    db_session.add(conv)
+    db_session.commit()
+    yield headers, conv
+    (AUDIO_DIR / "clip.mp3").unlink(missing_ok=True)
+
+
+def test_full_response_has_strong_content_etag(client: TestClient, owned_audio):
+    headers, conv = owned_audio
+    res = client.get(conv.audio_url, headers=headers)
+
+    assert res.status_code == 200
+    assert res.content == AUDIO_BYTES
+    assert res.headers["etag"] == f'"{hashlib.sha256(AUDIO_BYTES).hexdigest()}"'
+    assert res.headers["cache-control"] == "private, max-age=31536000, immutable"
+    assert res.headers["accept-ranges"] == "bytes"
+
+
+def test_range_request_returns_partial_content(client: TestClient, owned_audio):
+    headers, conv = owned_audio
+    res = client.get(conv.audio_url, headers={**headers, "Range": "bytes=100-199"})
+
+    assert res.status_code == 206
+    assert res.content == AUDIO_BYTES[100:200]
+    assert res.headers["content-range"] == f"bytes 100-199/{len(AUDIO_BYTES)}"
+
+
+def test_if_none_match_returns_not_modified(client: TestClient, owned_audio):
+    headers, conv = owned_audio
+    etag = client.get(conv.audio_url, headers=headers).headers["etag"]
+
+    res = client.get(conv.audio_url, headers={**headers, "If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.content == b""
+    assert res.headers["etag"] == etag
+
+
+def test_if_range_with_stale_etag_sends_whole_file(client: TestClient, owned_audio):
+    headers, conv = owned_audio
+    etag = client.get(conv.audio_url, headers=headers).headers["etag"]
+
+    fresh = client.get(conv.audio_url, headers={**headers, "Range": "bytes=0-9", "If-Range": etag})
+    assert fresh.status_code == 206
+
+    stale = client.get(conv.audio_url, headers={**headers, "Range": "bytes=0-9", "If-Range": '"something-else"'})
+    assert stale.status_code == 200
+    assert stale.content == AUDIO_BYTES
+
+
+def test_resumed_download_is_not_logged_twice(client: TestClient, db_session, owned_audio):
+    headers, conv = owned_audio
+    first = client.get(f"/api/download/{conv.id}", headers=headers)
+    resumed = client.get(f"/api/download/{conv.id}", headers={**headers, "Range": "bytes=5000-"})
+
+    assert first.status_code == 200
+    assert resumed.status_code == 206
+    assert resumed.content == AUDIO_BYTES[5000:]
+    assert db_session.query(DownloadHistory).filter(DownloadHistory.conversion_id == conv.id).count() == 1
+
+
+@pytest.mark.parametrize("mode,header,expected", [
+    ("x-accel", "x-accel-redirect", "/protected-audio/delivery-tests/clip.mp3"),
+    ("x-sendfile", "x-sendfile", str((AUDIO_DIR / "clip.mp3").resolve())),
+])
+def test_sendfile_hand_off(client: TestClient, owned_audio, monkeypatch, mode, header, expected):
+    import main
+    monkeypatch.setattr(main, "AUDIO_SENDFILE_MODE", mode)
+    headers, conv = owned_audio
+
+    res = client.get(conv.audio_url, headers=headers)
+    assert res.status_code == 200
+    assert res.headers[header] == expected
+    assert res.content == b""
+    assert res.headers["etag"]
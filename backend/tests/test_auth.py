@@ -66,3 +66,20 @@ def test_login_non_existent_email(client: TestClient):
     )
     assert response.status_code == 400
     assert response.json()["detail"] == "Email is not registered"
+
+def test_login_upgrades_hash_when_cost_changes(client: TestClient, db_session, monkeypatch):
+    """Test that a hash made with an old BCRYPT_ROUNDS is replaced on the next login."""
+    import auth
+    from models import User
+    client.post("/api/signup", json={"email": "rehash@example.com", "password": "password123"})
+    old_hash = db_session.query(User).filter(User.email == "rehash@example.com").one().hashed_password
+
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+    response = client.post("/api/login", json={"email": "rehash@example.com", "password": "password123"})
+    assert response.status_code == 200
+
+    db_session.expire_all()
+    new_hash = db_session.query(User).filter(User.email == "rehash@example.com").one().hashed_password
+    assert new_hash != old_hash
+    assert new_hash.startswith("$2b$05$")
+    assert client.post("/api/login", json={"email": "rehash@example.com", "password": "password123"}).status_code == 200
@@ -1,6 +1,7 @@
 import pytest
 import os
 import sys
+import asyncio
 from datetime import timedelta
 from unittest.mock import patch
 
@@ -12,8 +13,11 @@ from auth import (
     verify_password,
     create_access_token,
     verify_token,
+    needs_rehash,
+    PasswordHasher,
     _truncate_password
 )
+from fastapi import HTTPException
 
 class TestAuthInternals:
 
@@ -84,3 +88,25 @@ class TestAuthInternals:
         
         # Should return True because verify_password also truncates input before checking
         assert verify_password(long_pass, hashed) is True
+
+    def test_needs_rehash_and_foreign_hashes(self):
+        """Test cost detection and that non-bcrypt hashes never verify."""
+        hashed = hash_password("secret", rounds=4)
+        assert needs_rehash(hashed, rounds=5)
+        assert not needs_rehash(hashed, rounds=4)
+        assert not needs_rehash("GOOGLE_AUTH_placeholder")
+        assert verify_password("secret", "GOOGLE_AUTH_placeholder") is False
+
+    def test_password_pool_rejects_beyond_its_queue(self):
+        """Test backpressure: callers beyond workers + max_pending get a 503 at once."""
+        hasher = PasswordHasher(workers=1, max_pending=0)
+
+        async def burst():
+            return await asyncio.gather(hasher.hash("one"), hasher.hash("two"), return_exceptions=True)
+
+        try:
+            results = asyncio.run(burst())
+        finally:
+            hasher.shutdown()
+        assert isinstance(results[0], str) and verify_password("one", results[0])
+        assert isinstance(results[1], HTTPException) and results[1].status_code == 503
@@ -1,6 +1,6 @@
 import pytest
 import os
-import requests
+import httpx
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 
@@ -8,6 +8,10 @@ from fastapi.testclient import TestClient
 def setup_env_and_db(db_session, monkeypatch):
     from seed_plans import seed_plans
     seed_plans(db=db_session)
+
+    # Every test starts without a cached Azure token
+    from token_broker import azure_tokens
+    azure_tokens.reset()
     
     # We set strict environment variables needed by the Azure logic
     monkeypatch.setenv("AZURE_SPEECH_KEY", "fake-azure-key")
@@ -21,28 +25,17 @@ def test_azure_tts_success(client: TestClient, db_session):
     login = client.post("/api/login", json={"email": email, "password": "password123"})
     headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
 
-    # 2. Mock requests.post
-    with patch('requests.post') as mock_post:
-        # Create different mock responses for the issueToken request and the TTS request
-        token_response_mock = MagicMock()
-        token_response_mock.text = "fake-access-token"
-        token_response_mock.raise_for_status.return_value = None
-        
-        tts_response_mock = MagicMock()
-        tts_response_mock.status_code = 200
-        tts_response_mock.content = b"fake-audio-bytes"
-
-        # Side effect to return different values depending on the URL
-        def side_effect(*args, **kwargs):
-            url = args[0]
-            if "issueToken" in url:
-                return token_response_mock
-            elif "cognitiveservices/v1" in url:
-                return tts_response_mock
-            return MagicMock()
-
-        mock_post.side_effect = side_effect
+    # 2. Route the pooled provider client through a mock transport
+    def handler(request: httpx.Request):
+        # Different responses for the issueToken request and the TTS request
+        if "issueToken" in request.url.path:
+            return httpx.Response(200, text="fake-access-token")
+        elif "cognitiveservices/v1" in request.url.path:
+            assert request.headers["Authorization"] == "Bearer fake-access-token"
+            return httpx.Response(200, content=b"fake-audio-bytes")
+        return httpx.Response(404)
 
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
         # 3. Call the conversion endpoint
         payload = {
             "text": "Hello Azure Neural.",
@@ -58,6 +51,47 @@ def test_azure_tts_success(client: TestClient, db_session):
         assert "audio_url" in data
         assert "static/audio" in data["audio_url"]
 
+def test_azure_tts_long_text_is_reassembled_in_order(client: TestClient, db_session):
+    """Long text is split, synthesized concurrently and merged back in document order."""
+    email = "azure-long@test.com"
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    login = client.post("/api/login", json={"email": email, "password": "password123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    from models import User
+    from utils import set_user_plan
+    user = db_session.query(User).filter(User.email == email).first()
+    # ~11k characters: more than Basic or Pro allow
+    set_user_plan(db_session, user, "Plus")
+    db_session.commit()
+
+    sentences = [f"Sentence number {i} is here." for i in range(400)]
+    text = " ".join(sentences)
+
+    def handler(request: httpx.Request):
+        if "issueToken" in request.url.path:
+            return httpx.Response(200, text="fake-access-token")
+        body = request.content.decode("utf-8")
+        # Echo back the first sentence number of the chunk as its "audio"
+        first = body.split("Sentence number ", 1)[1].split(" ", 1)[0]
+        return httpx.Response(200, content=f"[{first}]".encode("utf-8"))
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        res = client.post("/api/convert", json={"text": text, "engine": "neural"}, headers=headers)
+
+    assert res.status_code == 200
+    import pathlib
+    audio_path = pathlib.Path(__file__).parent.parent / res.json()["audio_url"].lstrip("/")
+    merged = audio_path.read_bytes().decode("utf-8")
+    starts = [int(x) for x in merged.strip("[]").split("][")]
+    assert len(starts) > 1
+    assert starts == sorted(starts)
+    assert starts[0] == 0
+
+    # The whole text was reserved against the plan and kept after success
+    db_session.refresh(user)
+    assert user.credits_used == len(text)
+
 def test_azure_tts_missing_config(client: TestClient, db_session, monkeypatch):
     """Test behavior when Azure environment variables are completely missing."""
     email = "azure2@test.com"
@@ -81,12 +115,43 @@ def test_azure_tts_token_failure(client: TestClient, db_session):
     login = client.post("/api/login", json={"email": email, "password": "password123"})
     headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
 
-    with patch('requests.post') as mock_post:
+    def handler(request: httpx.Request):
         # Simulate network error or 401 Unauthorized during token fetch
-        mock_post.side_effect = requests.exceptions.RequestException("Connection error")
+        raise httpx.ConnectError("Connection error")
 
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
         payload = {"text": "Won't work", "engine": "neural"}
         res = client.post("/api/convert", json=payload, headers=headers)
 
         assert res.status_code == 500
         assert "Text-to-Speech Service Unavailable (Azure)" in res.json()["detail"]
+
+
+def test_azure_audio_is_streamed_to_file(tmp_path):
+    """The response body is written block by block; error statuses are raised before any write."""
+    import asyncio
+    import tts_providers
+
+    def handler(request: httpx.Request):
+        if request.headers["Authorization"] == "Bearer expired":
+            return httpx.Response(401, text="unauthorized")
+        async def body():
+            for block in (b"ID3", b"-frame-1", b"-frame-2"):
+                yield block
+        return httpx.Response(200, content=body())
+
+    async def scenario():
+        with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+            with open(tmp_path / "ok.mp3", "wb") as out:
+                written = await tts_providers.azure_synthesize_to("<speak/>", "good", "eastus", out)
+            with open(tmp_path / "expired.mp3", "wb") as out:
+                with pytest.raises(tts_providers.ProviderError) as exc:
+                    await tts_providers.azure_synthesize_to("<speak/>", "expired", "eastus", out)
+            await tts_providers.aclose()
+            return written, exc.value.status_code
+
+    written, status_code = asyncio.run(scenario())
+    assert (tmp_path / "ok.mp3").read_bytes() == b"ID3-frame-1-frame-2"
+    assert written == len(b"ID3-frame-1-frame-2")
+    assert status_code == 401
+    assert (tmp_path / "expired.mp3").read_bytes() == b""
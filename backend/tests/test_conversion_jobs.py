@@ -0,0 +1,267 @@
+import pytest
+import time
+import httpx
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(autouse=True)
+def setup_env_and_db(db_session, monkeypatch):
+    from seed_plans import seed_plans
+    seed_plans(db=db_session)
+
+    from token_broker import azure_tokens
+    azure_tokens.reset()
+
+    import conversion_jobs
+    # Workers keep their default sessions: the app's engine points at the test database file,
+    # with connections of its own (the test session's single connection is not shared)
+    monkeypatch.setattr(conversion_jobs, "JOB_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(conversion_jobs, "JOB_WORKERS", 1)
+
+    monkeypatch.setenv("AZURE_SPEECH_KEY", "fake-azure-key")
+    monkeypatch.setenv("AZURE_SPEECH_REGION", "eastus")
+
+
+def auth_headers(client, email):
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    login = client.post("/api/login", json={"email": email, "password": "password123"})
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+def wait_for_job(client, job_id, headers, db_session, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        # The routes share the test session: drop rows it loaded before the worker updated them
+        db_session.expire_all()
+        job = client.get(f"/api/convert/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+
+def test_job_is_accepted_immediately_and_creates_conversion(client: TestClient, db_session):
+    headers = auth_headers(client, "jobs@test.com")
+
+    def handler(request: httpx.Request):
+        if "issueToken" in request.url.path:
+            return httpx.Response(200, text="fake-access-token")
+        return httpx.Response(200, content=b"job-audio")
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        res = client.post("/api/convert/jobs", json={"text": "Hello from a job.", "engine": "neural"}, headers=headers)
+        assert res.status_code == 202
+        assert res.json()["status"] in ("queued", "running", "done")
+        job = wait_for_job(client, res.json()["job_id"], headers, db_session)
+
+    assert job["status"] == "done"
+    assert job["conversion"]["text"] == "Hello from a job."
+    assert job["conversion"]["engine"] == "neural"
+
+    history = client.get("/api/history", headers=headers).json()
+    assert [item["id"] for item in history] == [job["conversion"]["id"]]
+
+
+def test_failed_job_reports_error(client: TestClient, db_session):
+    headers = auth_headers(client, "jobs-fail@test.com")
+
+    def handler(request: httpx.Request):
+        if "issueToken" in request.url.path:
+            return httpx.Response(200, text="fake-access-token")
+        return httpx.Response(500)
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        res = client.post("/api/convert/jobs", json={"text": "This will fail.", "engine": "neural"}, headers=headers)
+        job = wait_for_job(client, res.json()["job_id"], headers, db_session)
+
+    assert job["status"] == "failed"
+    assert job["error"] == "Failed to generate audio"
+    assert job["conversion"] is None
+
+    from models import User
+    db_session.expire_all()
+    assert db_session.query(User).filter(User.email == "jobs-fail@test.com").one().credits_used == 0
+
+
+def test_invalid_request_is_rejected_before_queueing(client: TestClient, db_session):
+    headers = auth_headers(client, "jobs-empty@test.com")
+    res = client.post("/api/convert/jobs", json={"text": "   ", "engine": "neural"}, headers=headers)
+    assert res.status_code == 400
+
+    from models import ConversionJob
+    assert db_session.query(ConversionJob).count() == 0
+
+
+def test_jobs_are_private_to_their_owner(client: TestClient, db_session):
+    import conversion_jobs
+    owner = auth_headers(client, "jobs-owner@test.com")
+    other = auth_headers(client, "jobs-other@test.com")
+
+    from models import User, ConversionJob
+    user = db_session.query(User).filter(User.email == "jobs-owner@test.com").first()
+    # Already finished, so no worker picks it up
+    job = ConversionJob(id="private-job", user_id=user.id, status="failed", error="x", request='{"text": "x"}')
+    db_session.add(job)
+    db_session.commit()
+
+    assert client.get(f"/api/convert/jobs/{job.id}", headers=other).status_code == 404
+    assert client.get(f"/api/convert/jobs/{job.id}", headers=owner).status_code == 200
+
+
+def test_job_queued_by_a_gone_process_runs_without_a_new_post(client: TestClient, db_session):
+    import conversion_jobs
+    from models import User
+    headers = auth_headers(client, "jobs-orphan@test.com")
+    user = db_session.query(User).filter(User.email == "jobs-orphan@test.com").first()
+
+    def handler(request: httpx.Request):
+        if "issueToken" in request.url.path:
+            return httpx.Response(200, text="fake-access-token")
+        return httpx.Response(200, content=b"orphan-audio")
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        # Queued straight into the table, as by a process that has since been stopped
+        job = conversion_jobs.enqueue(db_session, user.id, '{"text": "Left in the queue.", "engine": "neural"}')
+        finished = wait_for_job(client, job.id, headers, db_session)
+
+    assert finished["status"] == "done"
+    assert finished["conversion"]["text"] == "Left in the queue."
+
+
+def test_claim_is_exclusive_and_stale_jobs_are_requeued(db_session):
+    import conversion_jobs
+    from models import User, ConversionJob
+    db_session.add(User(id="U0001", email="claim@test.com", hashed_password="x"))
+    db_session.commit()
+    job = conversion_jobs.enqueue(db_session, "U0001", '{"text": "x"}')
+
+    assert conversion_jobs.claim_next(db_session).id == job.id
+    assert conversion_jobs.claim_next(db_session) is None
+
+    # The claiming process died: the job goes back to the queue once its heartbeat is stale
+    an_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    db_session.query(ConversionJob).update({"started_at": an_hour_ago, "heartbeat_at": an_hour_ago})
+    db_session.commit()
+    conversion_jobs.requeue_stale(db_session)
+    assert conversion_jobs.claim_next(db_session).attempts == 2
+
+    # The first attempt comes back late: it can neither beat nor overwrite the second one
+    assert not conversion_jobs.heartbeat(db_session, job.id, 1)
+    assert not conversion_jobs.finish(db_session, job.id, 1, error="late failure")
+    assert conversion_jobs.finish(db_session, job.id, 2, conversion_id=None)
+    db_session.expire_all()
+    finished = db_session.query(ConversionJob).filter(ConversionJob.id == job.id).one()
+    assert (finished.status, finished.error) == ("done", None)
+
+
+def test_running_worker_requeues_jobs_that_go_stale_later(db_session, monkeypatch):
+    import asyncio
+    import conversion_jobs
+    from models import User
+    db_session.add(User(id="U0002", email="stale-later@test.com", hashed_password="x"))
+    db_session.commit()
+    job = conversion_jobs.enqueue(db_session, "U0002", '{"text": "x"}')
+    # Claimed just now by a process that then dies: not stale yet when the worker starts
+    conversion_jobs.claim_next(db_session)
+    monkeypatch.setattr(conversion_jobs, "JOB_STALE_AFTER", 0.3)
+    monkeypatch.setattr(conversion_jobs, "JOB_REQUEUE_INTERVAL", 0.05)
+
+    claims = []
+
+    async def scenario():
+        handled = asyncio.Event()
+
+        async def handler(claimed, db):
+            claims.append((claimed.id, claimed.attempts))
+            handled.set()
+            return None
+
+        worker = asyncio.ensure_future(conversion_jobs._worker(handler))
+        try:
+            await asyncio.wait_for(handled.wait(), timeout=5)
+        finally:
+            worker.cancel()
+
+    asyncio.run(scenario())
+    assert claims == [(job.id, 2)]
+
+
+def test_long_running_job_keeps_its_claim(db_session, monkeypatch):
+    import asyncio
+    import conversion_jobs
+    from models import User, ConversionJob
+    db_session.add(User(id="U0003", email="long-job@test.com", hashed_password="x"))
+    db_session.commit()
+    job = conversion_jobs.enqueue(db_session, "U0003", '{"text": "x"}')
+    monkeypatch.setattr(conversion_jobs, "JOB_STALE_AFTER", 0.3)
+    monkeypatch.setattr(conversion_jobs, "JOB_HEARTBEAT_INTERVAL", 0.05)
+
+    async def handler(claimed, db):
+        # Runs for several stale windows while another worker keeps sweeping
+        for _ in range(10):
+            await asyncio.sleep(0.1)
+            await asyncio.to_thread(conversion_jobs._requeue_stale_now)
+        return None
+
+    assert asyncio.run(conversion_jobs.run_one(handler))
+    db_session.expire_all()
+    finished = db_session.query(ConversionJob).filter(ConversionJob.id == job.id).one()
+    assert (finished.status, finished.attempts) == ("done", 1)
+
+
+def test_retry_reuses_the_reservation_of_the_attempt_that_died(client: TestClient, db_session):
+    import conversion_jobs
+    from models import User, ConversionJob
+    headers = auth_headers(client, "jobs-retry@test.com")
+    user = db_session.query(User).filter(User.email == "jobs-retry@test.com").first()
+    text = "Charged once, however often it runs."
+
+    # The first attempt reserved the credits, then its process died
+    an_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    db_session.add(ConversionJob(
+        id="retry-job", user_id=user.id, status="running", attempts=1, reserved=len(text),
+        request=f'{{"text": "{text}", "engine": "neural"}}', started_at=an_hour_ago, heartbeat_at=an_hour_ago,
+    ))
+    user.credits_used = len(text)
+    db_session.commit()
+
+    def handler(request: httpx.Request):
+        if "issueToken" in request.url.path:
+            return httpx.Response(200, text="fake-access-token")
+        return httpx.Response(200, content=b"retry-audio")
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        conversion_jobs.requeue_stale(db_session)
+        finished = wait_for_job(client, "retry-job", headers, db_session)
+
+    assert finished["status"] == "done"
+    db_session.expire_all()
+    assert db_session.get(User, user.id).credits_used == len(text)
+
+
+def test_job_out_of_attempts_gives_its_credits_back(db_session):
+    import conversion_jobs
+    from models import User, ConversionJob
+    db_session.add(User(id="U0004", email="exhausted@test.com", hashed_password="x", credits_used=0, current_plan="Basic"))
+    db_session.commit()
+    job = conversion_jobs.enqueue(db_session, "U0004", '{"text": "x"}')
+    claimed = conversion_jobs.claim_next(db_session)
+    assert conversion_jobs.reserve(db_session, claimed, 120)["allowed"] is True
+
+    an_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    db_session.query(ConversionJob).update({
+        "attempts": conversion_jobs.JOB_MAX_ATTEMPTS, "started_at": an_hour_ago, "heartbeat_at": an_hour_ago,
+    })
+    db_session.commit()
+    conversion_jobs.requeue_stale(db_session)
+
+    db_session.expire_all()
+    failed = db_session.get(ConversionJob, job.id)
+    assert (failed.status, failed.reserved) == ("failed", 0)
+    assert db_session.get(User, "U0004").credits_used == 0
+    # A late release from the dead attempt refunds nothing more
+    conversion_jobs.release_reservation(db_session, claimed)
+    db_session.expire_all()
+    assert db_session.get(User, "U0004").credits_used == 0
@@ -0,0 +1,98 @@
+import pytest
+import httpx
+from pathlib import Path
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(autouse=True)
+def setup_env_and_db(db_session, monkeypatch):
+    from seed_plans import seed_plans
+    seed_plans(db=db_session)
+
+    from token_broker import azure_tokens
+    azure_tokens.reset()
+
+    monkeypatch.setenv("AZURE_SPEECH_KEY", "fake-azure-key")
+    monkeypatch.setenv("AZURE_SPEECH_REGION", "eastus")
+
+
+def auth_headers(client, email, db_session):
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    login = client.post("/api/login", json={"email": email, "password": "password123"})
+
+    from models import User
+    from utils import set_user_plan
+    user = db_session.query(User).filter(User.email == email).first()
+    # The long-text test sends ~11k characters: more than Basic or Pro allow
+    set_user_plan(db_session, user, "Plus")
+    db_session.commit()
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+def echo_handler(request: httpx.Request):
+    if "issueToken" in request.url.path:
+        return httpx.Response(200, text="fake-access-token")
+    body = request.content.decode("utf-8")
+    first = body.split("Sentence number ", 1)[1].split(" ", 1)[0]
+    return httpx.Response(200, content=f"[{first}]".encode("utf-8"))
+
+
+def saved_file(audio_url):
+    import main
+    return main.static_path / Path(audio_url).relative_to("/static")
+
+
+def test_stream_returns_audio_in_order_and_records_conversion(client: TestClient, db_session):
+    headers = auth_headers(client, "stream@test.com", db_session)
+    text = " ".join(f"Sentence number {i} is here." for i in range(400))
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(echo_handler))):
+        with client.stream("POST", "/api/convert/stream", json={"text": text, "engine": "neural"}, headers=headers) as res:
+            assert res.status_code == 200
+            assert res.headers["content-type"] == "audio/mpeg"
+            audio_url = res.headers["x-audio-url"]
+            pieces = list(res.iter_bytes())
+
+    body = b"".join(pieces)
+    numbers = [int(n) for n in body.decode("utf-8").strip("[]").split("][")]
+    assert numbers[0] == 0
+    assert numbers == sorted(numbers)
+
+    # The full file and history entry exist once the stream has finished
+    assert saved_file(audio_url).read_bytes() == body
+    history = client.get("/api/history", headers=headers).json()
+    items = history["items"] if isinstance(history, dict) else history
+    assert [item["audio_url"] for item in items] == [audio_url]
+
+
+def test_stream_provider_error_before_audio_returns_status(client: TestClient, db_session):
+    headers = auth_headers(client, "stream-token@test.com", db_session)
+
+    def handler(request: httpx.Request):
+        return httpx.Response(401)
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        res = client.post("/api/convert/stream", json={"text": "Hello.", "engine": "neural"}, headers=headers)
+
+    assert res.status_code == 500
+    assert res.json()["detail"] == "Text-to-Speech Service Unavailable (Azure)"
+
+
+def test_stream_serves_cached_audio(client: TestClient, db_session):
+    headers = auth_headers(client, "stream-cache@test.com", db_session)
+    payload = {"text": "Sentence number 7 is cached.", "engine": "neural"}
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(echo_handler))):
+        first = client.post("/api/convert", json=payload, headers=headers)
+    assert first.status_code == 200
+
+    # No provider available: the second request must come from the synthesis cache
+    with patch('main.datetime') as mock_datetime, patch('tts_providers._build_http_client', side_effect=AssertionError("provider called")):
+        from datetime import datetime
+        mock_datetime.now.return_value = datetime(2030, 1, 2, 3, 4, 5)
+        res = client.post("/api/convert/stream", json=payload, headers=headers)
+
+    assert res.status_code == 200
+    assert res.content == b"[7]"
+    assert saved_file(res.headers["x-audio-url"]).read_bytes() == b"[7]"
@@ -0,0 +1,100 @@
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import User, PlanLimits
+from plan_cache import plan_limits
+from utils import reserve_credits, refund_credits
+
+
+def test_concurrent_reservations_never_overspend(tmp_path):
+    """Test that parallel reservations on separate connections stop exactly at the plan limit."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'credits.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add(PlanLimits(plan_name="Basic", credit_limit=3000, history_days=7))
+        db.add(User(id="C0001", email="race@test.com", hashed_password="x", credits_used=0, current_plan="Basic"))
+        db.commit()
+    plan_limits.clear()
+
+    def reserve(_):
+        with Session() as db:
+            return reserve_credits("C0001", db, 200)["allowed"]
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(reserve, range(24)))
+        with Session() as db:
+            assert db.get(User, "C0001").credits_used == 3000
+        assert results.count(True) == 15
+    finally:
+        plan_limits.clear()
+        engine.dispose()
+
+
+def test_stale_session_cannot_reserve_past_the_limit(db_session):
+    """Test that the UPDATE, not the in-memory balance, decides a reservation."""
+    from seed_plans import seed_plans
+    seed_plans(db=db_session)
+    db_session.add(User(id="C0002", email="stale@test.com", hashed_password="x", credits_used=0, current_plan="Basic"))
+    db_session.commit()
+
+    # This session still believes nothing has been used
+    user = db_session.get(User, "C0002")
+    assert user.credits_used == 0
+    db_session.connection().exec_driver_sql("UPDATE users SET credits_used = 2900 WHERE id = 'C0002'")
+
+    result = reserve_credits("C0002", db_session, 200)
+    assert result["allowed"] is False
+    assert "Credit limit reached" in result["reason"]
+    assert db_session.get(User, "C0002").credits_used == 2900
+
+    assert reserve_credits("C0002", db_session, 100)["allowed"] is True
+    refund_credits("C0002", db_session, 100)
+    db_session.expire_all()
+    assert db_session.get(User, "C0002").credits_used == 2900
+
+
+def test_refund_restores_a_bonus_balance_exactly(db_session):
+    """Test that a refund subtracts the reserved amount instead of clamping at zero."""
+    from seed_plans import seed_plans
+    seed_plans(db=db_session)
+    # 500 bonus credits on top of the plan
+    db_session.add(User(id="C0003", email="bonus@test.com", hashed_password="x", credits_used=-500, current_plan="Basic"))
+    db_session.commit()
+
+    assert reserve_credits("C0003", db_session, 200)["allowed"] is True
+    refund_credits("C0003", db_session, 200)
+    db_session.expire_all()
+    assert db_session.get(User, "C0003").credits_used == -500
+
+
+def test_failed_conversion_refunds_the_reservation(client, db_session, monkeypatch):
+    """Test that credits reserved for a conversion come back when synthesis fails."""
+    from seed_plans import seed_plans
+    from token_broker import azure_tokens
+    seed_plans(db=db_session)
+    azure_tokens.reset()
+    monkeypatch.setenv("AZURE_SPEECH_KEY", "fake-azure-key")
+    monkeypatch.setenv("AZURE_SPEECH_REGION", "eastus")
+
+    client.post("/api/signup", json={"email": "refund@test.com", "password": "password123"})
+    login = client.post("/api/login", json={"email": "refund@test.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    def failing(request: httpx.Request):
+        if "issueToken" in request.url.path:
+            return httpx.Response(200, text="fake-access-token")
+        return httpx.Response(500, text="provider down")
+
+    with patch('tts_providers._build_http_client', return_value=httpx.AsyncClient(transport=httpx.MockTransport(failing))):
+        res = client.post("/api/convert", json={"text": "Refund me please.", "engine": "neural"}, headers=headers)
+    assert res.status_code == 500
+
+    db_session.expire_all()
+    assert db_session.query(User).filter(User.email == "refund@test.com").one().credits_used == 0
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+from auto_migrate import backfill_current_plans
+from models import User, Transaction
+from seed_plans import seed_plans
+from utils import check_user_limits
+
+
+def signup_and_login(client, email):
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    login = client.post("/api/login", json={"email": email, "password": "password123"})
+    return {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+def test_signup_and_admin_update_maintain_current_plan(client, db_session):
+    seed_plans(db=db_session)
+    user_headers = signup_and_login(client, "member@test.com")
+    admin_headers = signup_and_login(client, "boss@test.com")
+    db_session.query(User).filter(User.email == "boss@test.com").update({"is_admin": True})
+    db_session.commit()
+
+    user = db_session.query(User).filter(User.email == "member@test.com").first()
+    assert user.current_plan == "basic"
+    assert user.plan_changed_at is not None
+
+    response = client.put("/api/admin/update-user-plan", json={"user_id": user.id, "plan_type": "Pro"}, headers=admin_headers)
+    assert response.status_code == 200
+    db_session.expire_all()
+    assert user.current_plan == "Pro"
+    assert db_session.query(Transaction).filter(Transaction.user_id == user.id).count() == 2
+
+    # The profile is served from the column, not from the transaction log
+    db_session.query(Transaction).filter(Transaction.user_id == user.id).delete()
+    db_session.commit()
+    profile = client.get("/api/me", headers=user_headers).json()
+    assert profile["plan_type"] == "Pro"
+    assert profile["credit_limit"] == 10000
+
+
+def test_check_user_limits_reads_plan_column(db_session):
+    seed_plans(db=db_session)
+    db_session.add(User(id="U0001", email="col@test.com", hashed_password="x", credits_used=5000, current_plan="Pro"))
+    db_session.commit()
+
+    result = check_user_limits("U0001", db_session, text_length=100)
+    assert result["allowed"] is True
+    assert result["plan"].plan_name == "Pro"
+
+
+def test_backfill_sets_latest_plan_in_batches(db_session):
+    start = datetime(2024, 1, 1)
+    db_session.add_all([
+        User(id="A0001", email="a@test.com", hashed_password="x", created_at=start),
+        User(id="A0002", email="b@test.com", hashed_password="x", created_at=start),
+        User(id="A0003", email="c@test.com", hashed_password="x", created_at=start),
+        User(id="A0004", email="d@test.com", hashed_password="x", created_at=start,
+             current_plan="Plus", plan_changed_at=start),
+    ])
+    db_session.add_all([
+        Transaction(user_id="A0001", plan_type="basic", amount=0, timestamp=start),
+        Transaction(user_id="A0001", plan_type="Pro", amount=10, timestamp=start + timedelta(days=3)),
+        Transaction(user_id="A0002", plan_type="Plus", amount=20, timestamp=start + timedelta(days=1)),
+        Transaction(user_id="A0004", plan_type="basic", amount=0, timestamp=start + timedelta(days=5)),
+    ])
+    db_session.commit()
+
+    assert backfill_current_plans(bind=db_session.get_bind(), batch_size=2) == 3
+    db_session.expire_all()
+
+    plans = {u.id: (u.current_plan, u.plan_changed_at) for u in db_session.query(User)}
+    assert plans["A0001"] == ("Pro", start + timedelta(days=3))
+    assert plans["A0002"] == ("Plus", start + timedelta(days=1))
+    # No transactions: the default plan since signup
+    assert plans["A0003"] == ("Basic", start)
+    # Already maintained rows are left alone
+    assert plans["A0004"] == ("Plus", start)
+
+    assert backfill_current_plans(bind=db_session.get_bind(), batch_size=2) == 0
@@ -81,3 +81,124 @@ def test_history_pagination_and_search(client: TestClient, db_session):
     assert res_search.status_code == 200
     assert len(res_search.json()) == 1
     assert res_search.json()[0]["text"] == "FindMe Please"
+
+def _history_user(client, db_session, email):
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    login = client.post("/api/login", json={"email": email, "password": "password123"})
+    from seed_plans import seed_plans
+    seed_plans(db_session)
+    user = db_session.query(User).filter(User.email == email).first()
+    return user, {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+def test_history_search_is_ranked_full_text(client: TestClient, db_session):
+    """Test that search matches word prefixes, requires every word and ranks by relevance."""
+    user, headers = _history_user(client, db_session, "fts@test.com")
+    now = datetime.utcnow()
+    texts = [
+        "The weather report for tomorrow",
+        "Weather weather weather: storms all week",
+        "A story about the sea",
+        "Reporting live on the weather",
+    ]
+    for i, text in enumerate(texts):
+        db_session.add(Conversion(text=text, voice_name="Joanna", audio_url=f"/fts{i}", user_id=user.id, created_at=now - timedelta(minutes=i)))
+    other = Conversion(text="Weather for someone else", voice_name="Joanna", audio_url="/other", user_id=None, created_at=now)
+    db_session.add(other)
+    db_session.commit()
+
+    res = client.get("/api/history?search=weather", headers=headers).json()
+    assert [c["text"] for c in res][0] == "Weather weather weather: storms all week"
+    assert len(res) == 3
+
+    # Every word must match, as a prefix
+    res = client.get("/api/history?search=weath report", headers=headers).json()
+    assert sorted(c["text"] for c in res) == ["Reporting live on the weather", "The weather report for tomorrow"]
+
+    # Deleted rows leave the index
+    db_session.query(Conversion).filter(Conversion.audio_url == "/fts3").delete()
+    db_session.commit()
+    res = client.get("/api/history?search=reporting", headers=headers).json()
+    assert res == []
+
+def test_history_date_filter_is_a_range(client: TestClient, db_session):
+    """Test that the date filter keeps that day's rows and rejects malformed dates."""
+    user, headers = _history_user(client, db_session, "day@test.com")
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    for offset in (0, 1):
+        day = today - timedelta(days=offset)
+        for hour in (0, 23):
+            db_session.add(Conversion(text=f"day {offset} hour {hour}", voice_name="Joanna", audio_url=f"/d{offset}{hour}",
+                                      user_id=user.id, created_at=day.replace(hour=hour)))
+    db_session.commit()
+
+    yesterday = (today - timedelta(days=1)).strftime("%Y-%m-%d")
+    res = client.get(f"/api/history?date={yesterday}", headers=headers).json()
+    assert sorted(c["text"] for c in res) == ["day 1 hour 0", "day 1 hour 23"]
+
+    assert client.get("/api/history?date=yesterday", headers=headers).status_code == 400
+
+def test_history_queries_use_indexes(db_session):
+    """Test that the search and date filters are answered from indexes."""
+    from sqlalchemy import text as sql
+    search_plan = " ".join(row[-1] for row in db_session.execute(sql(
+        "EXPLAIN QUERY PLAN SELECT conversions.id FROM conversions JOIN conversions_fts ON conversions_fts.rowid = conversions.id "
+        "WHERE conversions.user_id = 'A0001' AND conversions_fts MATCH '\"weather\"*' ORDER BY bm25(conversions_fts)"
+    )))
+    assert "VIRTUAL TABLE INDEX" in search_plan
+
+    date_plan = " ".join(row[-1] for row in db_session.execute(sql(
+        "EXPLAIN QUERY PLAN SELECT id FROM conversions WHERE user_id = 'A0001' "
+        "AND created_at >= '2024-01-01' AND created_at >= '2024-03-01' AND created_at < '2024-03-02'"
+    )))
+    assert "INDEX ix_conversions_user_id_created_at (user_id=? AND created_at>? AND created_at<?)" in date_plan
+
+def _fetch_pages(client, headers, params):
+    items, cursor, pages = [], "", 0
+    while cursor is not None:
+        res = client.get("/api/history", params={**params, "cursor": cursor}, headers=headers)
+        assert res.status_code == 200
+        body = res.json()
+        items += body["items"]
+        cursor = body["next_cursor"]
+        pages += 1
+    return items, pages
+
+def test_history_cursor_pages_are_stable(client: TestClient, db_session):
+    """Test keyset pagination: ties on created_at, no gaps or repeats when rows are added mid-scroll."""
+    user, headers = _history_user(client, db_session, "cursor@test.com")
+    now = datetime.utcnow().replace(microsecond=0)
+    for i in range(23):
+        # Pairs share a timestamp, so the id decides the order within them
+        db_session.add(Conversion(text=f"Item {i}", voice_name="Joanna", audio_url=f"/c{i}", user_id=user.id,
+                                  created_at=now - timedelta(minutes=i // 2)))
+    db_session.commit()
+
+    items, pages = _fetch_pages(client, headers, {"limit": 5})
+    assert pages == 5
+    assert [c["text"] for c in items] == [f"Item {i}" for i in sorted(range(23), key=lambda i: (i // 2, -i))]
+
+    # A conversion created while scrolling does not shift the next page
+    first = client.get("/api/history", params={"limit": 5, "cursor": ""}, headers=headers).json()
+    db_session.add(Conversion(text="Brand new", voice_name="Joanna", audio_url="/new", user_id=user.id, created_at=datetime.utcnow()))
+    db_session.commit()
+    second = client.get("/api/history", params={"limit": 5, "cursor": first["next_cursor"]}, headers=headers).json()
+    assert [c["text"] for c in first["items"] + second["items"]] == [c["text"] for c in items[:10]]
+
+    # Search works in cursor mode too (newest first)
+    found, _ = _fetch_pages(client, headers, {"limit": 2, "search": "item"})
+    assert len(found) == 23
+
+    assert client.get("/api/history", params={"cursor": "garbage"}, headers=headers).status_code == 400
+    # Offset mode is unchanged
+    assert isinstance(client.get("/api/history", params={"page": 2, "limit": 5}, headers=headers).json(), list)
+
+def test_history_cursor_query_seeks_the_index(db_session):
+    """Test that a cursor page is an index range scan with no sort step."""
+    from sqlalchemy import text as sql
+    plan = " ".join(row[-1] for row in db_session.execute(sql(
+        "EXPLAIN QUERY PLAN SELECT id FROM conversions WHERE user_id = 'A0001' AND created_at >= '2024-01-01' "
+        "AND (created_at < '2024-03-01' OR (created_at = '2024-03-01' AND id < 50)) "
+        "ORDER BY created_at DESC, id DESC LIMIT 11"
+    )))
+    assert "ix_conversions_user_id_created_at" in plan
+    assert "TEMP B-TREE" not in plan
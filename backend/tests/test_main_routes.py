@@ -1,5 +1,7 @@
+import io
 import pytest
-from unittest.mock import patch, MagicMock
+from botocore.response import StreamingBody
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 
 class TestMainRoutes:
@@ -11,14 +13,12 @@ class TestMainRoutes:
         from seed_plans import seed_plans
         seed_plans(db=db_session)
 
-        with patch('main.polly_client') as mock_polly:
+        with patch('tts_providers.polly_client') as mock_polly:
             self.mock_polly = mock_polly
-            # Standard successful response structure
-            mock_response = {
-                'AudioStream': MagicMock()
+            # Every call gets a fresh stream, like the real client
+            self.mock_polly.synthesize_speech.side_effect = lambda **kwargs: {
+                'AudioStream': StreamingBody(io.BytesIO(b'fake_audio_content'), len(b'fake_audio_content'))
             }
-            mock_response['AudioStream'].read.return_value = b'fake_audio_content'
-            self.mock_polly.synthesize_speech.return_value = mock_response
             yield
 
     def test_convert_text_success(self, client):
@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import StaticPool
+
+import auto_migrate
+import shared_state
+from database import Base
+from models import SchemaMigration
+
+HOT_INDEXES = {
+    "conversions": {"ix_conversions_audio_url", "ix_conversions_user_id_created_at"},
+    "transactions": {"ix_transactions_user_id_timestamp"},
+    "download_history": {"ix_download_history_user_id"},
+}
+
+
+@pytest.fixture
+def legacy_engine(tmp_path, monkeypatch):
+    """A database created before the hot-path indexes existed."""
+    monkeypatch.setattr(shared_state, "STATE_DIR", tmp_path)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for names in HOT_INDEXES.values():
+            for name in names:
+                connection.execute(text(f"DROP INDEX {name}"))
+        connection.execute(text("DROP TABLE schema_migrations"))
+    yield engine
+    engine.dispose()
+
+
+def index_names(engine, table):
+    return {ix["name"] for ix in inspect(engine).get_indexes(table)}
+
+
+def test_runner_applies_pending_revisions_once(legacy_engine):
+    applied = auto_migrate.run_migrations(bind=legacy_engine)
+
+    assert applied == [m[0] for m in auto_migrate.MIGRATIONS]
+    for table, names in HOT_INDEXES.items():
+        assert names <= index_names(legacy_engine, table)
+    assert auto_migrate.applied_revisions(legacy_engine) == set(applied)
+
+    # Re-running is a no-op
+    assert auto_migrate.run_migrations(bind=legacy_engine) == []
+
+
+def test_failed_revision_is_not_recorded_and_retried(legacy_engine):
+    calls = []
+
+    def flaky(bind):
+        calls.append(bind)
+        if len(calls) == 1:
+            raise RuntimeError("lost connection")
+
+    migrations = [("0001_ok", "fine", lambda bind: None), ("0002_flaky", "fails once", flaky)]
+    with pytest.raises(RuntimeError):
+        auto_migrate.run_migrations(bind=legacy_engine, migrations=migrations)
+    assert auto_migrate.applied_revisions(legacy_engine) == {"0001_ok"}
+
+    assert auto_migrate.run_migrations(bind=legacy_engine, migrations=migrations) == ["0002_flaky"]
+    assert len(calls) == 2
+
+
+def test_worker_without_the_lease_waits_then_fails(legacy_engine, caplog):
+    """Test that a process never reports success while another one holds the lease."""
+    assert shared_state.try_lease(auto_migrate.MIGRATION_LEASE, 60)
+    try:
+        with pytest.raises(RuntimeError, match="waiting for another process"):
+            auto_migrate.run_migrations(bind=legacy_engine, wait=0.2)
+    finally:
+        shared_state.release_lease(auto_migrate.MIGRATION_LEASE)
+    assert "ix_conversions_audio_url" not in index_names(legacy_engine, "conversions")
+    assert any(record.levelname == "WARNING" for record in caplog.records)
+
+
+def test_worker_waits_for_the_lease_holder(legacy_engine):
+    assert shared_state.try_lease(auto_migrate.MIGRATION_LEASE, 60)
+    # The holder finishes (here: releases without applying) while the other one waits
+    releaser = threading.Timer(0.3, shared_state.release_lease, args=(auto_migrate.MIGRATION_LEASE,))
+    releaser.start()
+    try:
+        applied = auto_migrate.run_migrations(bind=legacy_engine, wait=10)
+    finally:
+        releaser.join()
+    assert applied == [m[0] for m in auto_migrate.MIGRATIONS]
+
+
+def test_columns_added_to_old_tables(legacy_engine):
+    """Test that columns added since a table was created come from numbered revisions."""
+    with legacy_engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_conversions_cache_key"))
+        for table, column in (("conversions", "cache_key"), ("conversions", "content_hash"),
+                              ("users", "current_plan"), ("users", "plan_changed_at")):
+            connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+
+    auto_migrate.run_migrations(bind=legacy_engine)
+
+    columns = {c["name"] for c in inspect(legacy_engine).get_columns("conversions")}
+    assert {"cache_key", "content_hash"} <= columns
+    assert "ix_conversions_cache_key" in index_names(legacy_engine, "conversions")
+    assert {"current_plan", "plan_changed_at"} <= {c["name"] for c in inspect(legacy_engine).get_columns("users")}
+
+
+@pytest.mark.parametrize("query,index", [
+    ("SELECT * FROM conversions WHERE audio_url = '/static/audio/a.mp3' LIMIT 1",
+     "ix_conversions_audio_url"),
+    ("SELECT * FROM conversions WHERE user_id = 'A0001' AND created_at >= '2024-01-01' "
+     "ORDER BY created_at DESC LIMIT 10 OFFSET 0",
+     "ix_conversions_user_id_created_at"),
+    ("SELECT * FROM transactions WHERE user_id = 'A0001' ORDER BY timestamp DESC LIMIT 1",
+     "ix_transactions_user_id_timestamp"),
+    ("SELECT * FROM download_history WHERE user_id = 'A0001'",
+     "ix_download_history_user_id"),
+])
+def test_hot_queries_use_indexes(db_session, query, index):
+    plan = " ".join(row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {query}")))
+
+    assert f"USING INDEX {index}" in plan
+    # The index also delivers the order: no separate sort step
+    assert "USE TEMP B-TREE" not in plan
+
+
+def test_search_index_covers_existing_rows(legacy_engine):
+    with legacy_engine.begin() as connection:
+        # As created before the search index existed
+        connection.execute(text("DROP TABLE conversions_fts"))
+        for trigger in ("conversions_fts_ai", "conversions_fts_ad", "conversions_fts_au"):
+            connection.execute(text(f"DROP TRIGGER {trigger}"))
+        connection.execute(text("INSERT INTO conversions (id, text) VALUES (1, 'hello from before the index')"))
+
+    auto_migrate.run_migrations(bind=legacy_engine)
+
+    with legacy_engine.connect() as connection:
+        found = connection.execute(text("SELECT rowid FROM conversions_fts WHERE conversions_fts MATCH 'index'")).scalars().all()
+    assert found == [1]
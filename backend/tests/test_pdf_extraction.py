@@ -5,7 +5,7 @@ from fastapi.testclient import TestClient
 def test_extract_pdf_success_valid_file(client: TestClient):
     """Test successful PDF text extraction with valid formatting."""
     # Mock the pdfplumber behavior
-    with patch("main.pdfplumber.open") as mock_pdfplumber:
+    with patch("pdfplumber.open") as mock_pdfplumber:
         mock_pdf = MagicMock()
         mock_page1 = MagicMock()
         # Simulate text with line breaks that should be removed, and paragraph breaks that should be kept
@@ -51,7 +51,7 @@ def test_extract_pdf_invalid_file_type(client: TestClient):
 
 def test_extract_pdf_plumber_error(client: TestClient):
     """Test handling of an error during PDF extraction (e.g. correlative file)."""
-    with patch("main.pdfplumber.open") as mock_pdfplumber:
+    with patch("pdfplumber.open") as mock_pdfplumber:
         mock_pdfplumber.side_effect = Exception("Corrupt PDF file")
         
         file_content = b"%PDF-1.4 corrupt content"
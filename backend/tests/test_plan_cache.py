@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy import event
+
+import shared_state
+from models import PlanLimits, User
+from plan_cache import PlanLimitsCache
+from seed_plans import seed_plans
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def seeded(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "STATE_DIR", tmp_path)
+    seed_plans(db=db_session)
+    return db_session
+
+
+@pytest.fixture
+def selects(seeded):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    engine = seeded.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def set_basic_limit(db_session, credit_limit):
+    plan = db_session.query(PlanLimits).filter(PlanLimits.plan_name == "Basic").first()
+    plan.credit_limit = credit_limit
+    db_session.commit()
+
+
+def test_lookups_are_served_from_memory(seeded, selects, clock):
+    cache = PlanLimitsCache(clock=clock, ttl=60, check_interval=1)
+    assert cache.get(seeded, "Pro").credit_limit == 10000
+    assert len(selects) == 1
+
+    selects.clear()
+    assert cache.get(seeded, "pro").credit_limit == 10000
+    # Unknown plans fall back to Basic without another query
+    assert cache.get(seeded, "Enterprise").plan_name == "Basic"
+    assert cache.get(seeded, "Enterprise", fallback=None) is None
+    assert selects == []
+
+
+def test_entries_expire_after_ttl(seeded, clock):
+    cache = PlanLimitsCache(clock=clock, ttl=60, check_interval=1)
+    assert cache.get(seeded, "Basic").credit_limit == 3000
+
+    set_basic_limit(seeded, 4000)
+    clock.now += 30
+    assert cache.get(seeded, "Basic").credit_limit == 3000
+    clock.now += 31
+    assert cache.get(seeded, "Basic").credit_limit == 4000
+
+
+def test_invalidation_reaches_other_workers(seeded, clock):
+    # Two caches stand in for two worker processes sharing the state directory
+    this_worker = PlanLimitsCache(clock=clock, ttl=300, check_interval=1)
+    other_worker = PlanLimitsCache(clock=clock, ttl=300, check_interval=1)
+    assert this_worker.get(seeded, "Basic").credit_limit == 3000
+    assert other_worker.get(seeded, "Basic").credit_limit == 3000
+
+    set_basic_limit(seeded, 5000)
+    this_worker.invalidate()
+
+    assert this_worker.get(seeded, "Basic").credit_limit == 5000
+    clock.now += 2
+    assert other_worker.get(seeded, "Basic").credit_limit == 5000
+
+
+def test_admin_plan_update_is_visible_immediately(client, db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "STATE_DIR", tmp_path)
+    seed_plans(db=db_session)
+    client.post("/api/signup", json={"email": "admin@test.com", "password": "password123"})
+    admin = db_session.query(User).filter(User.email == "admin@test.com").first()
+    admin.is_admin = True
+    db_session.commit()
+    login = client.post("/api/login", json={"email": "admin@test.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    assert client.get("/api/me", headers=headers).json()["credit_limit"] == 3000
+
+    response = client.put("/api/admin/plans/Basic", json={"credit_limit": 6000, "history_days": 14}, headers=headers)
+    assert response.status_code == 200
+    assert client.get("/api/me", headers=headers).json()["credit_limit"] == 6000
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+import pool_metrics
+from models import User
+from pool_metrics import PoolMetrics, instrumented_pool_class, install_idle_ping
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    engines = []
+
+    def make(metrics, **kwargs):
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}", poolclass=instrumented_pool_class(metrics),
+            connect_args={"check_same_thread": False}, **kwargs
+        )
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+def test_checkouts_waits_overflow_and_timeouts(make_engine):
+    """Test the counters of a pool of one connection plus one overflow."""
+    metrics = PoolMetrics("test")
+    engine = make_engine(metrics, pool_size=1, max_overflow=1, pool_timeout=0.2)
+
+    first = engine.connect()
+    second = engine.connect()  # opens the overflow connection
+    snapshot = metrics.snapshot(engine.pool)
+    assert snapshot["overflow_events"] == 1
+    assert snapshot["in_use"] == 2 and snapshot["overflow"] == 1
+
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    assert metrics.snapshot()["timeouts"] == 1
+
+    # A checkout that has to wait for another one to come back
+    threading.Timer(0.05, second.close).start()
+    third = engine.connect()
+    snapshot = metrics.snapshot(engine.pool)
+    assert snapshot["waits"] == 1
+    assert snapshot["wait_seconds"] >= 0.04
+    assert snapshot["checkouts"] == 3
+    assert snapshot["checkout_ms"]["max"] >= 40
+    third.close()
+    first.close()
+
+    assert metrics.snapshot(engine.pool)["in_use"] == 0
+    engine.dispose()
+    # dispose() recreates the same instrumented class
+    assert engine.pool.metrics is metrics
+
+
+def test_idle_ping_replaces_dead_connections(make_engine, monkeypatch):
+    """Test that only idle connections are pinged and a failed ping gets a fresh connection."""
+    metrics = PoolMetrics("test")
+    engine = make_engine(metrics, pool_size=1, max_overflow=0)
+    install_idle_ping(engine, metrics, idle_seconds=0.05)
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    with engine.connect() as conn:  # straight back in use: no ping
+        conn.execute(text("SELECT 1"))
+    assert metrics.snapshot()["pings"] == 0
+
+    time.sleep(0.06)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert metrics.snapshot()["pings"] == 1
+
+    time.sleep(0.06)
+    monkeypatch.setattr(engine.dialect, "do_ping", lambda dbapi_connection: False)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+    snapshot = metrics.snapshot()
+    assert snapshot["pings"] == 2 and snapshot["ping_failures"] == 1
+
+
+def test_pool_metrics_endpoint_is_admin_only(client, db_session):
+    """Test the admin endpoint's shape, access control and reset."""
+    def login(email):
+        client.post("/api/signup", json={"email": email, "password": "password123"})
+        token = client.post("/api/login", json={"email": email, "password": "password123"}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+
+    user_headers = login("member@test.com")
+    assert client.get("/api/admin/metrics/db-pool", headers=user_headers).status_code == 403
+
+    db_session.query(User).filter(User.email == "member@test.com").update({"is_admin": True})
+    db_session.commit()
+    pool_metrics.sync_pool.observe_checkout(0.002, waited=True, overflowed=False)
+
+    res = client.get("/api/admin/metrics/db-pool", params={"reset": True}, headers=user_headers)
+    assert res.status_code == 200
+    body = res.json()
+    assert set(body) == {"pid", "config", "sync", "async"}
+    assert body["config"]["pre_ping"] in ("always", "idle", "off")
+    assert body["sync"]["waits"] >= 1
+    assert pool_metrics.sync_pool.snapshot()["waits"] == 0
@@ -0,0 +1,129 @@
+import re
+import pytest
+
+from segmenter import SegmentBudget, segment_text, utf8_len
+from ssml import build_advanced_ssml
+from synthesis import azure_segment_budget
+
+TAG = re.compile(r'\[(?:voice|style|break):[^\]]*\]|\[/(?:voice|style)\]')
+
+
+def document(sentences=300):
+    import random
+    rng = random.Random(7)
+    words = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+    return [
+        " ".join(rng.choice(words) for _ in range(rng.randint(5, 25))).capitalize() + rng.choice(".!?")
+        for _ in range(sentences)
+    ]
+
+
+class TestSegmenter:
+
+    def test_short_text_is_one_chunk(self):
+        assert segment_text("Short text.", SegmentBudget(50), anchors=False) == ["Short text."]
+        assert segment_text("0123456789", SegmentBudget(10), anchors=False) == ["0123456789"]
+
+    def test_splits_at_sentence_then_word_then_anywhere(self):
+        assert segment_text("Hello world. This is a test.", SegmentBudget(15), anchors=False) == ["Hello world.", "This is a test."]
+        assert segment_text("Hello world This is a test", SegmentBudget(15), anchors=False) == ["Hello world", "This is a test"]
+        assert segment_text("ABCDEFGHIJKLMNOPQRSTUVWXYZ", SegmentBudget(10), anchors=False) == ["ABCDEFGHIJ", "KLMNOPQRST", "UVWXYZ"]
+
+    def test_anchored_chunks_respect_limit_and_keep_text(self):
+        text = " ".join(document())
+        chunks = segment_text(text, SegmentBudget(1000))
+
+        assert all(len(c) <= 1000 for c in chunks)
+        assert " ".join(chunks) == text
+
+    def test_anchored_chunks_are_stable_under_local_edits(self):
+        """An edit near the start must not shift every later chunk boundary."""
+        sentences = document()
+        original = segment_text(" ".join(sentences), SegmentBudget(1000))
+
+        sentences[2] = sentences[2].replace("a", "aa")
+        edited = segment_text(" ".join(sentences), SegmentBudget(1000))
+
+        unchanged = set(original) & set(edited)
+        assert len(unchanged) >= len(original) - 2
+
+    def test_anchored_falls_back_for_run_on_text(self):
+        assert segment_text("ABCDEFGHIJKLMNOPQRSTUVWXYZ", SegmentBudget(10)) == ["ABCDEFGHIJ", "KLMNOPQRST", "UVWXYZ"]
+
+    def test_never_cuts_inside_markup(self):
+        text = " ".join(f"Word{i} [break:500ms] [style:cheerful]more[/style]" for i in range(200))
+        chunks = segment_text(text, SegmentBudget(60), anchors=False)
+
+        assert len(chunks) > 10
+        for chunk in chunks:
+            # Every '[' starts a complete tag
+            assert chunk.count("[") == len(TAG.findall(chunk))
+            assert len(chunk) <= 60 + len("[style:cheerful]")
+
+    def test_active_voice_and_style_are_reopened(self):
+        sentences = " ".join(f"Line {i} is spoken by the narrator." for i in range(30))
+        text = f"[voice:en-US-GuyNeural][style:sad]{sentences}[/style][/voice] Back to default."
+        chunks = segment_text(text, SegmentBudget(200), anchors=False)
+
+        assert chunks[0].startswith("[voice:en-US-GuyNeural][style:sad]")
+        for chunk in chunks[1:-1]:
+            assert chunk.startswith("[voice:en-US-GuyNeural][style:sad]")
+        assert chunks[-1].endswith("Back to default.")
+
+    def test_hindi_and_cjk_sentences_split_at_their_own_stops(self):
+        hindi = "यह एक वाक्य है। " * 40
+        cjk = "这是一个句子。" * 40
+
+        for text in (hindi, cjk):
+            chunks = segment_text(text, SegmentBudget(100), anchors=False)
+            assert len(chunks) > 1
+            assert all(chunk.endswith(("।", "。")) for chunk in chunks)
+            assert "".join(chunks).replace(" ", "") == text.replace(" ", "")
+
+    def test_forced_cut_keeps_grapheme_clusters(self):
+        # One long "word" of Devanagari conjuncts with vowel signs and no break points
+        text = "क्षत्रिय" * 100
+        chunks = segment_text(text, SegmentBudget(50), anchors=False)
+
+        assert "".join(chunks) == text
+        for chunk in chunks:
+            assert len(chunk) <= 50
+            assert not re.match(r"[ा-्]", chunk)
+
+    def test_byte_budget_counts_utf8_bytes(self):
+        text = "नमस्ते दुनिया " * 200
+        chunks = segment_text(text, SegmentBudget(300, measure=utf8_len), anchors=False)
+        assert all(utf8_len(chunk) <= 300 for chunk in chunks)
+        # Three bytes per Devanagari letter: far fewer characters than the byte budget
+        assert max(len(chunk) for chunk in chunks) < 150
+
+    def test_azure_chunks_fit_the_ssml_byte_budget(self, monkeypatch):
+        import synthesis
+        monkeypatch.setattr(synthesis, "AZURE_CHUNK_MAX_BYTES", 1200)
+        budget = azure_segment_budget("en-US-JennyNeural", 1.5, {"rate": "fast"})
+
+        text = " ".join(
+            f"[voice:en-US-GuyNeural]Sentence {i} with a pause [break:300ms] here.[/voice] And a reply {i}."
+            for i in range(100)
+        )
+        chunks = segment_text(text, budget)
+        assert len(chunks) > 5
+        for chunk in chunks:
+            ssml = build_advanced_ssml(chunk, "en-US-JennyNeural", 1.5, {"rate": "fast"})
+            assert utf8_len(ssml) <= 1200
+
+    def test_unpunctuated_text_is_measured_a_bounded_number_of_times(self):
+        """Cuts in one endless run only measure up to the budget, not the rest of the run."""
+        from ssml import escaped_size
+        measured = []
+
+        def counting_size(text):
+            measured.append(len(text))
+            return escaped_size(text)
+
+        for unit in ("नमस्ते दुनिया यह परीक्षण है ", "这是一个没有标点符号的中文句子"):
+            measured.clear()
+            text = unit * 20000
+            chunks = segment_text(text, SegmentBudget(8192, measure=counting_size))
+            assert "".join(chunks).replace(" ", "") == text.replace(" ", "")
+            assert sum(measured) < 40 * len(text)
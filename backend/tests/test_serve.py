@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import subprocess
+import urllib.error
+import urllib.request
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from plan_cache import plan_limits
+from token_broker import azure_tokens
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_warm_up_loads_plans_and_token(db_session, async_sessions, monkeypatch):
+    """Test that a worker's warm-up fills the plan cache and picks up the Azure token."""
+    from seed_plans import seed_plans
+    from serve import warm_up
+    seed_plans(db=db_session)
+    plan_limits.clear()
+    azure_tokens.reset()
+    monkeypatch.setenv("AZURE_SPEECH_KEY", "fake-azure-key")
+    monkeypatch.setenv("AZURE_SPEECH_REGION", "eastus")
+
+    issuer = AsyncMock(return_value="warm-token")
+    session_factory = sessionmaker(bind=db_session.get_bind())
+    with patch("tts_providers.issue_azure_token", issuer):
+        asyncio.run(warm_up(session_factory, async_sessions.kw["bind"]))
+        # A second worker reads the token the first one stored
+        asyncio.run(warm_up(session_factory, async_sessions.kw["bind"]))
+    try:
+        assert issuer.await_count == 1
+        assert {"free", "basic", "pro", "plus"} <= set(plan_limits._current(time.time()))
+    finally:
+        azure_tokens.reset()
+        plan_limits.clear()
+
+
+def _children(pid):
+    children = set()
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[1]) == pid and fields[0] != "Z":
+                children.add(int(entry))
+    return children
+
+
+def _wait_for(condition, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.1)
+    raise AssertionError("Timed out waiting for the server")
+
+
+def _status(port):
+    try:
+        return urllib.request.urlopen(f"http://127.0.0.1:{port}/api/history", timeout=5).status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork") or not os.path.isdir("/proc"), reason="needs fork and /proc")
+def test_master_respawns_reloads_and_drains(tmp_path):
+    """Test that the pre-fork master replaces dead workers, reloads on HUP and exits cleanly on TERM."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    env = dict(
+        os.environ,
+        PYTHONPATH=BACKEND_DIR,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'serve.db'}",
+        SENTRY_DSN="",
+        SHARED_STATE_DIR=str(tmp_path / "state"),
+        GRACEFUL_TIMEOUT="5",
+    )
+    master = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "serve.py"), "--port", str(port), "--workers", "2"],
+        cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        # Unauthenticated: answered by a worker without touching the database
+        _wait_for(lambda: _status(port) == 401)
+        first = _wait_for(lambda: len(_children(master.pid)) == 2 and _children(master.pid))
+
+        victim = min(first)
+        os.kill(victim, signal.SIGKILL)
+        _wait_for(lambda: len(_children(master.pid)) == 2 and victim not in _children(master.pid))
+
+        before = _children(master.pid)
+        master.send_signal(signal.SIGHUP)
+        _wait_for(lambda: len(_children(master.pid)) == 2 and not (_children(master.pid) & before))
+        assert _status(port) == 401
+
+        master.send_signal(signal.SIGTERM)
+        assert master.wait(timeout=20) == 0
+    finally:
+        if master.poll() is None:
+            master.kill()
+            master.wait()
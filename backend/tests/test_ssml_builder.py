@@ -78,3 +78,46 @@ def test_build_advanced_ssml_with_multiple_voices():
     # The structure closes the Jenny voice before opening Guy, and then switches back to Jenny
     expected = f"""<speak version='1.0' xmlns="http://www.w3.org/2001/10/synthesis" xmlns:mstts="https://www.w3.org/2001/mstts" xml:lang='en-US'><voice name="en-US-JennyNeural"><prosody rate="medium" pitch="medium">Hello form Jenny. </prosody></voice><voice name="en-US-GuyNeural"><prosody rate="medium" pitch="medium">And hello from Guy.</prosody></voice><voice name="en-US-JennyNeural"><prosody rate="medium" pitch="medium"> Back to Jenny.</prosody></voice></speak>"""
     assert normalized == normalize_ssml(expected)
+
+def test_build_advanced_ssml_escapes_text_and_attributes():
+    """Test that XML special characters in text and voice names are escaped."""
+    text = 'Tom & Jerry say 1 < 2 [voice:en-US-GuyNeural]"quoted" > fine[/voice]'
+    ssml = build_advanced_ssml(text, 'Jenny"Neural', 1.0, {"rate": "medium", "pitch": "medium"})
+
+    assert "Tom &amp; Jerry say 1 &lt; 2 " in ssml
+    assert '"quoted" &gt; fine' in ssml
+    assert '<voice name="Jenny&quot;Neural">' in ssml
+    # The result parses as XML
+    import xml.etree.ElementTree as ET
+    ET.fromstring(ssml)
+
+def test_build_advanced_ssml_rejects_malformed_markup():
+    """Test that markup Azure would reject fails locally instead."""
+    from ssml import SSMLError
+    prosody = {"rate": "medium", "pitch": "medium"}
+
+    with pytest.raises(SSMLError):
+        build_advanced_ssml("Hello [break:soon] there", "en-US-JennyNeural", 1.0, prosody)
+    with pytest.raises(SSMLError):
+        build_advanced_ssml("No style here[/style]", "en-US-JennyNeural", 1.0, prosody)
+    with pytest.raises(SSMLError):
+        build_advanced_ssml("[voice:<bad>]Hi", "en-US-JennyNeural", 1.0, prosody)
+
+def test_build_advanced_ssml_style_switch_closes_previous_style():
+    """Test that opening a style while another is active keeps the XML well-formed."""
+    ssml = build_advanced_ssml("[style:sad]one [style:cheerful]two", "en-US-JennyNeural", 1.0, None)
+    normalized = normalize_ssml(ssml)
+
+    assert '<mstts:express-as style="sad">one </mstts:express-as><mstts:express-as style="cheerful">two</mstts:express-as></prosody>' in normalized
+    import xml.etree.ElementTree as ET
+    ET.fromstring(ssml)
+
+def test_build_advanced_ssml_is_memoized():
+    """Test that the same input is served from the memo and settings are part of the key."""
+    from ssml import clear_cache
+    clear_cache()
+    prosody = {"rate": "medium", "pitch": "medium"}
+
+    first = build_advanced_ssml("Memo me.", "en-US-JennyNeural", 1.0, prosody)
+    assert build_advanced_ssml("Memo me.", "en-US-JennyNeural", 1.0, prosody) is first
+    assert build_advanced_ssml("Memo me.", "en-US-GuyNeural", 1.0, prosody) != first
@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import logging
+import sqlite3
+import subprocess
+
+import pytest
+
+from config import Settings
+from startup_profile import StartupProfile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_settings_from_env():
+    """Test that settings are parsed and normalized once, from a plain mapping."""
+    settings = Settings.from_env({"DATABASE_URL": "mysql://u:p@db/tts", "AUTO_MIGRATE": "1", "DB_POOL_PRE_PING": "Always"})
+    assert settings.database_url == "mysql+mysqlconnector://u:p@db/tts?charset=utf8mb4"
+    assert settings.auto_migrate is True
+    assert settings.db_pool_pre_ping == "always"
+    assert settings.bcrypt_rounds == 12
+    assert settings.frontend_path is None
+
+    assert Settings.from_env({"DATABASE_URL": "sqlite:///tts.db", "AUTO_MIGRATE": "no"}).auto_migrate is False
+    with pytest.raises(ValueError):
+        Settings.from_env({})
+
+
+def test_startup_profile_reports_phases_once(caplog):
+    """Test that marks time consecutive phases and are only logged when profiling is on."""
+    ticks = iter([0.0, 0.25, 0.5, 1.25])
+    profile = StartupProfile(clock=lambda: next(ticks), enabled=False)
+    profile.mark("settings")
+    profile.mark("imports")
+    profile.mark("routes")
+    assert profile.snapshot() == {"phases_ms": {"settings": 250.0, "imports": 250.0, "routes": 750.0}, "total_ms": 1250.0}
+
+    with caplog.at_level(logging.INFO, logger="startup_profile"):
+        profile.report()
+        assert not caplog.records
+        profile.report(force=True)
+        profile.report(force=True)
+    lines = [record.getMessage() for record in caplog.records]
+    assert len(lines) == 4
+    assert "routes" in lines[0] and "total" in lines[-1]
+
+
+def test_cold_import_does_no_schema_work_or_heavy_imports(tmp_path):
+    """Test that importing the app leaves the database alone and defers optional heavy modules."""
+    db_path = tmp_path / "cold.db"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", SENTRY_DSN="", AUTO_MIGRATE="", STARTUP_PROFILE="")
+    script = (
+        "import sys, json; import main; "
+        "print(json.dumps({'modules': [m for m in ('pdfplumber', 'boto3', 'botocore', 'sentry_sdk', 'auto_migrate') if m in sys.modules], "
+        "'phases': list(main.startup.snapshot()['phases_ms'])}))"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=dict(env, PYTHONPATH=BACKEND_DIR),
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["modules"] == []
+    assert report["phases"][0] == "settings" and report["phases"][-1] == "routes + frontend"
+
+    # No connection, so no tables: migrations belong to update_schema.py
+    if db_path.exists():
+        with sqlite3.connect(db_path) as connection:
+            assert connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall() == []
@@ -0,0 +1,180 @@
+import pytest
+import asyncio
+import random
+import os
+import sys
+
+# Add backend to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import audio_cache
+from synthesis import iter_in_order, write_conversion_audio, iter_conversion_audio, ConversionPlan
+
+
+def collect(chunks, synthesize_one, **kwargs):
+    async def run():
+        return [piece async for piece in iter_in_order(chunks, synthesize_one, **kwargs)]
+    return asyncio.run(run())
+
+
+class TestIterInOrder:
+
+    def test_pieces_are_joined_in_original_order(self):
+        """Chunks finishing out of order must still be yielded in document order."""
+        chunks = [f"chunk-{i}" for i in range(12)]
+
+        async def synthesize_one(i, chunk):
+            await asyncio.sleep(random.uniform(0, 0.02))
+            return chunk.encode("utf-8") + b"|"
+
+        assert collect(chunks, synthesize_one, max_concurrency=6) == [c.encode("utf-8") + b"|" for c in chunks]
+
+    def test_per_request_concurrency_cap(self):
+        """No more than max_concurrency chunks may be in flight at once."""
+        state = {"active": 0, "peak": 0}
+
+        async def synthesize_one(i, chunk):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return b"x"
+
+        collect(["a"] * 10, synthesize_one, max_concurrency=3)
+        assert state["peak"] == 3
+
+    def test_failure_propagates(self):
+        """A failing chunk aborts the whole conversion."""
+        async def synthesize_one(i, chunk):
+            if i == 2:
+                raise Exception("Failed to convert chunk via API")
+            await asyncio.sleep(0.01)
+            return b"ok"
+
+        with pytest.raises(Exception, match="Failed to convert chunk"):
+            collect(["a", "b", "c", "d"], synthesize_one, max_concurrency=2)
+
+    def test_empty_input(self):
+        async def synthesize_one(i, chunk):
+            return b"never"
+
+        assert collect([], synthesize_one) == []
+
+
+def make_plan(payloads, synthesize_payload):
+    return ConversionPlan(
+        engine_type="standard", voice_name="Joanna", output_format="mp3",
+        payloads=payloads, cache_key="0" * 64,
+        chunk_keys=[audio_cache.make_cache_key("standard", "mp3", [p]) for p in payloads],
+        synthesize_payload=synthesize_payload,
+    )
+
+
+class TestStreamedAssembly:
+
+    @pytest.fixture(autouse=True)
+    def cache_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(audio_cache, "CACHE_DIR", tmp_path / "cache")
+
+    def test_chunks_stream_into_output_file_in_order(self, tmp_path):
+        async def synthesize_payload(payload, out):
+            await asyncio.sleep(random.uniform(0, 0.02))
+            # Providers hand the audio over in several blocks
+            for _ in range(3):
+                out.write(payload.encode("utf-8"))
+
+        payloads = [f"<{i}>" for i in range(10)]
+        output = tmp_path / "out" / "result.mp3"
+        output.parent.mkdir()
+        size = asyncio.run(write_conversion_audio(make_plan(payloads, synthesize_payload), output))
+
+        expected = b"".join(p.encode("utf-8") * 3 for p in payloads)
+        assert output.read_bytes() == expected
+        assert size == len(expected)
+        # Nothing but the final MP3 is left next to it
+        assert os.listdir(output.parent) == ["result.mp3"]
+
+    def test_failed_chunk_removes_partial_output_and_spool(self, tmp_path):
+        async def synthesize_payload(payload, out):
+            out.write(b"partial")
+            if payload == "bad":
+                raise Exception("provider dropped the connection")
+
+        output = tmp_path / "result.mp3"
+        with pytest.raises(Exception, match="dropped"):
+            asyncio.run(write_conversion_audio(make_plan(["ok", "bad"], synthesize_payload), output))
+
+        assert not output.exists()
+        # The failed chunk never becomes a cache entry
+        assert audio_cache.has_chunk(make_plan(["ok"], None).chunk_keys[0])
+        assert not audio_cache.has_chunk(make_plan(["bad"], None).chunk_keys[0])
+        assert not list((tmp_path / "cache").rglob("*.tmp"))
+
+    def test_chunks_in_turn_are_not_read_back_from_the_cache(self, tmp_path, monkeypatch):
+        """The next chunk streams into the output; only chunks done early are copied."""
+        read_back = []
+        open_chunk = audio_cache.open_chunk
+
+        def counting_open_chunk(chunk_key):
+            chunk_file = open_chunk(chunk_key)
+            if chunk_file is not None:
+                read_back.append(chunk_key)
+            return chunk_file
+
+        monkeypatch.setattr(audio_cache, "open_chunk", counting_open_chunk)
+
+        async def synthesize_payload(payload, out):
+            if payload == "first":
+                await asyncio.sleep(0.05)
+                out.write(b"A")
+            else:
+                # Half spooled before its turn, the rest streamed after it
+                out.write(b"b1")
+                await asyncio.sleep(0.1)
+                out.write(b"b2")
+
+        plan = make_plan(["first", "second"], synthesize_payload)
+        output = tmp_path / "result.mp3"
+        asyncio.run(write_conversion_audio(plan, output))
+
+        assert output.read_bytes() == b"Ab1b2"
+        assert read_back == []
+        # Both chunks still land in the cache for the next edit of the document
+        with audio_cache.open_chunk(plan.chunk_keys[1]) as cached:
+            assert cached.read() == b"b1b2"
+
+    def test_iter_conversion_audio_yields_blocks_in_order(self):
+        async def synthesize_payload(payload, out):
+            out.write(payload.encode("utf-8"))
+
+        async def collect():
+            return [block async for block in iter_conversion_audio(make_plan(["a", "b", "c"], synthesize_payload))]
+
+        assert b"".join(asyncio.run(collect())) == b"abc"
+
+
+class TestAzurePlanning:
+
+    @pytest.fixture(autouse=True)
+    def azure_env(self, monkeypatch):
+        monkeypatch.setenv("AZURE_SPEECH_KEY", "key")
+        monkeypatch.setenv("AZURE_SPEECH_REGION", "eastus")
+
+    def test_malformed_markup_is_rejected_before_synthesis(self):
+        from fastapi import HTTPException
+        from synthesis import plan_conversion
+
+        with pytest.raises(HTTPException) as exc:
+            plan_conversion("Hello [break:later] world", "neural", None, 1.0, None)
+        assert exc.value.status_code == 400
+        assert "Invalid markup" in exc.value.detail
+
+    def test_chunks_stay_within_budget_after_escaping(self, monkeypatch):
+        import synthesis
+        monkeypatch.setattr(synthesis, "AZURE_CHUNK_MAX_BYTES", 1024)
+
+        text = "Fish & chips < pie & mash. " * 200
+        plan = synthesis.plan_conversion(text, "neural", None, 1.0, None)
+
+        assert len(plan.payloads) > 1
+        assert all(len(payload.encode("utf-8")) <= 1024 for payload in plan.payloads)
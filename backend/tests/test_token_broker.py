@@ -0,0 +1,142 @@
+import pytest
+import asyncio
+import os
+import sys
+
+# Add backend to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import shared_state
+from token_broker import AzureTokenBroker
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeIssuer:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, speech_key, region):
+        self.calls += 1
+        return f"token-{self.calls}"
+
+
+@pytest.fixture
+def broker_parts(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "STATE_DIR", tmp_path)
+    return FakeClock(), FakeIssuer()
+
+
+class TestAzureTokenBroker:
+
+    def test_token_is_cached_for_validity_window(self, broker_parts):
+        clock, issuer = broker_parts
+        broker = AzureTokenBroker(issuer=issuer, clock=clock)
+
+        async def scenario():
+            first = await broker.get_token("key", "eastus")
+            clock.now += 60
+            second = await broker.get_token("key", "eastus")
+            broker.shutdown()
+            return first, second
+
+        assert asyncio.run(scenario()) == ("token-1", "token-1")
+        assert issuer.calls == 1
+
+    def test_refresh_ahead_does_not_block_caller(self, broker_parts):
+        """Past the refresh point the old token is returned while a new one is fetched."""
+        clock, issuer = broker_parts
+        broker = AzureTokenBroker(issuer=issuer, clock=clock)
+
+        async def scenario():
+            await broker.get_token("key", "eastus")
+            clock.now += broker.refresh_after + 1
+            stale_but_valid = await broker.get_token("key", "eastus")
+            await asyncio.sleep(0.01)  # let the background refresh run
+            refreshed = await broker.get_token("key", "eastus")
+            broker.shutdown()
+            return stale_but_valid, refreshed
+
+        assert asyncio.run(scenario()) == ("token-1", "token-2")
+        assert issuer.calls == 2
+
+    def test_expired_token_is_reissued(self, broker_parts):
+        clock, issuer = broker_parts
+        broker = AzureTokenBroker(issuer=issuer, clock=clock)
+
+        async def scenario():
+            await broker.get_token("key", "eastus")
+            clock.now += broker.ttl + 1
+            token = await broker.get_token("key", "eastus")
+            broker.shutdown()
+            return token
+
+        assert asyncio.run(scenario()) == "token-2"
+
+    def test_token_is_shared_across_workers_through_slot(self, broker_parts):
+        """A second process (separate broker) reuses the slot instead of calling issueToken."""
+        clock, issuer = broker_parts
+        worker_a = AzureTokenBroker(issuer=issuer, clock=clock)
+        worker_b = AzureTokenBroker(issuer=issuer, clock=clock)
+
+        async def scenario():
+            a = await worker_a.get_token("key", "eastus")
+            b = await worker_b.get_token("key", "eastus")
+            worker_a.shutdown()
+            worker_b.shutdown()
+            return a, b
+
+        assert asyncio.run(scenario()) == ("token-1", "token-1")
+        assert issuer.calls == 1
+
+    def test_refresh_uses_newer_token_from_slot(self, broker_parts):
+        """A worker due for refresh picks up the token another worker just wrote instead of issuing."""
+        clock, issuer = broker_parts
+        worker_a = AzureTokenBroker(issuer=issuer, clock=clock)
+        worker_b = AzureTokenBroker(issuer=issuer, clock=clock)
+
+        async def scenario():
+            await worker_a.get_token("key", "eastus")
+            await worker_b.get_token("key", "eastus")
+            clock.now += worker_a.refresh_after + 1
+            await worker_a.get_token("key", "eastus")
+            await asyncio.sleep(0.01)  # A's background refresh writes token-2 to the slot
+            b = await worker_b.get_token("key", "eastus")
+            await asyncio.sleep(0.01)
+            again = await worker_b.get_token("key", "eastus")
+            worker_a.shutdown()
+            worker_b.shutdown()
+            return b, again
+
+        assert asyncio.run(scenario()) == ("token-2", "token-2")
+        assert issuer.calls == 2
+
+    def test_slot_is_scoped_to_credentials(self, broker_parts):
+        clock, issuer = broker_parts
+        broker = AzureTokenBroker(issuer=issuer, clock=clock)
+
+        async def scenario():
+            a = await broker.get_token("key-1", "eastus")
+            b = await broker.get_token("key-2", "eastus")
+            broker.shutdown()
+            return a, b
+
+        assert asyncio.run(scenario()) == ("token-1", "token-2")
+
+    def test_concurrent_cold_callers_share_one_issue(self, broker_parts):
+        clock, issuer = broker_parts
+        broker = AzureTokenBroker(issuer=issuer, clock=clock)
+
+        async def scenario():
+            tokens = await asyncio.gather(*[broker.get_token("key", "eastus") for _ in range(10)])
+            broker.shutdown()
+            return tokens
+
+        assert set(asyncio.run(scenario())) == {"token-1"}
+        assert issuer.calls == 1
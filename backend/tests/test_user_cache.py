@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import shared_state
+from models import User
+from seed_plans import seed_plans
+from user_cache import UserSnapshot, UserSnapshotCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def seeded(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "STATE_DIR", tmp_path)
+    seed_plans(db=db_session)
+    return db_session
+
+
+@pytest.fixture
+def user_queries(seeded):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    # Every engine: the hot routes read through the async one
+    event.listen(Engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(Engine, "before_cursor_execute", record)
+
+
+def login(client, email):
+    client.post("/api/signup", json={"email": email, "password": "password123"})
+    token = client.post("/api/login", json={"email": email, "password": "password123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_authenticated_requests_skip_the_users_table(client, seeded, user_queries):
+    """Test that a fresh token authenticates from its claims, then from the cache."""
+    headers = login(client, "fast@test.com")
+    user_queries.clear()
+
+    for _ in range(5):
+        assert client.get("/api/history", params={"cursor": ""}, headers=headers).status_code == 200
+        assert client.get("/api/convert/jobs/missing", headers=headers).status_code == 404
+    assert user_queries == []
+
+
+def test_user_changes_retire_older_claims(client, seeded):
+    """Test that admin and plan changes take effect at once despite the token's claims."""
+    admin_headers = login(client, "boss@test.com")
+    headers = login(client, "worker@test.com")
+    seeded.query(User).filter(User.email == "boss@test.com").update({"is_admin": True})
+    seeded.commit()
+
+    # Promoted after the token was issued: the row, not the claim, decides
+    assert client.get("/api/admin/plans", headers=admin_headers).status_code == 200
+    worker = seeded.query(User).filter(User.email == "worker@test.com").one()
+    assert client.put("/api/admin/update-user-plan", json={"user_id": worker.id, "plan_type": "Pro"}, headers=admin_headers).status_code == 200
+    assert client.get("/api/me", headers=headers).json()["plan_type"] == "Pro"
+
+    boss = seeded.query(User).filter(User.email == "boss@test.com").one()
+    boss.is_admin = False
+    seeded.commit()
+    assert client.get("/api/admin/plans", headers=admin_headers).status_code == 403
+
+
+def test_a_user_change_keeps_other_users_cached(client, seeded, user_queries):
+    """Test that changing one user's plan leaves every other user's snapshot and claims alone."""
+    admin_headers = login(client, "chief@test.com")
+    seeded.query(User).filter(User.email == "chief@test.com").update({"is_admin": True})
+    seeded.commit()
+    headers = login(client, "bystander@test.com")
+    changed_headers = login(client, "upgraded@test.com")
+    assert client.get("/api/history", params={"cursor": ""}, headers=headers).status_code == 200
+
+    upgraded = seeded.query(User).filter(User.email == "upgraded@test.com").one()
+    assert client.put("/api/admin/update-user-plan", json={"user_id": upgraded.id, "plan_type": "Pro"}, headers=admin_headers).status_code == 200
+    user_queries.clear()
+
+    assert client.get("/api/history", params={"cursor": ""}, headers=headers).status_code == 200
+    assert user_queries == []
+    assert client.get("/api/me", headers=changed_headers).json()["plan_type"] == "Pro"
+
+
+def test_cache_expires_evicts_and_follows_other_workers(seeded):
+    """Test TTL, LRU eviction and invalidation through the shared stamp."""
+    clock = FakeClock()
+    cache = UserSnapshotCache(clock=clock, ttl=60, maxsize=2, check_interval=1)
+    other_worker = UserSnapshotCache(clock=clock, ttl=60, maxsize=2, check_interval=1)
+
+    for user_id in ("A0001", "A0002", "A0003"):
+        cache.put(UserSnapshot(user_id, False, "Basic"))
+    assert cache.get("A0001") is None
+    assert cache.get("A0003").current_plan == "Basic"
+
+    clock.now += 61
+    assert cache.get("A0003") is None
+
+    other_worker.put(UserSnapshot("A0002", True, "Pro"))
+    other_worker.put(UserSnapshot("A0003", False, "Basic"))
+    assert other_worker.trusts("A0002", clock.now - 5)
+    cache.invalidate(["A0002"])
+    clock.now += 1
+    # Only the changed user is forgotten and loses the claims of older tokens
+    assert other_worker.get("A0002") is None
+    assert other_worker.get("A0003").current_plan == "Basic"
+    assert not other_worker.trusts("A0002", clock.now - 5)
+    assert other_worker.trusts("A0003", clock.now - 5)
+    assert other_worker.trusts("A0002", clock.now)
+
+    cache.invalidate()
+    clock.now += 1
+    assert other_worker.get("A0003") is None
+    assert not other_worker.trusts("A0003", clock.now - 5)
@@ -0,0 +1,179 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+
+import shared_state
+import tts_providers
+
+logger = logging.getLogger(__name__)
+
+# Azure STS tokens are valid for 10 minutes
+TOKEN_TTL = float(os.getenv("AZURE_TOKEN_TTL", "600"))
+# Refresh in the background once a token is this old, well before it expires
+TOKEN_REFRESH_AFTER = float(os.getenv("AZURE_TOKEN_REFRESH_AFTER", "480"))
+# Never hand out a token closer than this to its expiry
+TOKEN_SAFETY_MARGIN = 30.0
+# Keep refreshing ahead only while the token has been used within this window
+KEEPER_IDLE_TIMEOUT = float(os.getenv("AZURE_TOKEN_KEEPER_IDLE", "1800"))
+
+SLOT_NAME = "azure_token.json"
+LEASE_NAME = "azure_token.lock"
+
+
+def _fingerprint(speech_key: str, region: str) -> str:
+    """Identifies the credentials a token belongs to without storing the key itself."""
+    return hashlib.sha256(f"{region}:{speech_key}".encode("utf-8")).hexdigest()[:16]
+
+
+class AzureTokenBroker:
+    """
+    Caches the Azure bearer token for its validity window and refreshes it ahead of expiry.
+    The token is shared between threads through this object and between worker processes
+    through a file slot in shared_state, so steady-state callers never wait on issueToken.
+    """
+
+    def __init__(self, issuer=None, clock=time.time, ttl=TOKEN_TTL, refresh_after=TOKEN_REFRESH_AFTER):
+        self._issuer = issuer
+        self._clock = clock
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._lock = threading.Lock()
+        self._token = None
+        self._issued_at = 0.0
+        self._fingerprint = None
+        self._last_used = 0.0
+        # Per event loop: single-flight lock and the background keeper task
+        self._flights = weakref.WeakKeyDictionary()
+        self._keepers = weakref.WeakKeyDictionary()
+        self._pending = set()
+
+    async def get_token(self, speech_key: str, region: str) -> str:
+        fingerprint = _fingerprint(speech_key, region)
+        now = self._clock()
+        self._last_used = now
+
+        token, issued_at = self._cached(fingerprint)
+        if token and now - issued_at < self.ttl - TOKEN_SAFETY_MARGIN:
+            if now - issued_at >= self.refresh_after:
+                self._refresh_in_background(speech_key, region)
+            self._ensure_keeper(speech_key, region)
+            return token
+
+        # Cold start or expired: this caller has to wait for a fresh token
+        token = await self._refresh(speech_key, region, fingerprint, force=True)
+        self._ensure_keeper(speech_key, region)
+        return token
+
+    def invalidate(self):
+        """Drops the cached token, e.g. after Azure rejected it with 401."""
+        with self._lock:
+            self._token = None
+            self._issued_at = 0.0
+        shared_state.remove(SLOT_NAME)
+
+    def reset(self):
+        self.invalidate()
+        shared_state.release_lease(LEASE_NAME)
+
+    def shutdown(self):
+        """Stops the keeper task owned by the running event loop."""
+        loop = asyncio.get_running_loop()
+        keeper = self._keepers.pop(loop, None)
+        if keeper is not None:
+            keeper.cancel()
+
+    def _cached(self, fingerprint):
+        with self._lock:
+            if self._token and self._fingerprint == fingerprint:
+                token, issued_at = self._token, self._issued_at
+            else:
+                token, issued_at = None, 0.0
+        if token and self._clock() - issued_at < self.refresh_after:
+            return token, issued_at
+
+        # Cold, or due for refresh: another worker may already hold a newer token for the
+        # same credentials
+        slot = shared_state.read_json(SLOT_NAME)
+        if slot and slot.get("fingerprint") == fingerprint and slot.get("token"):
+            slot_issued_at = float(slot.get("issued_at", 0))
+            if not token or slot_issued_at > issued_at:
+                self._store(slot["token"], slot_issued_at, fingerprint)
+                return slot["token"], slot_issued_at
+        return token, issued_at
+
+    def _store(self, token, issued_at, fingerprint):
+        with self._lock:
+            if issued_at >= self._issued_at or self._fingerprint != fingerprint:
+                self._token = token
+                self._issued_at = issued_at
+                self._fingerprint = fingerprint
+
+    async def _refresh(self, speech_key, region, fingerprint, force=False):
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get(loop)
+        if flight is None:
+            flight = self._flights[loop] = asyncio.Lock()
+
+        async with flight:
+            # Somebody refreshed while we were waiting for the lock
+            token, issued_at = self._cached(fingerprint)
+            age = self._clock() - issued_at
+            if token and age < self.refresh_after:
+                return token
+
+            have_lease = shared_state.try_lease(LEASE_NAME, ttl=30.0)
+            if not have_lease and not force and token:
+                # Another worker is refreshing the shared slot; keep using the current token
+                return token
+            try:
+                issuer = self._issuer or tts_providers.issue_azure_token
+                token = await issuer(speech_key, region)
+                issued_at = self._clock()
+                self._store(token, issued_at, fingerprint)
+                shared_state.write_json(SLOT_NAME, {
+                    "fingerprint": fingerprint,
+                    "token": token,
+                    "issued_at": issued_at,
+                })
+                logger.info("Issued new Azure access token.")
+                return token
+            finally:
+                if have_lease:
+                    shared_state.release_lease(LEASE_NAME)
+
+    def _refresh_in_background(self, speech_key, region):
+        task = asyncio.ensure_future(self._refresh(speech_key, region, _fingerprint(speech_key, region)))
+        self._pending.add(task)
+        task.add_done_callback(self._finish_background)
+
+    def _finish_background(self, task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background Azure token refresh failed: {task.exception()}")
+
+    def _ensure_keeper(self, speech_key, region):
+        loop = asyncio.get_running_loop()
+        keeper = self._keepers.get(loop)
+        if keeper is None or keeper.done():
+            self._keepers[loop] = asyncio.ensure_future(self._keep_fresh(speech_key, region))
+
+    async def _keep_fresh(self, speech_key, region):
+        """Refreshes ahead of expiry even between requests, until the worker goes idle."""
+        fingerprint = _fingerprint(speech_key, region)
+        while True:
+            _, issued_at = self._cached(fingerprint)
+            await asyncio.sleep(max(1.0, issued_at + self.refresh_after - self._clock()))
+            if self._clock() - self._last_used > KEEPER_IDLE_TIMEOUT:
+                return
+            try:
+                await self._refresh(speech_key, region, fingerprint)
+            except Exception as e:
+                logger.error(f"Scheduled Azure token refresh failed: {e}")
+                await asyncio.sleep(10)
+
+
+azure_tokens = AzureTokenBroker()
@@ -0,0 +1,167 @@
+import os
+import asyncio
+import logging
+import threading
+import importlib.util
+import weakref
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+AZURE_OUTPUT_FORMAT = "audio-16khz-128kbitrate-mono-mp3"
+POLLY_OUTPUT_FORMAT = "mp3"
+
+# Transport tuning (shared by every conversion served by this process)
+HTTP_TIMEOUT = float(os.getenv("TTS_HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("TTS_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("TTS_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("TTS_HTTP_KEEPALIVE_EXPIRY", "90"))
+# Audio is copied from the provider to disk in blocks of this size
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# HTTP/2 is only negotiated when the optional 'h2' package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# One pooled client per event loop (in production: one per worker process)
+_http_clients = weakref.WeakKeyDictionary()
+
+# Shared Polly client; boto3 clients are thread-safe and keep their own connection pool
+polly_client = None
+_polly_lock = threading.Lock()
+_polly_executor = ThreadPoolExecutor(max_workers=HTTP_MAX_CONNECTIONS, thread_name_prefix="polly")
+
+
+class ProviderError(Exception):
+    """Raised when a TTS provider rejects a request or cannot be reached."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        headers={"User-Agent": "PollyGlot"},
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the keep-alive client bound to the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_http_client()
+        _http_clients[loop] = client
+        logger.info(f"Created pooled provider HTTP client (http2={HTTP2_AVAILABLE}).")
+    return client
+
+
+def get_polly_client():
+    """Returns the process-wide Polly client, creating it on first use."""
+    global polly_client
+    if polly_client is None:
+        with _polly_lock:
+            if polly_client is None:
+                import boto3
+                from botocore.config import Config
+
+                polly_client = boto3.client(
+                    "polly",
+                    region_name=os.getenv("AWS_REGION", "us-east-1"),
+                    config=Config(
+                        max_pool_connections=HTTP_MAX_CONNECTIONS,
+                        connect_timeout=HTTP_CONNECT_TIMEOUT,
+                        read_timeout=HTTP_TIMEOUT,
+                        tcp_keepalive=True,
+                        retries={"max_attempts": 3, "mode": "standard"},
+                    ),
+                )
+    return polly_client
+
+
+async def aclose():
+    """Closes the HTTP client owned by the running event loop (called on app shutdown)."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+async def issue_azure_token(speech_key: str, region: str) -> str:
+    token_url = f"https://{region}.api.cognitive.microsoft.com/sts/v1.0/issueToken"
+    try:
+        response = await get_http_client().post(token_url, headers={"Ocp-Apim-Subscription-Key": speech_key})
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise ProviderError(f"Azure token request failed: {e}") from e
+    return response.text
+
+
+async def azure_synthesize_to(ssml: str, access_token: str, region: str, out) -> int:
+    """
+    Streams the synthesized audio into the binary file `out` as it arrives, so no
+    response is ever held in memory whole. Returns the number of bytes written.
+    """
+    tts_url = f"https://{region}.tts.speech.microsoft.com/cognitiveservices/v1"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/ssml+xml",
+        "X-Microsoft-OutputFormat": AZURE_OUTPUT_FORMAT,
+    }
+    written = 0
+    try:
+        async with get_http_client().stream("POST", tts_url, headers=headers, content=ssml.encode("utf-8")) as response:
+            if response.status_code != 200:
+                await response.aread()
+                logger.error(f"TTS REST Error {response.status_code}: {response.text}")
+                raise ProviderError(f"Azure TTS returned {response.status_code}", status_code=response.status_code)
+            async for block in response.aiter_bytes(STREAM_BLOCK_SIZE):
+                await run_in_threadpool(out.write, block)
+                written += len(block)
+    except httpx.HTTPError as e:
+        raise ProviderError(f"Azure TTS request failed: {e}") from e
+    return written
+
+
+def _polly_synthesize_to_sync(text: str, voice_id: str, out) -> int:
+    response = get_polly_client().synthesize_speech(
+        Text=text,
+        OutputFormat=POLLY_OUTPUT_FORMAT,
+        VoiceId=voice_id,
+        Engine="standard",
+    )
+    if "AudioStream" not in response:
+        raise ProviderError("Polly response did not contain an AudioStream")
+    written = 0
+    with closing(response["AudioStream"]) as stream:
+        for block in stream.iter_chunks(STREAM_BLOCK_SIZE):
+            out.write(block)
+            written += len(block)
+    return written
+
+
+async def polly_synthesize_to(text: str, voice_id: str, out) -> int:
+    """
+    boto3 is blocking, so Polly calls run on a dedicated executor sized to the
+    client's connection pool instead of Starlette's shared threadpool. The AudioStream
+    is copied into `out` block by block.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_polly_executor, _polly_synthesize_to_sync, text, voice_id, out)
+    except ProviderError:
+        raise
+    except Exception as e:
+        logger.error(f"AWS Polly Error: {e}")
+        raise ProviderError(f"AWS Polly request failed: {e}") from e
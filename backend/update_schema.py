@@ -1,7 +1,6 @@
-
 import logging
-from sqlalchemy import text
-from database import engine
+from auto_migrate import run_auto_migrations
+from seed_plans import seed_plans
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -9,35 +8,13 @@ logger = logging.getLogger(__name__)
 
 def update_schema():
     """
-    Updates the database schema to include new columns.
+    Updates the database schema and seeds the default plans. Run once per deploy (the app
+    no longer does this on import unless AUTO_MIGRATE is set); columns, indexes and data
+    fixes live in auto_migrate as versioned, recorded migrations.
     """
     logger.info("Starting schema update...")
-    
-    try:
-        with engine.connect() as connection:
-            # 1. Add style_degree column to conversions table
-            logger.info("Checking for 'style_degree' column in 'conversions' table...")
-            try:
-                # Check if column exists
-                check_query = text("SHOW COLUMNS FROM conversions LIKE 'style_degree'")
-                result = connection.execute(check_query).fetchone()
-                
-                if not result:
-                    logger.info("Column 'style_degree' not found. Adding it now...")
-                    alter_query = text("ALTER TABLE conversions ADD COLUMN style_degree FLOAT DEFAULT 1.0")
-                    connection.execute(alter_query)
-                    logger.info("Column 'style_degree' added successfully.")
-                else:
-                    logger.info("Column 'style_degree' already exists.")
-                    
-            except Exception as e:
-                logger.error(f"Error checking/adding column: {e}")
-                
-            connection.commit()
-            logger.info("Schema update completed successfully.")
-            
-    except Exception as e:
-        logger.critical(f"Schema update failed: {e}")
+    run_auto_migrations()
+    seed_plans()
 
 if __name__ == "__main__":
     update_schema()
@@ -0,0 +1,213 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+import shared_state
+from models import User
+
+logger = logging.getLogger(__name__)
+
+# How long a worker keeps a user's snapshot before reading the row again
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# How often a worker checks the shared invalidation stamps written by other workers
+USER_VERSION_CHECK_INTERVAL = float(os.getenv("USER_VERSION_CHECK_INTERVAL", "1"))
+# Per-user stamps are kept this long: at least the access token lifetime (auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+USER_STAMP_RETENTION = float(os.getenv("USER_STAMP_RETENTION", "3600"))
+
+INVALIDATION_SLOT = "user_snapshots_invalidated.json"
+INVALIDATION_LEASE = "user_snapshots_invalidated.lock"
+
+# Columns whose change must reach every worker (and retire the claims of the user's older tokens)
+WATCHED_COLUMNS = ("is_admin", "current_plan", "hashed_password")
+# Execution option for bulk UPDATEs of users that leave WATCHED_COLUMNS alone
+UNCHANGED_OPTION = "user_snapshots_unchanged"
+
+_PENDING = "user_snapshots_pending"
+_PENDING_ALL = "user_snapshots_pending_all"
+_CREATED = "user_snapshots_created"
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """What authenticated endpoints need to know about the caller; detached from any session."""
+    id: str
+    is_admin: bool
+    current_plan: Optional[str]
+
+    @classmethod
+    def from_user(cls, user: User, plan: Optional[str] = None) -> "UserSnapshot":
+        return cls(user.id, bool(user.is_admin), plan or user.current_plan)
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> Optional["UserSnapshot"]:
+        """Snapshot carried by the token itself; None for tokens issued without the claims."""
+        if not payload.get("sub") or "adm" not in payload or "plan" not in payload:
+            return None
+        return cls(payload["sub"], bool(payload["adm"]), payload["plan"])
+
+    def claims(self) -> dict:
+        return {"sub": str(self.id), "adm": self.is_admin, "plan": self.current_plan}
+
+
+class UserSnapshotCache:
+    """
+    TTL + LRU cache of UserSnapshots, so most authenticated requests never touch the
+    users table. invalidate(user_ids) drops those users' snapshots in this process and
+    stamps them in shared_state: other workers drop theirs within check_interval, and
+    those users' tokens issued before the stamp stop being trusted for their claims.
+    Everyone else keeps their snapshots and claims.
+    """
+
+    def __init__(self, clock=time.time, ttl=USER_CACHE_TTL, maxsize=USER_CACHE_SIZE,
+                 check_interval=USER_VERSION_CHECK_INTERVAL, retention=USER_STAMP_RETENTION):
+        self._clock = clock
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # When everyone / a given user was last invalidated
+        self._all_at = 0.0
+        self._user_at = {}
+        self._checked_at = None
+
+    def _merge(self, stamps, now):
+        """Applies stamps newer than the ones already seen. Caller holds the lock."""
+        all_at = float(stamps.get("all") or 0.0)
+        if all_at > self._all_at:
+            self._all_at = all_at
+            self._entries.clear()
+        for user_id, at in (stamps.get("users") or {}).items():
+            if at > self._user_at.get(user_id, 0.0):
+                self._user_at[user_id] = at
+                self._entries.pop(user_id, None)
+        # Older stamps only concern tokens that have expired by now
+        horizon = now - self.retention
+        self._user_at = {user_id: at for user_id, at in self._user_at.items() if at > horizon}
+
+    def _sync(self, now):
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        # Outside the lock: a file read
+        stamps = shared_state.read_json(INVALIDATION_SLOT) or {}
+        with self._lock:
+            self._merge(stamps, now)
+
+    def get(self, user_id: str) -> Optional[UserSnapshot]:
+        now = self._clock()
+        self._sync(now)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            snapshot, stored_at = entry
+            if now - stored_at >= self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def put(self, snapshot: UserSnapshot):
+        with self._lock:
+            self._entries[snapshot.id] = (snapshot, self._clock())
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def trusts(self, user_id: str, issued_at) -> bool:
+        """Whether claims of user_id's token issued at `issued_at` (epoch seconds) are still current."""
+        self._sync(self._clock())
+        with self._lock:
+            invalidated_at = max(self._all_at, self._user_at.get(user_id, 0.0))
+        return issued_at is not None and issued_at > invalidated_at
+
+    def invalidate(self, user_ids=None):
+        """Forgets the given users (everyone when None) here and, within check_interval, in every worker."""
+        now = self._clock()
+        stamps = {"all": now} if user_ids is None else {"users": {user_id: now for user_id in user_ids}}
+        with self._lock:
+            self._merge(stamps, now)
+        self._publish(stamps, now)
+        logger.info(f"User snapshot cache invalidated ({'all users' if user_ids is None else len(user_ids)}).")
+
+    def _publish(self, stamps, now):
+        # Read-modify-write of the shared slot: one writer at a time, or a concurrent
+        # change of another user could be lost
+        have_lease = False
+        for _ in range(20):
+            have_lease = shared_state.try_lease(INVALIDATION_LEASE, ttl=5.0)
+            if have_lease:
+                break
+            time.sleep(0.01)
+        try:
+            current = shared_state.read_json(INVALIDATION_SLOT) or {}
+            horizon = now - self.retention
+            users = {user_id: at for user_id, at in (current.get("users") or {}).items() if at > horizon}
+            for user_id, at in (stamps.get("users") or {}).items():
+                users[user_id] = max(at, users.get(user_id, 0.0))
+            all_at = max(float(current.get("all") or 0.0), float(stamps.get("all") or 0.0))
+            shared_state.write_json(INVALIDATION_SLOT, {"all": all_at, "users": users})
+        finally:
+            if have_lease:
+                shared_state.release_lease(INVALIDATION_LEASE)
+
+    def clear(self):
+        """Drops this process's snapshots only."""
+        with self._lock:
+            self._entries.clear()
+
+
+user_snapshots = UserSnapshotCache()
+
+
+# --- Invalidation on commit ---
+# Plan changes, password resets and admin flag updates all go through the ORM; once they
+# commit, every worker forgets the snapshots of the users they touched.
+
+@event.listens_for(Session, "after_flush")
+def _note_changed_users(session, flush_context):
+    # Users inserted by this transaction (e.g. signup) cannot be cached anywhere yet
+    created = session.info.setdefault(_CREATED, set())
+    created.update(obj.id for obj in session.new if isinstance(obj, User))
+    for obj in session.dirty:
+        if isinstance(obj, User) and obj.id not in created:
+            attrs = inspect(obj).attrs
+            if any(attrs[name].history.has_changes() for name in WATCHED_COLUMNS):
+                session.info.setdefault(_PENDING, set()).add(obj.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_bulk_user_updates(orm_execute_state):
+    if not orm_execute_state.is_update or orm_execute_state.execution_options.get(UNCHANGED_OPTION):
+        return
+    if any(mapper.class_ is User for mapper in orm_execute_state.all_mappers):
+        # Which rows a bulk UPDATE hit is unknown here: forget everyone
+        orm_execute_state.session.info[_PENDING_ALL] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    session.info.pop(_CREATED, None)
+    user_ids = session.info.pop(_PENDING, None)
+    if session.info.pop(_PENDING_ALL, False):
+        user_snapshots.invalidate()
+    elif user_ids:
+        user_snapshots.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(_CREATED, None)
+    session.info.pop(_PENDING, None)
+    session.info.pop(_PENDING_ALL, None)
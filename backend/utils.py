@@ -1,15 +1,44 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import date
-from models import Transaction, PlanLimits, Conversion, DownloadHistory
+from sqlalchemy import func, update
+from datetime import date, datetime
+from models import Transaction, Conversion, DownloadHistory
+from plan_cache import plan_limits as plan_limits_cache
+from user_cache import UNCHANGED_OPTION
 import os
+import json
+import base64
 import smtplib
+from fastapi import HTTPException
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import logging
 
 logger = logging.getLogger(__name__)
 
+def get_user_plan(db: Session, user, default: str = "Basic") -> str:
+    """
+    The user's current plan as stored on the row. Users not backfilled yet fall back
+    to their latest Transaction.
+    """
+    if user.current_plan:
+        return user.current_plan
+    latest_transaction = db.query(Transaction).filter(Transaction.user_id == user.id).order_by(Transaction.timestamp.desc()).first()
+    return latest_transaction.plan_type if latest_transaction else default
+
+
+def set_user_plan(db: Session, user, plan_type: str, amount: float = 0) -> Transaction:
+    """
+    Records a plan change: the Transaction and the denormalized User.current_plan are
+    written in the caller's transaction, so they commit (or roll back) together.
+    """
+    now = datetime.utcnow()
+    transaction = Transaction(user_id=user.id, plan_type=plan_type, amount=amount, timestamp=now)
+    db.add(transaction)
+    user.current_plan = plan_type
+    user.plan_changed_at = now
+    return transaction
+
+
 def check_user_limits(user_id: str, db: Session, text_length: int = 0) -> dict:
     """
     Checks if a user has sufficient credits.
@@ -17,25 +46,19 @@ def check_user_limits(user_id: str, db: Session, text_length: int = 0) -> dict:
     """
     from models import User # Avoid circular import if any
     
-    # 1. Determine User's Plan (Latest Transaction)
-    latest_transaction = db.query(Transaction).filter(Transaction.user_id == user_id).order_by(Transaction.timestamp.desc()).first()
-    current_plan_name = latest_transaction.plan_type if latest_transaction else "Basic"
-    
+    # 1. Fetch User (usually already in the session's identity map)
+    user = db.get(User, user_id)
+    if not user:
+        return {'allowed': False, 'reason': 'User not found.'}
+
+    # 2. Determine User's Plan
     # Ensure capitalization matches exactly what is in PlanLimits
-    current_plan_name = current_plan_name.capitalize()
+    current_plan_name = get_user_plan(db, user).capitalize()
     
-    # 2. Fetch Plan Limits
-    plan_limits = db.query(PlanLimits).filter(PlanLimits.plan_name == current_plan_name).first()
+    # 3. Fetch Plan Limits (cached; falls back to Basic)
+    plan_limits = plan_limits_cache.get(db, current_plan_name)
     if not plan_limits:
-        # Fallback
-        plan_limits = db.query(PlanLimits).filter(PlanLimits.plan_name == "Basic").first()
-        if not plan_limits:
-             return {'allowed': False, 'reason': 'System configuration error: Plan limits not found.'}
-
-    # 3. Fetch User Credits Used
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return {'allowed': False, 'reason': 'User not found.'}
+         return {'allowed': False, 'reason': 'System configuration error: Plan limits not found.'}
     
     # 4. Check Credits
     # If text_length > 0, we assume it's a conversion request which costs 1 credit per character.
@@ -50,31 +73,84 @@ def check_user_limits(user_id: str, db: Session, text_length: int = 0) -> dict:
     return {'allowed': True, 'reason': None, 'plan': plan_limits, 'current_usage': user.credits_used}
 
 
-def smart_split(text, limit=3000):
-    chunks = []
-    while len(text) > limit:
-        # Find the last sentence ending punctuation within the limit
-        split_indices = [text.rfind(p, 0, limit) for p in [".", "!", "?"]]
-        last_punc = max(split_indices)
-        
-        if last_punc != -1:
-            split_point = last_punc + 1  # Include the punctuation
-        else:
-            # Fallback to last space
-            last_space = text.rfind(" ", 0, limit)
-            if last_space != -1:
-                split_point = last_space
-            else:
-                # Force bad split
-                split_point = limit
-        
-        chunks.append(text[:split_point].strip())
-        text = text[split_point:].strip()
-    
-    if text:
-        chunks.append(text.strip())
-    
-    return chunks
+def reserve_credits(user_id: str, db: Session, amount: int, commit: bool = True) -> dict:
+    """
+    Charges `amount` credits up front, before synthesis, with one conditional UPDATE:
+    concurrent conversions of the same user can never overspend, and the row is only
+    locked for that statement. Returns the same dict as check_user_limits; pair every
+    allowed reservation with refund_credits() if the conversion then fails.
+    With commit=False the caller commits, e.g. together with a record of the reservation.
+    """
+    from models import User
+
+    # 1. Plan and limit (also rejects obviously over-limit requests without a write)
+    check = check_user_limits(user_id, db, amount)
+    if not check['allowed']:
+        return check
+    limit = check['plan'].credit_limit
+
+    # 2. Charge only if the total still fits at write time
+    used = func.coalesce(User.credits_used, 0)
+    result = db.execute(
+        update(User)
+        .where(User.id == user_id, used + amount <= limit)
+        .values(credits_used=used + amount)
+        .execution_options(synchronize_session=False, **{UNCHANGED_OPTION: True})
+    )
+    if commit:
+        db.commit()
+
+    if result.rowcount == 0:
+        # A concurrent conversion got there first
+        current = db.get(User, user_id)
+        return {
+            'allowed': False,
+            'reason': f"Credit limit reached for {check['plan'].plan_name} plan ({current.credits_used}/{limit}). Upgrade for more credits."
+        }
+    return {**check, 'reserved': amount}
+
+
+def refund_credits(user_id: str, db: Session, amount: int, commit: bool = True):
+    """
+    Gives back exactly the amount a failed conversion reserved. A balance below zero
+    (bonus credits) stays below zero. With commit=False the refund joins the caller's
+    transaction.
+    """
+    from models import User
+
+    if not amount:
+        return
+    if commit:
+        # Drop whatever the failed request left half-done so the refund commits cleanly
+        db.rollback()
+    used = func.coalesce(User.credits_used, 0)
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(credits_used=used - amount)
+        .execution_options(synchronize_session=False, **{UNCHANGED_OPTION: True})
+    )
+    if commit:
+        db.commit()
+    logger.info(f"Refunded {amount} credits to user {user_id}.")
+
+
+def encode_cursor(*values) -> str:
+    """Opaque pagination cursor holding the sort key of the last row sent."""
+    raw = json.dumps(values, default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int = 2) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
 
 def send_email(to_email: str, subject: str, body_html: str):
     """
@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { motion } from 'framer-motion';
 import { useSearchParams } from 'react-router-dom';
-import { Play, Download, Loader, Maximize2, Music, X, Search, Calendar, ChevronLeft, ChevronRight } from 'lucide-react';
+import { Play, Download, Loader, Maximize2, Music, X, Search, Calendar, ChevronLeft, ChevronRight, Trash2 } from 'lucide-react';
 import { authAPI, axiosInstance as axios } from '../api/auth';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || `http://${window.location.hostname}:8000`;
@@ -12,6 +12,7 @@ export default function ChatHistory({ onClose }) {
     const [isLoading, setIsLoading] = useState(false);
     const [page, setPage] = useState(1);
     const [hasMore, setHasMore] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
     const [audioUrl, setAudioUrl] = useState(null);
 
     // Initialize local state from URL params
@@ -58,8 +59,15 @@ export default function ChatHistory({ onClose }) {
             const currentSearch = searchParams.get('search') || '';
             const currentDate = searchParams.get('date') || '';
 
-            const params = { page: targetPage, limit };
-            if (currentSearch) params.search = currentSearch;
+            // Search results are ranked by relevance, so they keep page numbers;
+            // the plain newest-first list follows the server's cursor instead
+            const params = { limit };
+            if (currentSearch) {
+                params.search = currentSearch;
+                params.page = targetPage;
+            } else {
+                params.cursor = reset ? '' : (nextCursor || '');
+            }
             if (currentDate) params.date = currentDate;
 
             const response = await axios.get(`${API_BASE_URL}/api/history`, {
@@ -67,7 +75,7 @@ export default function ChatHistory({ onClose }) {
                 headers: { Authorization: `Bearer ${token}` }
             });
 
-            const historyData = Array.isArray(response.data) ? response.data : [];
+            const historyData = Array.isArray(response.data) ? response.data : (response.data?.items || []);
             const formattedHistory = historyData.map(item => ({
                 ...item,
                 voice: item.voice_name || item.voice
@@ -81,7 +89,13 @@ export default function ChatHistory({ onClose }) {
                 setPage(targetPage); // Update to new page
             }
 
-            setHasMore(historyData.length === limit);
+            if (currentSearch) {
+                setNextCursor(null);
+                setHasMore(historyData.length === limit);
+            } else {
+                setNextCursor(response.data?.next_cursor || null);
+                setHasMore(Boolean(response.data?.next_cursor));
+            }
 
         } catch (error) {
             console.error("Failed to fetch history:", error);
@@ -90,6 +104,20 @@ export default function ChatHistory({ onClose }) {
         }
     };
 
+    const deleteConversion = async (item) => {
+        if (!window.confirm("Delete this conversion and its audio?")) return;
+        try {
+            const token = authAPI.getToken();
+            await axios.delete(`${API_BASE_URL}/api/history/${item.id}`, {
+                headers: { Authorization: `Bearer ${token}` }
+            });
+            setHistory(prev => prev.filter(entry => entry.id !== item.id));
+        } catch (error) {
+            console.error("Failed to delete conversion:", error);
+            alert("Delete failed: " + (error.response?.data?.detail || error.message));
+        }
+    };
+
     // Sync state with URL params when they change (e.g. back button navigation)
     useEffect(() => {
         const s = searchParams.get('search') || '';
@@ -274,6 +302,13 @@ export default function ChatHistory({ onClose }) {
                                     <Download className="w-4 h-4" />
                                     Download
                                 </button>
+                                <button
+                                    onClick={() => deleteConversion(item)}
+                                    title="Delete"
+                                    className="flex items-center justify-center px-3 py-2 rounded-lg bg-white/5 hover:bg-red-500/20 text-gray-400 hover:text-red-400 transition-colors"
+                                >
+                                    <Trash2 className="w-4 h-4" />
+                                </button>
                             </div>
                         </motion.div>
                     ))}
@@ -7,26 +7,38 @@ const UserManagement = () => {
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const [updating, setUpdating] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     const PLANS = ['Basic', 'Pro', 'Plus'];
+    const PAGE_SIZE = 50;
 
     useEffect(() => {
         fetchUsers();
     }, []);
 
-    const fetchUsers = async () => {
+    // One keyset page per call: the first on mount, the next ones from "Load More Users"
+    const fetchUsers = async (cursor = null) => {
+        if (cursor) setLoadingMore(true);
         try {
             const token = localStorage.getItem('access_token');
             const BASE_URL = import.meta.env.VITE_API_URL || "https://tts.testingprojects.online";
             const response = await axios.get(`${BASE_URL}/api/admin/user-details`, {
-                headers: { Authorization: `Bearer ${token}` }
+                headers: { Authorization: `Bearer ${token}` },
+                params: { limit: PAGE_SIZE, ...(cursor ? { cursor } : {}) }
             });
-            setUsers(response.data);
-            setLoading(false);
+            setUsers(prev => cursor ? [...prev, ...response.data] : response.data);
+            setNextCursor(response.headers['x-next-cursor'] || null);
         } catch (err) {
             console.error("Failed to fetch users:", err);
-            setError("Failed to load user data.");
+            if (cursor) {
+                alert("Failed to load more users.");
+            } else {
+                setError("Failed to load user data.");
+            }
+        } finally {
             setLoading(false);
+            setLoadingMore(false);
         }
     };
 
@@ -43,7 +55,7 @@ const UserManagement = () => {
             );
 
             // Optimistic update
-            setUsers(users.map(user =>
+            setUsers(prev => prev.map(user =>
                 user.user_id === userId ? { ...user, current_plan: newPlan } : user
             ));
 
@@ -143,6 +155,19 @@ const UserManagement = () => {
                     No users found.
                 </div>
             )}
+
+            {nextCursor && (
+                <div className="mt-6 text-center">
+                    <button
+                        onClick={() => fetchUsers(nextCursor)}
+                        disabled={loadingMore}
+                        className="bg-gray-700 hover:bg-gray-600 text-white px-6 py-2 rounded-lg text-sm font-medium transition-colors disabled:opacity-50 inline-flex items-center"
+                    >
+                        {loadingMore && <Loader size={16} className="animate-spin mr-2" />}
+                        {loadingMore ? 'Loading...' : 'Load More Users'}
+                    </button>
+                </div>
+            )}
         </div>
     );
 };
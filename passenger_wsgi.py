@@ -1,3 +1,6 @@
+# Compatibility entry point for Passenger (WSGI): every request goes through a2wsgi, so
+# streaming responses are buffered and concurrency is limited to Passenger's processes.
+# Where a port can be reverse-proxied, run the native ASGI server instead: backend/serve.py
 import sys
 import os
 import site  # <--- Essential for loading your virtualenv
@@ -20,7 +23,10 @@ backend_dir = os.path.join(current_dir, 'backend')
 if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
 
-# 4. The Application Handler
+# 4. Start the cold-start clock (STARTUP_PROFILE=1 logs the phases after the app loads)
+from startup_profile import startup
+
+# 5. The Application Handler
 _asgi_app = None
 
 def application(environ, start_response):
@@ -31,6 +37,8 @@ def application(environ, start_response):
             from main import app
             from a2wsgi import ASGIMiddleware
             _asgi_app = ASGIMiddleware(app)
+            startup.mark("a2wsgi")
+            startup.report()
             
         # Pass the request to FastAPI
         return _asgi_app(environ, start_response)